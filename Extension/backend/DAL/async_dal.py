@@ -0,0 +1,256 @@
+# async_dal.py (awaitable access to the SQLite DAL)
+#
+# sqlite3 calls block, so running them inside a Quart handler stalls every
+# other request on the event loop. Writes go through a single writer thread
+# (SQLite allows one writer at a time anyway, and this keeps them ordered);
+# reads use a small pool, which WAL mode lets run alongside the writer.
+# Under serve.py's multi-process mode the writer thread forwards each write
+# to the shared writer process (db_writer) instead of applying it locally.
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from DAL import gmail_dal
+from DAL import cache_dal
+from DAL import jobs_dal
+from DAL import db_writer
+
+
+logger = logging.getLogger(__name__)
+
+DAL_READER_THREADS = int(os.getenv("DAL_READER_THREADS", "4"))
+# Most remove_duplicates calls committed together (see remove_duplicates_async)
+DAL_DEDUP_GROUP = int(os.getenv("DAL_DEDUP_GROUP", "8"))
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dal-writer")
+_readers = ThreadPoolExecutor(max_workers=DAL_READER_THREADS, thread_name_prefix="dal-reader")
+
+# Calls per DAL function in this process and their total time, queueing included (served by /stats)
+op_counts: defaultdict[str, dict] = defaultdict(lambda: {"calls": 0, "seconds": 0.0})
+
+
+def _op_name(fn):
+    return f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+
+async def _timed(op, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        counts = op_counts[op]
+        counts["calls"] += 1
+        counts["seconds"] += time.perf_counter() - start
+
+
+async def _run(executor, fn, *args, op=None):
+    loop = asyncio.get_running_loop()
+    return await _timed(op or _op_name(fn), loop.run_in_executor(executor, functools.partial(fn, *args)))
+
+
+def _apply(fn, *args):
+    if db_writer.enabled():
+        return db_writer.call(_op_name(fn), *args)
+    return fn(*args)
+
+
+async def _write(fn, *args):
+    return await _run(_writer, _apply, fn, *args, op=_op_name(fn))
+
+
+# Writes started without waiting for them; kept so they aren't garbage collected
+_background: set[asyncio.Task] = set()
+
+
+def _write_later(fn, *args):
+    task = asyncio.ensure_future(_write(fn, *args))
+    _background.add(task)
+    task.add_done_callback(_write_done)
+
+
+def _write_done(task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background write failed", exc_info=task.exception())
+
+
+# -------------------- WRITES --------------------
+
+# remove_duplicates calls waiting for the writer. The writer applies them in
+# groups of up to DAL_DEDUP_GROUP calls, each in one transaction with one commit:
+# concurrent /parse streams share commits instead of each waiting for its own, and
+# each stream resumes as soon as its group is committed. The cap keeps the first
+# streams of a burst going back to their LLM calls while the writer works on the rest.
+_dedup_queue: deque = deque()
+
+
+def _apply_dedup_groups():
+    """Apply queued calls until the queue is empty (runs on the writer thread).
+
+    A call queued while this runs is picked up by it; one queued after the last
+    check finds the queue empty and starts another run.
+    """
+    while _dedup_queue:
+        group = []
+        while _dedup_queue and len(group) < DAL_DEDUP_GROUP:
+            group.append(_dedup_queue.popleft())
+        try:
+            results = _apply(gmail_dal.remove_duplicates_many, [call for call, _, _ in group])
+        except Exception as e:
+            results = [e] * len(group)
+        for (_, loop, future), result in zip(group, results):
+            try:
+                loop.call_soon_threadsafe(_settle, future, result)
+            except RuntimeError:
+                pass  # the loop is closed: nobody is waiting any more
+
+
+def _settle(future, result):
+    if future.done():
+        return
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+async def remove_duplicates_async(user_email, events, user_timezone=None):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    start_run = not _dedup_queue
+    _dedup_queue.append(((user_email, events, user_timezone), loop, future))
+    if start_run:
+        _writer.submit(_apply_dedup_groups)
+    return await _timed("gmail_dal.remove_duplicates_many", future)
+
+
+async def set_digest_status_async(user_email, item_id, status):
+    return await _write(gmail_dal.set_digest_status, user_email, item_id, status)
+
+
+async def render_digest_async(user_email, first_day, last_day):
+    return await _write(gmail_dal.render_digest, user_email, first_day, last_day)
+
+
+async def precompute_digests_async(user_timezone, days):
+    return await _write(gmail_dal.precompute_digests, user_timezone, days)
+
+
+async def save_contacts_async(user_email, contact_emails):
+    updated = await _write(gmail_dal.save_contacts, user_email, contact_emails)
+    if db_writer.enabled():
+        # The writer process updated its own copy; keep this worker's autocomplete index current
+        await _run(_readers, gmail_dal.apply_contact_scores, user_email, updated)
+    return updated
+
+
+async def mark_emails_processed_async(user_email, emails):
+    return await _write(gmail_dal.mark_emails_processed, user_email, emails)
+
+
+async def cache_put_async(key, response):
+    return await _write(cache_dal.cache_put, key, response)
+
+
+async def create_job_async(user_email, user_timezone, emails, extraction_mode):
+    return await _write(jobs_dal.create_job, user_email, user_timezone, emails, extraction_mode)
+
+
+async def plan_job_async(job_id, chunks, block_stats):
+    return await _write(jobs_dal.plan_job, job_id, chunks, block_stats)
+
+
+async def complete_job_chunk_async(job_id, user_email, idx, events=None, error=None):
+    return await _write(jobs_dal.complete_job_chunk, job_id, user_email, idx, events, error)
+
+
+async def fail_job_async(job_id, error):
+    return await _write(jobs_dal.fail_job, job_id, error)
+
+
+# -------------------- READS --------------------
+
+async def get_suggested_contacts_async(user_email, limit=None):
+    return await _run(_readers, gmail_dal.get_suggested_contacts, user_email, limit)
+
+
+async def search_contacts_async(user_email, query="", limit=20, offset=0):
+    return await _run(_readers, gmail_dal.search_contacts, user_email, query, limit, offset)
+
+
+async def overlapping_events_async(user_email, start_ts, end_ts):
+    return await _run(_readers, gmail_dal.overlapping_events, user_email, start_ts, end_ts)
+
+
+async def free_slots_async(user_email, start_ts, end_ts, min_seconds=1800, include_all_day=False):
+    return await _run(_readers, gmail_dal.free_slots, user_email, start_ts, end_ts, min_seconds, include_all_day)
+
+
+async def digest_version_async(user_email):
+    return await _run(_readers, gmail_dal.digest_version, user_email)
+
+
+async def get_digest_async(user_email, first_day, last_day):
+    return await _run(_readers, gmail_dal.get_digest, user_email, first_day, last_day)
+
+
+async def digest_timezones_async():
+    return await _run(_readers, gmail_dal.digest_timezones)
+
+
+async def filter_processed_emails_async(user_email, emails):
+    return await _run(_readers, gmail_dal.filter_processed_emails, user_email, emails)
+
+
+async def cache_get_async(key):
+    response = await _run(_readers, cache_dal.cache_get, key)
+    pending = cache_dal.take_pending()
+    if pending is not None:
+        # The lookup doesn't wait for its access time to be written
+        _write_later(cache_dal.apply_pending, *pending)
+    return response
+
+
+async def cache_stats_async():
+    return cache_dal.cache_stats(await _run(_readers, cache_dal.cache_entries))
+
+
+async def get_job_async(job_id):
+    return await _run(_readers, jobs_dal.get_job, job_id)
+
+
+async def get_job_payload_async(job_id):
+    return await _run(_readers, jobs_dal.get_job_payload, job_id)
+
+
+async def unfinished_jobs_async():
+    return await _run(_readers, jobs_dal.unfinished_jobs)
+
+
+async def pending_chunks_async(job_id):
+    return await _run(_readers, jobs_dal.pending_chunks, job_id)
+
+
+async def get_job_chunk_async(job_id, idx):
+    return await _run(_readers, jobs_dal.get_job_chunk, job_id, idx)
+
+
+async def job_results_async(job_id, after_seq=0, limit=100):
+    return await _run(_readers, jobs_dal.job_results, job_id, after_seq, limit)
+
+
+def db_stats() -> dict:
+    return {name: dict(counts) for name, counts in sorted(op_counts.items())}
+
+
+def flush():
+    """Block until every queued write has been applied. Called from the app's shutdown hook."""
+    _writer.submit(_apply_dedup_groups).result()
+    pending = cache_dal.take_pending(force=True)
+    if pending is not None:
+        _writer.submit(_apply, cache_dal.apply_pending, *pending)
+    _writer.submit(lambda: None).result()
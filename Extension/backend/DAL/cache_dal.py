@@ -0,0 +1,179 @@
+# cache_dal.py (LLM response cache)
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+CACHE_DB_FILE = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") == "1"
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+# Lookups queue access times and expired keys; they are written in batches of this
+# size, or after this many seconds, through the writer (see apply_pending)
+CACHE_TOUCH_BATCH = int(os.getenv("LLM_CACHE_TOUCH_BATCH", "64"))
+CACHE_TOUCH_INTERVAL = float(os.getenv("LLM_CACHE_TOUCH_INTERVAL", "5"))
+
+# Serializes writes, which share one connection; each reading thread has its own (_read_conn)
+_lock = threading.Lock()
+_conn = None
+_readers = threading.local()
+# Rows in the table, counted by the process that writes it (the writer process under serve.py)
+_entries = None
+
+# Guards the queues below; held only to update them, never across a query
+_pending_lock = threading.Lock()
+_touches: dict[str, float] = {}
+_expired: set[str] = set()
+_last_flush = time.monotonic()
+
+stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+
+def cache_key(payload: dict) -> str:
+    """Content address of a chat request: prompt, model and sampling parameters."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _get_conn():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(CACHE_DB_FILE, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        _conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache(last_access)')
+        _conn.commit()
+    return _conn
+
+
+def _read_conn():
+    conn = getattr(_readers, "conn", None)
+    if conn is None:
+        with _lock:
+            _get_conn()  # creates the table
+        conn = _readers.conn = sqlite3.connect(CACHE_DB_FILE)
+    return conn
+
+
+def cache_get(key: str):
+    """Return the cached response for `key`, or None on a miss or expired entry.
+
+    Only reads: the hit's access time, or the expired entry's deletion, is
+    queued for apply_pending, which runs in the writer like every other write.
+    """
+    if not CACHE_ENABLED:
+        return None
+    now = time.time()
+    row = _read_conn().execute('SELECT response, created_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+    with _pending_lock:
+        if row is None:
+            stats["misses"] += 1
+            return None
+        response, created_at = row
+        if now - created_at > CACHE_TTL_SECONDS:
+            _expired.add(key)
+            stats["expired"] += 1
+            stats["misses"] += 1
+            return None
+        _touches[key] = now
+        stats["hits"] += 1
+    return response
+
+
+def take_pending(force=False):
+    """(touches, expired keys) queued by cache_get, once a batch is due (or any with `force`); otherwise None."""
+    global _touches, _expired, _last_flush
+    with _pending_lock:
+        queued = len(_touches) + len(_expired)
+        if not queued or (not force and queued < CACHE_TOUCH_BATCH
+                          and time.monotonic() - _last_flush < CACHE_TOUCH_INTERVAL):
+            return None
+        touches, expired = list(_touches.items()), list(_expired)
+        _touches, _expired = {}, set()
+        _last_flush = time.monotonic()
+    return touches, expired
+
+
+def _count(conn):
+    global _entries
+    if _entries is None:
+        _entries = conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+    return _entries
+
+
+def apply_pending(touches, expired):
+    """Record queued access times and delete queued expired entries, in one transaction."""
+    if not CACHE_ENABLED:
+        return
+    global _entries
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        _count(conn)
+        conn.executemany('UPDATE llm_cache SET last_access = MAX(last_access, ?) WHERE key = ?',
+                         [(at, key) for key, at in touches])
+        # An entry stored again since the lookup found it expired is kept
+        deleted = 0
+        for key in expired:
+            deleted += conn.execute('DELETE FROM llm_cache WHERE key = ? AND created_at < ?',
+                                    (key, now - CACHE_TTL_SECONDS)).rowcount
+        _entries -= deleted
+        conn.commit()
+
+
+def cache_put(key: str, response: str):
+    """Store a response, evicting the least recently used entries past CACHE_MAX_ENTRIES."""
+    if not CACHE_ENABLED:
+        return
+    global _entries
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        _count(conn)
+        existed = conn.execute('SELECT 1 FROM llm_cache WHERE key = ?', (key,)).fetchone() is not None
+        conn.execute('''
+            INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_access)
+            VALUES (?, ?, ?, ?)
+        ''', (key, response, now, now))
+        if not existed:
+            _entries += 1
+        if _entries > CACHE_MAX_ENTRIES:
+            # Evict in batches of ~10% so we don't pay a DELETE on every insert
+            overflow = _entries - CACHE_MAX_ENTRIES + max(1, CACHE_MAX_ENTRIES // 10)
+            cur = conn.execute('''
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_access LIMIT ?
+                )
+            ''', (overflow,))
+            _entries -= cur.rowcount
+            stats["evictions"] += cur.rowcount
+        conn.commit()
+
+
+def cache_entries() -> int:
+    """Rows in the cache table. A query, so async callers go through async_dal.cache_stats_async."""
+    if not CACHE_ENABLED:
+        return 0
+    # Counted from the table: under serve.py only the writer process keeps a running count
+    return _read_conn().execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+
+
+def cache_stats(entries: int) -> dict:
+    """This process's lookup counters, with `entries` from cache_entries."""
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "entries": entries,
+        "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+    }
@@ -0,0 +1,104 @@
+# db_writer.py (single writer process for multi-worker serving)
+#
+# With several web worker processes, every one of them writing to events.db
+# would contend on SQLite's single write lock (and retry on "database is
+# locked"). serve.py starts one writer process before forking the workers;
+# each worker's async_dal then forwards its writes to it over a local socket,
+# and the writer applies them one at a time on its own connections.
+import importlib
+import os
+import signal
+import threading
+from multiprocessing.managers import BaseManager
+
+
+# Writes that may be forwarded, as "<DAL module>.<function>"
+WRITE_FUNCTIONS = {
+    "gmail_dal.remove_duplicates",
+    "gmail_dal.remove_duplicates_many",
+    "gmail_dal.save_contacts",
+    "gmail_dal.mark_emails_processed",
+    "gmail_dal.set_digest_status",
+    "gmail_dal.render_digest",
+    "gmail_dal.precompute_digests",
+    "cache_dal.cache_put",
+    "cache_dal.apply_pending",
+    "jobs_dal.create_job",
+    "jobs_dal.plan_job",
+    "jobs_dal.complete_job_chunk",
+    "jobs_dal.fail_job",
+}
+
+# Set in the parent by start_writer_process and inherited by forked workers
+_address = None
+_authkey = None
+_local = threading.local()
+
+
+class _Writer:
+    """Lives in the writer process; the manager serves each client on its own thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def call(self, name, args):
+        if name not in WRITE_FUNCTIONS:
+            raise ValueError(f"{name} is not a forwardable write")
+        module, function = name.split(".")
+        fn = getattr(importlib.import_module(f"DAL.{module}"), function)
+        with self._lock:
+            return fn(*args)
+
+
+_writer = None
+
+
+def _get_writer():
+    global _writer
+    if _writer is None:
+        _writer = _Writer()
+    return _writer
+
+
+class _WriterManager(BaseManager):
+    pass
+
+
+_WriterManager.register("writer", callable=_get_writer)
+
+
+def _ignore_interrupts():
+    # Ctrl-C reaches the whole process group; the writer must outlive the workers' last writes
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def start_writer_process():
+    """Start the writer process and route this process's (and its forks') writes to it.
+
+    Returns the manager; call .shutdown() on it after the workers have exited.
+    """
+    global _address, _authkey
+    authkey = os.urandom(16)
+    manager = _WriterManager(address=("127.0.0.1", 0), authkey=authkey)
+    manager.start(initializer=_ignore_interrupts)
+    _address, _authkey = manager.address, authkey
+    return manager
+
+
+def enabled():
+    return _address is not None
+
+
+def _proxy():
+    # Proxies aren't shared between threads; async_dal uses one writer thread anyway
+    proxy = getattr(_local, "proxy", None)
+    if proxy is None:
+        manager = _WriterManager(address=_address, authkey=_authkey)
+        manager.connect()
+        proxy = _local.proxy = manager.writer()
+    return proxy
+
+
+def call(name, *args):
+    """Apply the write `name` (one of WRITE_FUNCTIONS) in the writer process."""
+    return _proxy().call(name, args)
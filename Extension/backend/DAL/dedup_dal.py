@@ -0,0 +1,308 @@
+# dedup_dal.py (event deduplication engine)
+#
+# An extracted event is a duplicate of a stored one when either
+#   - its normalized key matches: the subject without Re:/Fwd:/[list] prefixes
+#     or punctuation, plus the canonical sender address, on the same start
+#     day (or either start is unknown); or
+#   - it is a near-duplicate: the same start day, start times at most
+#     DEDUP_TIME_WINDOW_MIN apart, the same numbers in the title ("Section 2"
+#     is not "Section 3"), and a SimHash of title + context within
+#     DEDUP_SIMHASH_DISTANCE bits, or DEDUP_CROSS_SENDER_DISTANCE bits for
+#     events from different senders. The start day is what makes this safe,
+#     so undated events only ever match by key.
+# Candidates for a whole batch come from one query on the (user, key) and
+# (user, start day, start minute) indexes, so a lookup only reads the user's
+# events inside the time windows. Rows not seen for DEDUP_RETENTION_DAYS are
+# swept out in bounded batches, which keeps the table from growing with
+# history.
+#
+# Functions take the caller's connection and run inside its transaction.
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+
+DEDUP_FUZZY = os.getenv("DEDUP_FUZZY", "1") == "1"
+DEDUP_SIMHASH_DISTANCE = int(os.getenv("DEDUP_SIMHASH_DISTANCE", "16"))
+DEDUP_CROSS_SENDER_DISTANCE = int(os.getenv("DEDUP_CROSS_SENDER_DISTANCE", "6"))
+DEDUP_TIME_WINDOW_MIN = int(os.getenv("DEDUP_TIME_WINDOW_MIN", "60"))
+DEDUP_RETENTION_DAYS = float(os.getenv("DEDUP_RETENTION_DAYS", "180"))
+DEDUP_SWEEP_INTERVAL = float(os.getenv("DEDUP_SWEEP_INTERVAL", "3600"))
+DEDUP_SWEEP_BATCH = int(os.getenv("DEDUP_SWEEP_BATCH", "5000"))
+
+# start_day of events whose date is unknown
+NO_DAY = 0
+NO_MINUTE = -1
+
+# Ids per last_seen UPDATE, under SQLite's 999-parameter limit
+_LOOKUP_BATCH = 150
+
+_PREFIX_RE = re.compile(r'^\s*(?:(?:re|fw|fwd|aw|wg|sv|tr)\s*(?:\[\d+\])?\s*:|\[[^\]]*\]|\([^)]*\))\s*', re.IGNORECASE)
+_NON_WORD_RE = re.compile(r'[^\w]+')
+_ANGLE_EMAIL_RE = re.compile(r'<\s*([^<>\s]+@[^<>\s]+)\s*>')
+_EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+_NUMBER_RE = re.compile(r'\d+')
+_ISO_START_RE = re.compile(r'^\s*(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2}))?')
+
+_last_sweep = 0.0
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS event_fingerprints (
+            id INTEGER PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            norm_key TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            start_day INTEGER NOT NULL,
+            start_minute INTEGER NOT NULL,
+            simhash INTEGER NOT NULL,
+            numbers TEXT NOT NULL,
+            last_seen REAL NOT NULL,
+            UNIQUE(user_email, norm_key, start_day)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_fp_day ON event_fingerprints (user_email, start_day, start_minute)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_fp_seen ON event_fingerprints (last_seen)')
+    _migrate_legacy_events(conn)
+
+
+def _migrate_legacy_events(conn):
+    """Move exact-match rows from the old events table, which stored only (subject, sender)."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'events'").fetchone() is None:
+        return
+    now = time.time()
+    rows = conn.execute('SELECT user_email, raw_subject, sender FROM events').fetchall()
+    # Unknown start day, so they still match the same subject and sender on any day, as before
+    _insert(conn, [(user, *fingerprint({"raw_subject": subject, "sender": sender}), now)
+                   for user, subject, sender in rows])
+    conn.execute('DROP TABLE events')
+
+
+# -------------------- FINGERPRINTS --------------------
+
+def normalize_subject(subject):
+    """Lowercased subject without reply/forward prefixes, list tags or punctuation."""
+    subject = subject or ""
+    while True:
+        stripped = _PREFIX_RE.sub("", subject, count=1)
+        if stripped == subject:
+            break
+        subject = stripped
+    return " ".join(_NON_WORD_RE.sub(" ", subject.lower()).split())
+
+
+def canonical_sender(sender):
+    """The sender's address, lowercased and without a +tag, or the normalized name if there is none."""
+    sender = sender or ""
+    match = _ANGLE_EMAIL_RE.search(sender) or _EMAIL_RE.search(sender)
+    if not match:
+        return " ".join(_NON_WORD_RE.sub(" ", sender.lower()).split())
+    local, _, domain = match.group(match.lastindex or 0).lower().rpartition("@")
+    return f"{local.split('+', 1)[0]}@{domain}"
+
+
+def normalize_key(raw_subject, sender):
+    return f"{normalize_subject(raw_subject)}|{canonical_sender(sender)}"
+
+
+def parse_start(event):
+    """(start_day as YYYYMMDD, minutes after midnight) of the event's ISO start, as written by the model."""
+    iso = (event.get("time") or {}).get("iso") if isinstance(event.get("time"), dict) else None
+    match = _ISO_START_RE.match(iso or "")
+    if not match:
+        return NO_DAY, NO_MINUTE
+    year, month, day, hour, minute = match.groups()
+    start_day = int(year) * 10000 + int(month) * 100 + int(day)
+    return start_day, int(hour) * 60 + int(minute) if hour is not None else NO_MINUTE
+
+
+def _features(title, context):
+    """Character trigrams of the title (robust to "Dept" vs "Department") and the context's words."""
+    title = " ".join(_NON_WORD_RE.sub(" ", title.lower()).split())
+    features = [title[i:i + 3] for i in range(max(1, len(title) - 2))]
+    features.extend("w:" + word for word in _NON_WORD_RE.sub(" ", context.lower()).split())
+    return features
+
+
+# A byte's 8 bits spread into 16-bit counters, lowest bit first
+_SPREAD_BYTE = [sum(1 << 16 * bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+@functools.lru_cache(maxsize=65536)
+def _spread_hash(feature):
+    """The feature's 64-bit hash with each bit widened to its own 16-bit counter.
+
+    Adding these for all features counts every bit position at once, in
+    one big-integer addition per feature.
+    """
+    b = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    spread = _SPREAD_BYTE
+    # Byte 7 is the lowest (the digest reads big-endian), so it takes counters 0-7
+    return (spread[b[7]] | spread[b[6]] << 128 | spread[b[5]] << 256 | spread[b[4]] << 384
+            | spread[b[3]] << 512 | spread[b[2]] << 640 | spread[b[1]] << 768 | spread[b[0]] << 896)
+
+
+# One 1 in every 16-bit counter, and each counter's top bit
+_LANES = sum(1 << 16 * bit for bit in range(64))
+_LANE_TOPS = 0x8000 * _LANES
+# A counter's top byte after masking (0x80 or 0) to the bit's digit
+_BIT_DIGIT = bytes.maketrans(b"\x80\x00", b"10")
+
+
+def simhash(features):
+    """64-bit SimHash: each bit is set when most feature hashes have it set."""
+    # 32767 features at most, so a counter plus the offset below never carries into
+    # the next one; titles and contexts come nowhere near
+    features = features[:0x7FFF]
+    if not features:
+        return 0
+    # Offsetting every counter so that "more than half" lands on its top bit
+    majority = len(features) // 2 + 1
+    tops = (sum(map(_spread_hash, features)) + (0x8000 - majority) * _LANES) & _LANE_TOPS
+    # Counter 0 is bit 0, so the top bytes read as binary digits from the last one
+    return int(tops.to_bytes(128, "little")[:0:-2].translate(_BIT_DIGIT), 2)
+
+
+def _signed(value):
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def fingerprint(event):
+    """(norm_key, sender, start_day, start_minute, simhash, numbers) of an extracted event."""
+    subject = normalize_subject(event.get("raw_subject", ""))
+    sender = canonical_sender(event.get("sender", ""))
+    start_day, start_minute = parse_start(event)
+    title = event.get("event") or subject
+    # The same key normalize_key builds, without normalizing the subject and sender twice
+    return (f"{subject}|{sender}", sender, start_day, start_minute,
+            _signed(simhash(_features(title, event.get("context") or ""))),
+            " ".join(sorted(set(_NUMBER_RE.findall(title)))))
+
+
+def _same_key(fp, other):
+    return fp[0] == other[0] and (fp[2] == other[2] or NO_DAY in (fp[2], other[2]))
+
+
+def _near(fp, other):
+    """Near-duplicate test for two dated events on the same day."""
+    _, sender, _, minute, bits, numbers = fp
+    _, other_sender, _, other_minute, other_bits, other_numbers = other
+    if numbers != other_numbers:
+        return False
+    if NO_MINUTE not in (minute, other_minute) and abs(minute - other_minute) > DEDUP_TIME_WINDOW_MIN:
+        return False
+    limit = DEDUP_SIMHASH_DISTANCE if sender == other_sender else DEDUP_CROSS_SENDER_DISTANCE
+    return bin((bits ^ other_bits) & 0xFFFFFFFFFFFFFFFF).count("1") <= limit
+
+
+# -------------------- LOOKUP AND INSERT --------------------
+
+_COLUMNS = "norm_key, sender, start_day, start_minute, simhash, numbers"
+_F_COLUMNS = ", ".join("f." + column for column in _COLUMNS.split(", "))
+
+
+def _candidates(conn, user_email, fps):
+    """Stored fingerprints that could match any of `fps`, in one query for the whole batch.
+
+    The keys and the (day, first minute, last minute, numbers) windows are
+    passed as JSON arrays. Key matches come from the key index;
+    near-duplicates only from the (day, minute) index within each event's
+    time window, so a busy day's other events aren't read, and only with the
+    same numbers in the title, which _near requires anyway.
+    """
+    keys = sorted({fp[0] for fp in fps})
+    windows = set()
+    if DEDUP_FUZZY:
+        for _, _, day, minute, _, numbers in fps:
+            if day == NO_DAY:
+                continue
+            if minute == NO_MINUTE:
+                windows.add((day, NO_MINUTE, 24 * 60, numbers))
+            else:
+                windows.add((day, minute - DEDUP_TIME_WINDOW_MIN, minute + DEDUP_TIME_WINDOW_MIN, numbers))
+                # Stored events with no known start time match any time that day
+                windows.add((day, NO_MINUTE, NO_MINUTE, numbers))
+    return conn.execute(f'''
+        SELECT id, {_COLUMNS} FROM event_fingerprints
+        WHERE user_email = ? AND norm_key IN (SELECT value FROM json_each(?))
+        UNION
+        SELECT f.id, {_F_COLUMNS}
+        FROM json_each(?) AS w
+        CROSS JOIN event_fingerprints AS f  -- windows first, then an index range per window
+        WHERE f.user_email = ? AND f.start_day = json_extract(w.value, '$[0]')
+          AND f.start_minute BETWEEN json_extract(w.value, '$[1]') AND json_extract(w.value, '$[2]')
+          AND f.numbers = json_extract(w.value, '$[3]')
+    ''', (user_email, json.dumps(keys), json.dumps(sorted(windows)), user_email)).fetchall()
+
+
+def _insert(conn, rows):
+    conn.executemany(f'''
+        INSERT OR IGNORE INTO event_fingerprints (user_email, {_COLUMNS}, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+
+def new_events(conn, user_email, events, now=None):
+    """Store the events that aren't duplicates and return them, in their original order.
+
+    Duplicates refresh the stored event's last_seen instead. An event that
+    duplicates an earlier one in the same batch is dropped too.
+    """
+    now = time.time() if now is None else now
+    user_email = user_email.strip().lower()
+    fps = [fingerprint(event) for event in events]
+    by_key, by_day = {}, {}
+
+    def add(row_id, fp):
+        by_key.setdefault(fp[0], []).append((row_id, fp))
+        if fp[2] != NO_DAY:
+            by_day.setdefault(fp[2], []).append((row_id, fp))
+
+    for row_id, *fp in _candidates(conn, user_email, fps):
+        add(row_id, tuple(fp))
+
+    unique, inserts, seen_ids = [], [], set()
+    for event, fp in zip(events, fps):
+        match = next((row_id for row_id, other in by_key.get(fp[0], ()) if _same_key(fp, other)), None)
+        if match is None and DEDUP_FUZZY and fp[2] != NO_DAY:
+            match = next((row_id for row_id, other in by_day.get(fp[2], ()) if _near(fp, other)), None)
+        if match is not None:
+            if match > 0:
+                seen_ids.add(match)
+            continue
+        unique.append(event)
+        inserts.append((user_email, *fp, now))
+        # Later events in this batch are compared with it too; negative ids mark it as not stored yet
+        add(-len(inserts), fp)
+
+    if inserts:
+        _insert(conn, inserts)
+    ids = list(seen_ids)
+    for start in range(0, len(ids), _LOOKUP_BATCH):
+        batch = ids[start:start + _LOOKUP_BATCH]
+        conn.execute(f'UPDATE event_fingerprints SET last_seen = ? WHERE id IN ({", ".join("?" * len(batch))})',
+                     [now, *batch])
+    return unique
+
+
+def sweep(conn, now=None, force=False):
+    """Delete one batch of fingerprints unseen for DEDUP_RETENTION_DAYS, at most every DEDUP_SWEEP_INTERVAL.
+
+    Returns the number of rows deleted. A full batch leaves the next call free to sweep again.
+    """
+    global _last_sweep
+    now = time.time() if now is None else now
+    if not force and now - _last_sweep < DEDUP_SWEEP_INTERVAL:
+        return 0
+    deleted = conn.execute('''
+        DELETE FROM event_fingerprints WHERE id IN (
+            SELECT id FROM event_fingerprints WHERE last_seen < ? LIMIT ?
+        )
+    ''', (now - DEDUP_RETENTION_DAYS * 86400, DEDUP_SWEEP_BATCH)).rowcount
+    if deleted < DEDUP_SWEEP_BATCH:
+        _last_sweep = now
+    return deleted
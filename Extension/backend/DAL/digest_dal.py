@@ -0,0 +1,241 @@
+# digest_dal.py (materialized daily digest)
+#
+# Every event admitted by dedup becomes a digest item on one local day: the
+# day it starts, or for an undated event the day it was found, both in the
+# timezone it was stored with. Each (user, day) keeps its rendered list of
+# items in digest_days. Adding, confirming or dismissing an item only marks
+# its day stale (digest_stale), so dedup's write path never renders; a read
+# whose window has stale days has them re-rendered from their own items
+# first (render_stale, a write), and the precompute sweep renders the days it
+# covers. Reading a window of days is a primary-key range read of
+# pre-rendered rows, so it costs O(days + events in the window), never
+# O(history).
+#
+# Rendering also sets each item's urgency from the time of the render, so a
+# day's urgencies are as of its last rendering. The optional precompute sweep
+# re-renders the coming days every morning to move them along.
+#
+# digest_heads holds a per-user version, bumped by every change to any of the
+# user's days. It makes a cheap ETag: a client whose copy is current costs
+# one primary-key lookup.
+#
+# Functions take the caller's connection and run inside its transaction.
+import json
+import time
+from datetime import date, datetime, timedelta
+
+from Utils.time_normalizer import event_interval, interval_urgency, user_zone
+
+PENDING = "pending"
+CONFIRMED = "confirmed"
+DISMISSED = "dismissed"
+STATUSES = (PENDING, CONFIRMED, DISMISSED)
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS digest_items (
+            id INTEGER PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            start_ts INTEGER,
+            end_ts INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            event TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_digest_items_day ON digest_items (user_email, day)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS digest_days (
+            user_email TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            items TEXT NOT NULL,
+            PRIMARY KEY (user_email, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS digest_stale (
+            user_email TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            PRIMARY KEY (user_email, day)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS digest_heads (
+            user_email TEXT PRIMARY KEY,
+            user_timezone TEXT NOT NULL,
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_digest_heads_tz ON digest_heads (user_timezone)')
+
+
+def day_number(day):
+    """A date as the YYYYMMDD integer days are keyed by."""
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def day_date(number):
+    return date(number // 10000, number // 100 % 100, number % 100)
+
+
+def local_day(user_timezone, now=None):
+    """Today in the user's timezone, as a date."""
+    return datetime.fromtimestamp(time.time() if now is None else now, user_zone(user_timezone)).date()
+
+
+def day_range(first, days):
+    """YYYYMMDD numbers of `days` days starting at the date `first`."""
+    return [day_number(first + timedelta(days=i)) for i in range(days)]
+
+
+# -------------------- WRITES --------------------
+
+def _bump(conn, user_email, user_timezone):
+    conn.execute('''
+        INSERT INTO digest_heads (user_email, user_timezone, version) VALUES (?, ?, 1)
+        ON CONFLICT(user_email) DO UPDATE SET version = version + 1, user_timezone = excluded.user_timezone
+    ''', (user_email, user_timezone))
+
+
+def _mark_stale(conn, user_email, days):
+    conn.executemany('INSERT OR IGNORE INTO digest_stale (user_email, day) VALUES (?, ?)',
+                     [(user_email, day) for day in days])
+
+
+def _render(conn, user_email, days, now):
+    """Re-render the given days from their items; returns whether any of them changed."""
+    changed = False
+    for day in days:
+        conn.execute('DELETE FROM digest_stale WHERE user_email = ? AND day = ?', (user_email, day))
+        rows = conn.execute('''
+            SELECT id, status, start_ts, end_ts, event FROM digest_items
+            WHERE user_email = ? AND day = ? AND status != ?
+            ORDER BY start_ts IS NULL, start_ts, id
+        ''', (user_email, day, DISMISSED)).fetchall()
+        # Stored events are already JSON, so splice them in rather than decode and re-encode each one
+        items = "[" + ",".join(
+            f'{{"id":{row_id},"status":"{status}","urgency":"'
+            f'{"low" if start_ts is None else interval_urgency(start_ts, end_ts, now)}","event":{event}}}'
+            for row_id, status, start_ts, end_ts, event in rows) + "]"
+        old = conn.execute('SELECT items FROM digest_days WHERE user_email = ? AND day = ?',
+                           (user_email, day)).fetchone()
+        if (old[0] if old else "[]") == items:
+            continue
+        conn.execute('''
+            INSERT INTO digest_days (user_email, day, items) VALUES (?, ?, ?)
+            ON CONFLICT(user_email, day) DO UPDATE SET items = excluded.items
+        ''', (user_email, day, items))
+        changed = True
+    return changed
+
+
+def add(conn, user_email, events, user_timezone, now=None):
+    """Add newly admitted events to their days' digests. Returns the new items' ids, in order."""
+    if not events:
+        return []
+    user_email = user_email.strip().lower()
+    now = time.time() if now is None else now
+    tz = user_zone(user_timezone)
+    found_on = day_number(datetime.fromtimestamp(now, tz).date())
+    rows = []
+    for event in events:
+        start_ts, end_ts, _ = event_interval(event, user_timezone) or (None, None, None)
+        day = found_on if start_ts is None else day_number(datetime.fromtimestamp(start_ts, tz).date())
+        rows.append((user_email, day, start_ts, end_ts,
+                     json.dumps(event, ensure_ascii=False, separators=(",", ":")), now))
+    conn.executemany('''
+        INSERT INTO digest_items (user_email, day, start_ts, end_ts, event, created_at) VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+    # The rows took consecutive ids above every stored one, ending at the last insert
+    last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    _mark_stale(conn, user_email, {row[1] for row in rows})
+    _bump(conn, user_email, user_timezone)
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+def get_item(conn, user_email, item_id):
+    """(status, event dict, the user's timezone) of one of the user's items, or None."""
+    row = conn.execute('''
+        SELECT i.status, i.event, h.user_timezone FROM digest_items i
+        JOIN digest_heads h ON h.user_email = i.user_email
+        WHERE i.id = ? AND i.user_email = ?
+    ''', (item_id, user_email.strip().lower())).fetchone()
+    return None if row is None else (row[0], json.loads(row[1]), row[2])
+
+
+def set_status(conn, user_email, item_id, status, now=None):
+    """Confirm or dismiss one item. Returns {"id", "status", "day"}, or None if the user has no such item."""
+    if status not in STATUSES:
+        raise ValueError(f"Unknown digest status: {status}")
+    user_email = user_email.strip().lower()
+    row = conn.execute('SELECT day, status FROM digest_items WHERE id = ? AND user_email = ?',
+                       (item_id, user_email)).fetchone()
+    if row is None:
+        return None
+    day, old_status = row
+    if old_status != status:
+        conn.execute('UPDATE digest_items SET status = ? WHERE id = ?', (status, item_id))
+        _mark_stale(conn, user_email, [day])
+        conn.execute('UPDATE digest_heads SET version = version + 1 WHERE user_email = ?', (user_email,))
+    return {"id": item_id, "status": status, "day": day_date(day).isoformat()}
+
+
+def render_stale(conn, user_email, first_day, last_day, now=None):
+    """Render the user's stale days in [first_day, last_day]. Returns how many there were.
+
+    The version isn't bumped: it already was when the days went stale.
+    """
+    user_email = user_email.strip().lower()
+    days = [row[0] for row in conn.execute('''
+        SELECT day FROM digest_stale WHERE user_email = ? AND day >= ? AND day <= ?
+    ''', (user_email, first_day, last_day)).fetchall()]
+    _render(conn, user_email, days, time.time() if now is None else now)
+    return len(days)
+
+
+def precompute(conn, user_timezone, days, now=None):
+    """Re-render the given days for every user in `user_timezone`, bringing their urgencies up to `now`.
+
+    Only users whose rendering changed get a new version. Returns how many did.
+    """
+    now = time.time() if now is None else now
+    users = [row[0] for row in conn.execute('SELECT user_email FROM digest_heads WHERE user_timezone = ?',
+                                            (user_timezone,)).fetchall()]
+    changed = 0
+    for user_email in users:
+        if _render(conn, user_email, days, now):
+            _bump(conn, user_email, user_timezone)
+            changed += 1
+    return changed
+
+
+# -------------------- READS --------------------
+
+def version(conn, user_email):
+    """The user's digest version; 0 before anything was added."""
+    row = conn.execute('SELECT version FROM digest_heads WHERE user_email = ?',
+                       (user_email.strip().lower(),)).fetchone()
+    return row[0] if row else 0
+
+
+def timezones(conn):
+    return [row[0] for row in conn.execute('SELECT DISTINCT user_timezone FROM digest_heads').fetchall()]
+
+
+def read(conn, user_email, first_day, last_day):
+    """(version, {day: rendered items JSON}, stale) for the days in [first_day, last_day] that have a digest.
+
+    `stale` is whether any of those days needs render_stale before it is current.
+    """
+    user_email = user_email.strip().lower()
+    # Version first: a write landing between the reads then only makes the ETag stale, never wrong
+    current = version(conn, user_email)
+    rows = conn.execute('''
+        SELECT day, items FROM digest_days WHERE user_email = ? AND day >= ? AND day <= ?
+    ''', (user_email, first_day, last_day)).fetchall()
+    stale = conn.execute('''
+        SELECT 1 FROM digest_stale WHERE user_email = ? AND day >= ? AND day <= ? LIMIT 1
+    ''', (user_email, first_day, last_day)).fetchone() is not None
+    return current, dict(rows), stale
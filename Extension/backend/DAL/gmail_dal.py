@@ -1,105 +1,470 @@
 # dal.py (Data Access Layer)
 import sqlite3
 import os
-import tiktoken
+import re
+import hashlib
+import heapq
+import math
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from functools import lru_cache
+import threading
+import logging
+from nlp import PREFILTER_ENABLED, filter_scheduling_emails
+from Utils import metrics
+from Utils.time_normalizer import DEFAULT_TIMEZONE
+from DAL import dedup_dal, digest_dal, schedule_dal
 
+logger = logging.getLogger(__name__)
+DEDUP_EVENTS = metrics.counter("dedup_events_total", "Extracted events checked for duplicates, by outcome", ("result",))
 
-DB_FILE = 'events.db'
+
+DB_FILE = os.getenv("EVENTS_DB", "events.db")
+# NORMAL is durable across app crashes in WAL mode; FULL also survives power loss
+DB_SYNCHRONOUS = os.getenv("EVENTS_DB_SYNCHRONOUS", "NORMAL").upper()
 MAX_TOKENS = 4000
+# Input-token budget for one extraction request: prompt instructions plus chunk text
+MAX_REQUEST_TOKENS = int(os.getenv("MAX_REQUEST_TOKENS", "5000"))
+# Even out chunk sizes so the parallel LLM fan-out finishes together
+CHUNK_BALANCED = os.getenv("CHUNK_BALANCED", "1") == "1"
+# A contact's autocomplete score halves after this many days without use
+CONTACT_HALF_LIFE_DAYS = float(os.getenv("CONTACT_HALF_LIFE_DAYS", "30"))
+# Keep ranked in-memory prefix indexes for recently searched users
+CONTACT_INDEX_ENABLED = os.getenv("CONTACT_INDEX", "1") == "1"
+CONTACT_INDEX_USERS = int(os.getenv("CONTACT_INDEX_USERS", "128"))
+# Rebuild an index this often to pick up contacts saved by other processes
+CONTACT_INDEX_TTL = float(os.getenv("CONTACT_INDEX_TTL", "300"))
+CONTACT_INDEX_DEPTH = int(os.getenv("CONTACT_INDEX_DEPTH", "8"))
+CONTACT_INDEX_TOP_K = int(os.getenv("CONTACT_INDEX_TOP_K", "50"))
+# Prefixes matching at most this many contacts are ranked on the fly instead of kept
+CONTACT_INDEX_SCAN_LIMIT = max(int(os.getenv("CONTACT_INDEX_SCAN_LIMIT", "256")), CONTACT_INDEX_TOP_K)
+
+# tiktoken reads its BPE files from here and writes them here after a download, so a
+# host whose copy is filled in (`python -m Utils.warm_up`) never touches the network
+TOKENIZER_CACHE_DIR = os.getenv("TIKTOKEN_CACHE_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tokenizer_cache")
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
 
-# Setup tokenizer for token counting
-encoding = tiktoken.encoding_for_model("gpt-4")
+def get_encoding():
+    """The gpt-4 tokenizer, loaded on first use instead of at import (thread-safe)."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                os.environ.setdefault("TIKTOKEN_CACHE_DIR", TOKENIZER_CACHE_DIR)
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model("gpt-4")
+    return _encoding
+
+# Chunks are joined with "\n\n", which costs one token
+_SEPARATOR_TOKENS = 1
+# Role markers the chat format adds around each message, plus the reply primer
+_MESSAGE_OVERHEAD_TOKENS = 4
+_REPLY_PRIMER_TOKENS = 3
 
 def count_tokens(text):
-    return len(encoding.encode(text))
+    return len(get_encoding().encode_ordinary(text))
+
+@lru_cache(maxsize=128)
+def prompt_overhead_tokens(*messages):
+    """Tokens a request spends on everything but the chunk text (cached per prompt)."""
+    return sum(count_tokens(message) + _MESSAGE_OVERHEAD_TOKENS for message in messages) + _REPLY_PRIMER_TOKENS
+
+def _clean_snippet(snippet):
+    return snippet.replace('\xa0', ' ').replace('\u200c', '').replace('\ufeff', '').strip()
+
+def email_key(email):
+    """(gmailThread, snippet hash) identifying one version of an email."""
+    snippet = _clean_snippet(email.get("snippet", ""))
+    return email.get("gmailThread", ""), hashlib.sha1(snippet.encode("utf-8")).hexdigest()
+
+def build_email_blocks(emails, user_email=None, prefilter=PREFILTER_ENABLED):
+    """Format emails as prompt blocks.
+
+    Emails already processed for `user_email` are skipped, and with `prefilter`
+    emails with no date/time/scheduling signal are dropped before they cost
+    any tokens. Returns (blocks, stats) with skipped_emails and filtered_emails.
+    """
+    skipped = 0
+    if user_email:
+        with metrics.stage("dal.filter_processed"):
+            emails, skipped = filter_processed_emails(user_email, emails)
+    filtered = 0
+    if prefilter:
+        with metrics.stage("dal.prefilter"):
+            emails, filtered = filter_scheduling_emails(emails)
 
-def build_email_blocks(emails):
     blocks = []
     for email in emails:
         subject = email.get("subject", "No subject")
         sender = email.get("sender", "Unknown sender")
-        snippet = email.get("snippet", "").replace('\xa0', ' ').replace('\u200c', '').replace('\ufeff', '').strip()
+        snippet = _clean_snippet(email.get("snippet", ""))
         gmailThread = email.get("gmailThread", "")
 
         block = f"gmailThread: {gmailThread}\nFrom: {sender}\nSubject: {subject}\nSnippet: {snippet}"
         blocks.append(block)
-    return blocks
-
-def chunk_blocks(blocks, max_tokens=MAX_TOKENS):
-    chunks = []
-    current_chunk = ""
-    current_tokens = 0
-
-    tokenized_blocks = [(block, count_tokens(block)) for block in blocks]
-
-    for block, block_tokens in tokenized_blocks:
-        if block_tokens > max_tokens:
-            sentences = block.split(". ")
-            temp = ""
-            for sentence in sentences:
-                if count_tokens(temp + sentence) > max_tokens:
-                    if temp:
-                        chunks.append(temp.strip())
-                    temp = sentence + ". "
-                else:
-                    temp += sentence + ". "
-            if temp.strip():
-                chunks.append(temp.strip())
-            continue
-
-        if current_tokens + block_tokens > max_tokens:
-            chunks.append(current_chunk.strip())
-            current_chunk = block + "\n\n"
-            current_tokens = block_tokens
-        else:
-            current_chunk += block + "\n\n"
-            current_tokens += block_tokens
+    return blocks, {"skipped_emails": skipped, "filtered_emails": filtered}
+
+_THREAD_RE = re.compile(r'^gmailThread: (.+)$', re.MULTILINE)
+
+def chunk_threads(chunk):
+    """gmailThread ids of the emails packed into a chunk."""
+    return _THREAD_RE.findall(chunk)
+
+def count_tokens_batch(texts):
+    """Token counts for many strings; tiktoken fans large batches out over threads."""
+    encoding = get_encoding()
+    if len(texts) < 64:
+        return [len(encoding.encode_ordinary(text)) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+def _split_oversized(block, max_tokens):
+    """Split a block that alone exceeds max_tokens on sentence boundaries.
 
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    Each sentence is tokenized once and pieces are packed by summing the
+    cached counts, instead of re-tokenizing the growing piece per sentence.
+    Every piece repeats the block's gmailThread line, so each chunk holding
+    part of an email names it (see chunk_threads).
+    """
+    match = _THREAD_RE.match(block)
+    carry = match.group(0) + "\n" if match else ""
+    sentences = [sentence + ". " for sentence in block.split(". ")]
+    counts = count_tokens_batch(sentences + [carry])
+    carry_tokens = counts.pop()
+    pieces = []
+    current, current_tokens = [], 0
+    for sentence, tokens in zip(sentences, counts):
+        if current and current_tokens + tokens > max_tokens:
+            pieces.append(("".join(current).strip(), current_tokens))
+            current, current_tokens = [], carry_tokens
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        pieces.append(("".join(current).strip(), current_tokens))
+    # The first piece starts with the line already
+    return [(carry + text if i and carry else text, tokens) for i, (text, tokens) in enumerate(pieces) if text]
+
+def _pack_greedy(items, max_tokens):
+    bins = []
+    current, current_tokens = [], 0
+    for item in items:
+        cost = item[1] + _SEPARATOR_TOKENS
+        if current and current_tokens + cost > max_tokens:
+            bins.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += cost
+    if current:
+        bins.append(current)
+    return bins
+
+def _pack_balanced(items, max_tokens):
+    """Worst-fit decreasing: spread items over the fewest bins with even loads.
+
+    Evenly sized chunks finish their LLM calls at about the same time, so the
+    parallel fan-out isn't held up by one oversized straggler.
+    """
+    costs = [tokens + _SEPARATOR_TOKENS for _, tokens in items]
+    n_bins = max(1, -(-sum(costs) // max_tokens))
+    heap = [(0, i) for i in range(n_bins)]
+    members = [[] for _ in range(n_bins)]
+    for idx in sorted(range(len(items)), key=lambda i: costs[i], reverse=True):
+        load, b = heapq.heappop(heap)
+        if load and load + costs[idx] > max_tokens:
+            # Doesn't fit in the emptiest bin, so it fits nowhere: open a new one
+            heapq.heappush(heap, (load, b))
+            b, load = len(members), 0
+            members.append([])
+        members[b].append(idx)
+        heapq.heappush(heap, (load + costs[idx], b))
+    # Keep emails in inbox order inside each chunk, and chunks in order of their first email
+    ordered = sorted((sorted(m) for m in members if m), key=lambda m: m[0])
+    return [[items[i] for i in m] for m in ordered]
+
+def pack_blocks(blocks, max_tokens=MAX_TOKENS, balanced=CHUNK_BALANCED):
+    """Group blocks into chunks of at most max_tokens.
+
+    Every block is tokenized exactly once; blocks over the budget are split on
+    sentence boundaries first. Returns a list of (pieces, token_count) tuples.
+    """
+    items = []
+    with metrics.stage("dal.tokenize"):
+        counts = count_tokens_batch(blocks)
+    for block, tokens in zip(blocks, counts):
+        if tokens > max_tokens:
+            items.extend(_split_oversized(block, max_tokens))
+        else:
+            items.append((block, tokens))
+    with metrics.stage("dal.pack"):
+        bins = _pack_balanced(items, max_tokens) if balanced else _pack_greedy(items, max_tokens)
+    return [([text for text, _ in b], sum(tokens + _SEPARATOR_TOKENS for _, tokens in b)) for b in bins]
 
-    return chunks
+def chunk_blocks(blocks, max_tokens=MAX_TOKENS, balanced=CHUNK_BALANCED):
+    return ["\n\n".join(pieces) for pieces, _ in pack_blocks(blocks, max_tokens, balanced)]
 
 # -------------------- DATABASE SETUP --------------------
 
+# SQLite caps host parameters per statement; stay well under it when batching
+_BATCH_ROWS = 300
+
+_local = threading.local()
+# The schema is created on the process's first connection rather than at import
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def get_connection():
+    """Long-lived connection for the calling thread (sqlite3 connections are not thread-safe)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30, cached_statements=256)
+        conn.create_function("logaddexp", 2, _logaddexp, deterministic=True)
+        conn.execute('PRAGMA journal_mode=WAL')
+        if DB_SYNCHRONOUS in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+        _local.conn = conn
+        _ensure_schema(conn)
+    return conn
+
+
+def close_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def _batches(rows, size=_BATCH_ROWS):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_email TEXT NOT NULL,
-            raw_subject TEXT NOT NULL,
-            sender TEXT NOT NULL,
-            UNIQUE(user_email, raw_subject, sender)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS contacts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_email TEXT NOT NULL,
-            contact_email TEXT NOT NULL,
-            frequency INTEGER DEFAULT 1,
-            UNIQUE(user_email, contact_email)
-        )
-    ''')
-    conn.commit()
-    conn.close()
-    
-    
+    """Create or migrate the schema now rather than on the first query (the warm-up calls this)."""
+    get_connection()
+
+
+def _ensure_schema(conn):
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            _create_schema(conn)
+            _schema_ready = True
+
+
+def _create_schema(conn):
+    # jobs_dal imports from this module, so it can only be imported once this one has loaded
+    from DAL import jobs_dal
+    with conn:
+        dedup_dal.create_tables(conn)
+        schedule_dal.create_tables(conn)
+        digest_dal.create_tables(conn)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS contacts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_email TEXT NOT NULL,
+                contact_email TEXT NOT NULL,
+                frequency INTEGER DEFAULT 1,
+                score REAL NOT NULL DEFAULT 0,
+                last_used REAL,
+                UNIQUE(user_email, contact_email)
+            )
+        ''')
+        _migrate_contacts(conn)
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_contacts_score ON contacts (user_email, score DESC, contact_email)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS processed_emails (
+                user_email TEXT NOT NULL,
+                gmail_thread TEXT NOT NULL,
+                snippet_hash TEXT NOT NULL,
+                PRIMARY KEY(user_email, gmail_thread, snippet_hash)
+            )
+        ''')
+        jobs_dal.create_tables(conn)
+
+
+def _migrate_contacts(conn):
+    """Add the ranking columns to a contacts table created before they existed."""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(contacts)')}
+    if "score" in columns:
+        return
+    conn.execute('ALTER TABLE contacts ADD COLUMN score REAL NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE contacts ADD COLUMN last_used REAL')
+    # No usage times were recorded, so treat every past use as happening at the epoch
+    conn.executemany('UPDATE contacts SET score = ? WHERE id = ?', [
+        (math.log(max(frequency or 1, 1)), row_id)
+        for row_id, frequency in conn.execute('SELECT id, frequency FROM contacts').fetchall()
+    ])
+
+
+# -------------------- CONTACT RANKING --------------------
+#
+# score = log(sum over uses of 2 ** ((used_at - epoch) / half_life)). Scaling every
+# term by the same decay factor doesn't change the order, so sorting by score is
+# sorting by recency-decayed frequency at any moment, and a stored score never
+# needs refreshing. A new use adds one term: score = logaddexp(score, weight).
+
+_SCORE_EPOCH = 1735689600  # 2025-01-01 UTC
+_DECAY_PER_SECOND = math.log(2) / (CONTACT_HALF_LIFE_DAYS * 86400)
+
+
+def _logaddexp(a, b):
+    if a is None:
+        return b
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(low - high))
+
+
+def _use_weight(now):
+    return (now - _SCORE_EPOCH) * _DECAY_PER_SECOND
+
+
+def _sort_key(scores):
+    return lambda email: (-scores[email], email)
+
+
+def _prefix_upper(prefix):
+    """Every string starting with prefix sorts in [prefix, _prefix_upper(prefix))."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class _ContactPrefixIndex:
+    """Ranked prefix lookups over one user's contacts.
+
+    Contacts are kept sorted by address, so any prefix is a bisect range.
+    Small ranges are ranked on the fly; every prefix (up to `depth`
+    characters) matching more than `scan_limit` contacts also keeps its
+    `top_k` best contacts in score order, like the nodes of a ranked trie.
+    Scores only ever go up, so a contact that falls out of a top list can
+    only come back through its own update, which keeps write-through
+    maintenance exact.
+    """
+
+    def __init__(self, rows, depth=CONTACT_INDEX_DEPTH, top_k=CONTACT_INDEX_TOP_K,
+                 scan_limit=CONTACT_INDEX_SCAN_LIMIT):
+        self.depth = depth
+        self.top_k = top_k
+        self.scan_limit = scan_limit
+        self.built_at = time.monotonic()
+        self.scores = dict(rows)
+        self.emails = sorted(self.scores)
+        self.counts = Counter(prefix for email in self.emails for prefix in self._prefixes(email))
+        self.top = {}
+        # rows arrive best first, so appending keeps every top list sorted
+        for email, _ in rows:
+            for prefix in self._prefixes(email):
+                if self.counts[prefix] > scan_limit:
+                    top = self.top.setdefault(prefix, [])
+                    if len(top) < top_k:
+                        top.append(email)
+
+    def _prefixes(self, email):
+        return [email[:i] for i in range(min(self.depth, len(email)) + 1)]
+
+    def _ranked(self, prefix, n):
+        lo = bisect_left(self.emails, prefix)
+        hi = bisect_left(self.emails, _prefix_upper(prefix)) if prefix else len(self.emails)
+        return heapq.nsmallest(n, self.emails[lo:hi], key=_sort_key(self.scores))
+
+    def update(self, email, score):
+        is_new = email not in self.scores
+        self.scores[email] = score
+        if is_new:
+            insort(self.emails, email)
+        key = _sort_key(self.scores)
+        for prefix in self._prefixes(email):
+            if is_new:
+                self.counts[prefix] += 1
+                if prefix not in self.top and self.counts[prefix] > self.scan_limit:
+                    self.top[prefix] = self._ranked(prefix, self.top_k)
+                    continue
+            top = self.top.get(prefix)
+            if top is None:
+                continue
+            if email in top:
+                top.sort(key=key)
+            elif key(email) < key(top[-1]):
+                top[-1] = email
+                top.sort(key=key)
+
+    def search(self, query, limit, offset=0):
+        """Return the page of matches, or None if it lies past what the index keeps."""
+        top = self.top.get(query)
+        if top is None:
+            return self._ranked(query, offset + limit)[offset:]
+        if offset + limit > self.top_k:
+            return None
+        return top[offset:offset + limit]
+
+
+_contact_indexes = OrderedDict()
+# Guards _contact_indexes and the indexes in it: readers search, the writer thread updates
+_contact_index_lock = threading.Lock()
+
+
+def _contact_index(user_email, conn):
+    """The user's prefix index, (re)built from the database when missing or stale (call with the lock held)."""
+    index = _contact_indexes.get(user_email)
+    if index is None or time.monotonic() - index.built_at > CONTACT_INDEX_TTL:
+        rows = conn.execute('''
+            SELECT contact_email, score FROM contacts
+            WHERE user_email = ?
+            ORDER BY score DESC, contact_email
+        ''', (user_email,)).fetchall()
+        index = _contact_indexes[user_email] = _ContactPrefixIndex(rows)
+    _contact_indexes.move_to_end(user_email)
+    while len(_contact_indexes) > CONTACT_INDEX_USERS:
+        _contact_indexes.popitem(last=False)
+    return index
+
+
 def save_contact(user_email, contact_email):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    try:
-        c.execute('''
-            INSERT INTO contacts (user_email, contact_email, frequency)
-            VALUES (?, ?, 1)
+    save_contacts(user_email, [contact_email])
+
+
+@metrics.stage("dal.save_contacts")
+def save_contacts(user_email, contact_emails, now=None):
+    """Upsert a list of contacts in one transaction, recording one use of each.
+
+    Returns the (contact_email, score) pairs it wrote.
+    """
+    user_email = user_email.lower()
+    emails = [contact_email.lower() for contact_email in contact_emails]
+    if not emails:
+        return []
+    now = time.time() if now is None else now
+    weight = _use_weight(now)
+    conn = get_connection()
+    with conn:
+        updated = [conn.execute('''
+            INSERT INTO contacts (user_email, contact_email, frequency, score, last_used)
+            VALUES (?, ?, 1, ?, ?)
             ON CONFLICT(user_email, contact_email)
-            DO UPDATE SET frequency = frequency + 1
-        ''', (user_email.lower(), contact_email.lower()))
-        conn.commit()
-    finally:
-        conn.close()
+            DO UPDATE SET frequency = frequency + 1,
+                          score = logaddexp(score, excluded.score),
+                          last_used = excluded.last_used
+            RETURNING contact_email, score
+        ''', (user_email, email, weight, now)).fetchone() for email in emails]
+    apply_contact_scores(user_email, updated)
+    return updated
+
+
+def apply_contact_scores(user_email, updated):
+    """Write (contact_email, score) updates through to the user's index if it is loaded.
+
+    An index that isn't loaded yet reads the new rows when it is built.
+    """
+    with _contact_index_lock:
+        index = _contact_indexes.get(user_email.lower())
+        if index is not None:
+            for email, score in updated:
+                index.update(email, score)
 
 
 def get_suggested_contacts(user_email, limit=None):
@@ -110,16 +475,13 @@ def get_suggested_contacts(user_email, limit=None):
         limit: Maximum number of contacts to return (None for all contacts)
     
     Returns:
-        List of contact emails (or email/name tuples if selected)
+        List of contact emails, best ranked first
     """
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
     query = '''
         SELECT contact_email
         FROM contacts
         WHERE user_email = ?
-        ORDER BY frequency DESC
+        ORDER BY score DESC, contact_email
     '''
     
     params = (user_email.lower(),)
@@ -128,50 +490,223 @@ def get_suggested_contacts(user_email, limit=None):
         query += ' LIMIT ?'
         params += (limit,)
     
-    c.execute(query, params)
-    results = c.fetchall()
-    conn.close()
+    results = get_connection().execute(query, params).fetchall()
     
     # Return list of emails (unwrap single-element tuples)
     return [row[0] for row in results]
 
 
+@metrics.stage("dal.search_contacts")
+def search_contacts(user_email, query="", limit=20, offset=0, use_index=CONTACT_INDEX_ENABLED):
+    """Contacts whose address starts with `query`, best ranked first, one page at a time.
+
+    Served from the user's in-memory prefix index when enabled; pages beyond
+    what the index keeps fall back to a range scan on the (user_email,
+    contact_email) unique index.
+    """
+    user_email = user_email.lower()
+    query = query.strip().lower()
+    conn = get_connection()
+    if use_index:
+        with _contact_index_lock:
+            page = _contact_index(user_email, conn).search(query, limit, offset)
+        if page is not None:
+            return page
+    if query:
+        prefix_filter = 'AND contact_email >= ? AND contact_email < ?'
+        params = (user_email, query, _prefix_upper(query), limit, offset)
+    else:
+        prefix_filter = ''
+        params = (user_email, limit, offset)
+    rows = conn.execute(f'''
+        SELECT contact_email FROM contacts
+        WHERE user_email = ? {prefix_filter}
+        ORDER BY score DESC, contact_email
+        LIMIT ? OFFSET ?
+    ''', params).fetchall()
+    return [row[0] for row in rows]
+
 
 def save_event(user_email, raw_subject, sender):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    try:
-        c.execute('''
-            INSERT OR IGNORE INTO events (user_email, raw_subject, sender)
-            VALUES (?, ?, ?)
-        ''', (user_email.strip().lower(), raw_subject.strip().lower(), sender.strip().lower()))
-        conn.commit()
-    finally:
-        conn.close()
-        
+    remove_duplicates(user_email, [{"raw_subject": raw_subject, "sender": sender}])
 
 
 def event_seen(user_email, raw_subject, sender):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        SELECT 1 FROM events
-        WHERE user_email = ? AND raw_subject = ? AND sender = ?
-    ''', (user_email.strip().lower(), raw_subject.strip().lower(), sender.strip().lower()))
-    result = c.fetchone()
-    conn.close()
+    result = get_connection().execute('''
+        SELECT 1 FROM event_fingerprints
+        WHERE user_email = ? AND norm_key = ?
+    ''', (user_email.strip().lower(), dedup_dal.normalize_key(raw_subject, sender))).fetchone()
     return result is not None
 
 
-def remove_duplicates(user_email, events):
-    unique_events = []
-    for event in events:
-        if not event_seen(user_email, event['raw_subject'], event['sender']):
-            save_event(user_email, event['raw_subject'], event['sender'])
-            unique_events.append(event)
-        else:
-            print(f"Duplicate found and removed: {event['raw_subject']} from {event['sender']}")
+@metrics.stage("dal.remove_duplicates")
+def remove_duplicates(user_email, events, user_timezone=None):
+    """Store the events that aren't (near-)duplicates of stored ones and return them, in order.
+
+    One candidate lookup and one insert per batch; see dedup_dal for the rules.
+    The new events join the user's daily digest. With `user_timezone`, their
+    times also go into the user's interval store for availability checks.
+    Also sweeps out expired fingerprints and intervals now and then.
+    """
+    conn = get_connection()
+    with conn:
+        unique_events = _new_events(conn, user_email, events, user_timezone)
+        _sweep(conn)
+    return unique_events
+
+
+@metrics.stage("dal.remove_duplicates_many")
+def remove_duplicates_many(calls):
+    """remove_duplicates for several (user_email, events, user_timezone) calls, committed together.
+
+    Returns one result per call: its new events, or the exception it raised.
+    If any call fails the group is rolled back and each call is retried on
+    its own, so only the failing one's changes are lost.
+    """
+    conn = get_connection()
+    try:
+        with conn:
+            results = [_new_events(conn, user_email, events, user_timezone)
+                       for user_email, events, user_timezone in calls]
+            _sweep(conn)
+        return results
+    except Exception:
+        logger.warning("Grouped dedup write failed; retrying its calls one at a time", exc_info=True)
+    results = []
+    for call in calls:
+        try:
+            results.append(remove_duplicates(*call))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _sweep(conn):
+    """Expired fingerprints and intervals, now and then, in the caller's transaction."""
+    dedup_dal.sweep(conn)
+    schedule_dal.sweep(conn)
+
+
+def _new_events(conn, user_email, events, user_timezone=None):
+    """remove_duplicates inside the caller's transaction."""
+    unique_events = dedup_dal.new_events(conn, user_email, events)
+    item_ids = digest_dal.add(conn, user_email, unique_events, user_timezone or DEFAULT_TIMEZONE)
+    if user_timezone is not None:
+        schedule_dal.store(conn, user_email, unique_events, user_timezone, item_ids)
+    duplicates = len(events) - len(unique_events)
+    DEDUP_EVENTS.inc(len(unique_events), result="new")
+    DEDUP_EVENTS.inc(duplicates, result="duplicate")
+    if duplicates:
+        logger.debug("Duplicate events removed", extra={"duplicates": duplicates, "kept": len(unique_events)})
     return unique_events
 
 
-init_db()
+@metrics.stage("dal.overlapping_events")
+def overlapping_events(user_email, start_ts, end_ts, use_index=schedule_dal.SCHEDULE_INDEX_ENABLED):
+    """Stored events overlapping [start_ts, end_ts), as (start_ts, end_ts, all_day, id, title, gmail_thread) rows.
+
+    Served from the user's in-memory interval index when enabled, otherwise
+    from range scans on the (user_email, start_ts, end_ts) index.
+    """
+    return schedule_dal.overlapping(get_connection(), user_email, start_ts, end_ts, use_index)
+
+
+@metrics.stage("dal.free_slots")
+def free_slots(user_email, start_ts, end_ts, min_seconds=1800, include_all_day=False,
+               use_index=schedule_dal.SCHEDULE_INDEX_ENABLED):
+    """(busy rows, free (start_ts, end_ts) gaps of at least `min_seconds`) in [start_ts, end_ts).
+
+    All-day events (deadlines, conferences spanning days) don't block time unless `include_all_day`.
+    """
+    busy = [row for row in overlapping_events(user_email, start_ts, end_ts, use_index)
+            if include_all_day or not row[2]]
+    return busy, schedule_dal.free_slots(busy, start_ts, end_ts, min_seconds)
+
+
+@metrics.stage("dal.set_digest_status")
+def set_digest_status(user_email, item_id, status):
+    """Confirm or dismiss a digest item, marking its day stale. Returns {"id", "status", "day"}, or None if not found.
+
+    A dismissed item's interval leaves the availability store in the same
+    transaction, and returns if the item is confirmed again.
+    """
+    conn = get_connection()
+    with conn:
+        before = digest_dal.get_item(conn, user_email, item_id)
+        item = digest_dal.set_status(conn, user_email, item_id, status)
+        if item is None:
+            return None
+        if status == digest_dal.DISMISSED:
+            schedule_dal.remove_items(conn, user_email, [item_id])
+        elif before[0] == digest_dal.DISMISSED and schedule_dal.has_intervals(conn, user_email):
+            schedule_dal.store(conn, user_email, [before[1]], before[2], [item_id])
+        return item
+
+
+@metrics.stage("dal.render_digest")
+def render_digest(user_email, first_day, last_day):
+    """Render the user's stale digest days in [first_day, last_day]. Returns how many there were."""
+    conn = get_connection()
+    with conn:
+        return digest_dal.render_stale(conn, user_email, first_day, last_day)
+
+
+@metrics.stage("dal.precompute_digests")
+def precompute_digests(user_timezone, days):
+    """Re-render the next `days` days of every digest in `user_timezone`. Returns how many digests changed."""
+    conn = get_connection()
+    with conn:
+        return digest_dal.precompute(conn, user_timezone,
+                                     digest_dal.day_range(digest_dal.local_day(user_timezone), days))
+
+
+def digest_version(user_email):
+    return digest_dal.version(get_connection(), user_email)
+
+
+def digest_timezones():
+    return digest_dal.timezones(get_connection())
+
+
+@metrics.stage("dal.get_digest")
+def get_digest(user_email, first_day, last_day):
+    """(version, {YYYYMMDD: rendered items JSON}, stale) of the user's digest days in [first_day, last_day]."""
+    return digest_dal.read(get_connection(), user_email, first_day, last_day)
+
+
+def filter_processed_emails(user_email, emails):
+    """Drop emails whose (gmailThread, snippet) was already extracted for this user.
+
+    Emails without a gmailThread are always kept. Returns (new_emails, skipped).
+    """
+    keys = [email_key(email) for email in emails]
+    threads = list({thread for thread, _ in keys if thread})
+    seen = set()
+    conn = get_connection()
+    for batch in _batches(threads):
+        placeholders = ", ".join("?" * len(batch))
+        seen.update(conn.execute(f'''
+            SELECT gmail_thread, snippet_hash FROM processed_emails
+            WHERE user_email = ? AND gmail_thread IN ({placeholders})
+        ''', [user_email.strip().lower(), *batch]).fetchall())
+    new_emails = [email for email, key in zip(emails, keys) if key not in seen]
+    return new_emails, len(emails) - len(new_emails)
+
+
+@metrics.stage("dal.mark_emails_processed")
+def mark_emails_processed(user_email, emails):
+    """Record emails as extracted so later scans of the same inbox skip them."""
+    conn = get_connection()
+    with conn:
+        _mark_processed(conn, user_email, emails)
+
+
+def _mark_processed(conn, user_email, emails):
+    """mark_emails_processed inside the caller's transaction."""
+    rows = [(user_email.strip().lower(), *email_key(email)) for email in emails]
+    rows = [row for row in rows if row[1]]
+    if rows:
+        conn.executemany('''
+            INSERT OR IGNORE INTO processed_emails (user_email, gmail_thread, snippet_hash)
+            VALUES (?, ?, ?)
+        ''', rows)
@@ -0,0 +1,218 @@
+# jobs_dal.py (background inbox ingestion jobs)
+#
+# A job stores its emails until a worker plans it into chunks; from then on
+# every chunk is a row whose result is committed together with the events it
+# deduplicated and the emails it marked processed. A restarted worker only
+# has to pick up the chunks that are still pending.
+import json
+import time
+import uuid
+
+from DAL.gmail_dal import _mark_processed, _new_events, get_connection
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_DONE, JOB_FAILED)
+
+_JOB_COLUMNS = ("id", "user_email", "user_timezone", "extraction_mode", "status", "total_emails",
+                "total_chunks", "done_chunks", "failed_chunks", "total_events", "skipped_emails",
+                "filtered_emails", "error", "created_at", "updated_at")
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            user_timezone TEXT NOT NULL,
+            extraction_mode TEXT NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT,
+            total_emails INTEGER NOT NULL,
+            total_chunks INTEGER NOT NULL DEFAULT 0,
+            done_chunks INTEGER NOT NULL DEFAULT 0,
+            failed_chunks INTEGER NOT NULL DEFAULT 0,
+            total_events INTEGER NOT NULL DEFAULT 0,
+            skipped_emails INTEGER NOT NULL DEFAULT 0,
+            filtered_emails INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_chunks (
+            job_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            blocks TEXT NOT NULL,
+            emails TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            seq INTEGER,
+            events TEXT,
+            error TEXT,
+            PRIMARY KEY (job_id, idx)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_job_chunks_seq ON job_chunks (job_id, seq)')
+    # Chunks holding a piece of an email split over several chunks, until each is done;
+    # the email is marked processed by the chunk that removes its last row
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_split_emails (
+            job_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            gmail_thread TEXT NOT NULL,
+            PRIMARY KEY (job_id, idx, gmail_thread)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _job_dict(row):
+    return dict(zip(_JOB_COLUMNS, row)) if row else None
+
+
+def create_job(user_email, user_timezone, emails, extraction_mode):
+    """Store a new job with its emails and return its id."""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO jobs (id, user_email, user_timezone, extraction_mode, status, payload,
+                              total_emails, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, user_email, user_timezone, extraction_mode, JOB_QUEUED, json.dumps(emails),
+              len(emails), now, now))
+    return job_id
+
+
+def get_job(job_id):
+    row = get_connection().execute(
+        f'SELECT {", ".join(_JOB_COLUMNS)} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return _job_dict(row)
+
+
+def get_job_payload(job_id):
+    """The emails of a job that hasn't been planned yet (None once it has)."""
+    row = get_connection().execute('SELECT payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return json.loads(row[0]) if row and row[0] is not None else None
+
+
+def unfinished_jobs():
+    """Ids of jobs to resume, oldest first."""
+    rows = get_connection().execute('''
+        SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at
+    ''', (JOB_QUEUED, JOB_RUNNING)).fetchall()
+    return [row[0] for row in rows]
+
+
+def plan_job(job_id, chunks, block_stats):
+    """Replace a job's emails with its chunks: a list of (blocks, emails, prompt_tokens).
+
+    An email split over several chunks is listed in each of them.
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO job_chunks (job_id, idx, blocks, emails, prompt_tokens)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(job_id, idx, json.dumps(blocks), json.dumps(emails), tokens)
+              for idx, (blocks, emails, tokens) in enumerate(chunks)])
+        holders = {}
+        for idx, (_, emails, _) in enumerate(chunks):
+            for thread in {email.get("gmailThread", "") for email in emails}:
+                holders.setdefault(thread, []).append(idx)
+        conn.execute('DELETE FROM job_split_emails WHERE job_id = ?', (job_id,))
+        conn.executemany('INSERT INTO job_split_emails (job_id, idx, gmail_thread) VALUES (?, ?, ?)',
+                         [(job_id, idx, thread) for thread, idxs in holders.items() if len(idxs) > 1 for idx in idxs])
+        conn.execute('''
+            UPDATE jobs SET status = ?, payload = NULL, total_chunks = ?, skipped_emails = ?,
+                            filtered_emails = ?, updated_at = ?
+            WHERE id = ?
+        ''', (JOB_RUNNING if chunks else JOB_DONE, len(chunks), block_stats["skipped_emails"],
+              block_stats["filtered_emails"], time.time(), job_id))
+
+
+def pending_chunks(job_id):
+    rows = get_connection().execute('''
+        SELECT idx FROM job_chunks WHERE job_id = ? AND status = 'pending' ORDER BY idx
+    ''', (job_id,)).fetchall()
+    return [row[0] for row in rows]
+
+
+def get_job_chunk(job_id, idx):
+    """(blocks, prompt_tokens) of one chunk."""
+    blocks, tokens = get_connection().execute('''
+        SELECT blocks, prompt_tokens FROM job_chunks WHERE job_id = ? AND idx = ?
+    ''', (job_id, idx)).fetchone()
+    return json.loads(blocks), tokens
+
+
+def complete_job_chunk(job_id, user_email, idx, events=None, error=None):
+    """Record a chunk's outcome, deduplicating its events and marking its emails processed.
+
+    Everything happens in one transaction, so a crash either keeps the chunk
+    pending (and it is redone) or records it completely. Returns the new events.
+    """
+    conn = get_connection()
+    with conn:
+        row = conn.execute('''
+            SELECT c.status, c.emails, j.user_timezone FROM job_chunks c JOIN jobs j ON j.id = c.job_id
+            WHERE c.job_id = ? AND c.idx = ?
+        ''', (job_id, idx)).fetchone()
+        if row is None or row[0] != 'pending':
+            return []
+        new_events = []
+        if error is None:
+            new_events = _new_events(conn, user_email, events, row[2])
+            conn.execute('DELETE FROM job_split_emails WHERE job_id = ? AND idx = ?', (job_id, idx))
+            # Emails with a piece in a chunk not done yet (or failed) wait for it
+            waiting = {thread for thread, in conn.execute(
+                'SELECT gmail_thread FROM job_split_emails WHERE job_id = ?', (job_id,))}
+            _mark_processed(conn, user_email,
+                            [email for email in json.loads(row[1]) if email.get("gmailThread", "") not in waiting])
+        done, failed = (1, 0) if error is None else (0, 1)
+        # The n-th chunk to finish gets seq n, so clients can resume reading results after it
+        seq, total = conn.execute('''
+            UPDATE jobs SET done_chunks = done_chunks + ?, failed_chunks = failed_chunks + ?,
+                            total_events = total_events + ?, updated_at = ?
+            WHERE id = ?
+            RETURNING done_chunks + failed_chunks, total_chunks
+        ''', (done, failed, len(new_events), time.time(), job_id)).fetchone()
+        # A done chunk's email text isn't needed again; a failed one keeps it for inspection
+        conn.execute('''
+            UPDATE job_chunks SET status = ?, seq = ?, events = ?, error = ?,
+                                  blocks = CASE WHEN ? IS NULL THEN '[]' ELSE blocks END
+            WHERE job_id = ? AND idx = ?
+        ''', ('done' if error is None else 'failed', seq, json.dumps(new_events), error, error, job_id, idx))
+        if seq == total:
+            conn.execute('UPDATE jobs SET status = ? WHERE id = ?', (JOB_DONE, job_id))
+    return new_events
+
+
+def fail_job(job_id, error):
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?
+        ''', (JOB_FAILED, error, time.time(), job_id))
+
+
+def job_results(job_id, after_seq=0, limit=100):
+    """Finished chunks in completion order, starting after `after_seq`."""
+    rows = get_connection().execute('''
+        SELECT seq, idx, status, events, error FROM job_chunks
+        WHERE job_id = ? AND seq > ?
+        ORDER BY seq
+        LIMIT ?
+    ''', (job_id, after_seq, limit)).fetchall()
+    return [{
+        "seq": seq,
+        "chunk_index": idx,
+        "new_events": json.loads(events or "[]"),
+        **({"error": error} if status == 'failed' else {}),
+    } for seq, idx, status, events, error in rows]
@@ -0,0 +1,280 @@
+# schedule_dal.py (interval store behind availability and conflict checks)
+#
+# Every new extracted event with a date is stored as a [start_ts, end_ts)
+# interval in epoch seconds. Overlap queries ("which events overlap X") and
+# free-slot queries ("free time between A and B") then never scan a user's
+# whole history:
+#   - events up to LONG_EVENT_SECONDS long overlap [a, b) only if they start
+#     in [a - LONG_EVENT_SECONDS, b), a range of the sorted starts;
+#   - longer (multi-day) events are rare and kept in arrays of their own,
+#     searched the same way with the longest such event's span.
+# So a query reads O(log n + k) rows plus the other events of about one day.
+#
+# Each process keeps per-user sorted arrays of the intervals. interval_heads
+# holds the last interval id stored for each user, so an index catches up
+# with rows written by any process (the writer process included) by reading
+# only that user's rows after its own last id. Deleting a user's intervals
+# bumps their generation there instead, and an index from an older
+# generation is rebuilt. The (user_email, start_ts, end_ts) index serves the
+# same range queries straight from SQLite.
+#
+# An interval goes when its digest item (item_id) is dismissed, and comes back
+# if the item is confirmed again. Intervals that ended more than
+# SCHEDULE_RETENTION_DAYS ago are swept out in bounded batches, like dedup's
+# fingerprints.
+#
+# Functions that take a connection run inside the caller's transaction.
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from Utils.time_normalizer import event_interval
+
+LONG_EVENT_SECONDS = 86400
+SCHEDULE_INDEX_ENABLED = os.getenv("SCHEDULE_INDEX", "1") == "1"
+SCHEDULE_INDEX_USERS = int(os.getenv("SCHEDULE_INDEX_USERS", "64"))
+SCHEDULE_RETENTION_DAYS = float(os.getenv("SCHEDULE_RETENTION_DAYS", "180"))
+SCHEDULE_SWEEP_INTERVAL = float(os.getenv("SCHEDULE_SWEEP_INTERVAL", "3600"))
+SCHEDULE_SWEEP_BATCH = int(os.getenv("SCHEDULE_SWEEP_BATCH", "5000"))
+
+# (start_ts, end_ts, all_day, id, title, gmail_thread)
+_ROW_COLUMNS = "start_ts, end_ts, all_day, id, title, gmail_thread"
+
+# Item ids per DELETE, under SQLite's 999-parameter limit
+_DELETE_BATCH = 500
+
+_last_sweep = 0.0
+
+
+def create_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS event_intervals (
+            id INTEGER PRIMARY KEY,
+            user_email TEXT NOT NULL,
+            start_ts INTEGER NOT NULL,
+            end_ts INTEGER NOT NULL,
+            all_day INTEGER NOT NULL,
+            is_long INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            gmail_thread TEXT NOT NULL,
+            item_id INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS interval_heads (
+            user_email TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    _migrate_intervals(conn)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_intervals_span ON event_intervals (user_email, start_ts, end_ts)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_intervals_long ON event_intervals (user_email, start_ts) '
+                 'WHERE is_long = 1')
+    # Catch-up reads one user's rows after an id; the rowid ends every index, so (user_email) orders by id
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_intervals_user ON event_intervals (user_email)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_intervals_item ON event_intervals (item_id) '
+                 'WHERE item_id IS NOT NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_event_intervals_end ON event_intervals (end_ts)')
+
+
+def _migrate_intervals(conn):
+    """Add the item link and the generation to tables created before they existed."""
+    if "item_id" not in {row[1] for row in conn.execute('PRAGMA table_info(event_intervals)')}:
+        conn.execute('ALTER TABLE event_intervals ADD COLUMN item_id INTEGER')
+    if "generation" not in {row[1] for row in conn.execute('PRAGMA table_info(interval_heads)')}:
+        conn.execute('ALTER TABLE interval_heads ADD COLUMN generation INTEGER NOT NULL DEFAULT 0')
+
+
+def store(conn, user_email, events, user_timezone, item_ids=None):
+    """Store the intervals of the events that have a date. Returns how many were stored.
+
+    `item_ids` are the events' digest item ids, so dismissing an item can remove its interval.
+    """
+    user_email = user_email.strip().lower()
+    rows = []
+    for event, item_id in zip(events, item_ids or [None] * len(events)):
+        interval = event_interval(event, user_timezone)
+        if interval is None:
+            continue
+        start_ts, end_ts, all_day = interval
+        rows.append((user_email, start_ts, end_ts, int(all_day), int(end_ts - start_ts > LONG_EVENT_SECONDS),
+                     event.get("event") or event.get("title") or "", event.get("gmailThread") or "", item_id))
+    if not rows:
+        return 0
+    conn.executemany('''
+        INSERT INTO event_intervals (user_email, start_ts, end_ts, all_day, is_long, title, gmail_thread, item_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    # New rows take ids above every stored one, so the last is this user's highest
+    conn.execute('''
+        INSERT INTO interval_heads (user_email, last_id) VALUES (?, last_insert_rowid())
+        ON CONFLICT(user_email) DO UPDATE SET last_id = excluded.last_id
+    ''', (user_email,))
+    return len(rows)
+
+
+def has_intervals(conn, user_email):
+    """Whether the user's events have ever been stored here (with a timezone)."""
+    return conn.execute('SELECT 1 FROM interval_heads WHERE user_email = ?',
+                        (user_email.strip().lower(),)).fetchone() is not None
+
+
+def _bump_generations(conn, users):
+    conn.executemany('UPDATE interval_heads SET generation = generation + 1 WHERE user_email = ?',
+                     [(user,) for user in users])
+
+
+def remove_items(conn, user_email, item_ids):
+    """Delete the intervals of the user's digest items `item_ids`. Returns how many were deleted."""
+    user_email = user_email.strip().lower()
+    item_ids = list(item_ids)
+    deleted = 0
+    for start in range(0, len(item_ids), _DELETE_BATCH):
+        batch = item_ids[start:start + _DELETE_BATCH]
+        deleted += conn.execute(f'''
+            DELETE FROM event_intervals WHERE item_id IN ({", ".join("?" * len(batch))}) AND user_email = ?
+        ''', [*batch, user_email]).rowcount
+    if deleted:
+        _bump_generations(conn, [user_email])
+    return deleted
+
+
+def sweep(conn, now=None, force=False):
+    """Delete one batch of intervals that ended SCHEDULE_RETENTION_DAYS ago, at most every SCHEDULE_SWEEP_INTERVAL.
+
+    Returns the number of rows deleted. A full batch leaves the next call free to sweep again.
+    """
+    global _last_sweep
+    now = time.time() if now is None else now
+    if not force and now - _last_sweep < SCHEDULE_SWEEP_INTERVAL:
+        return 0
+    users = [row[0] for row in conn.execute('''
+        DELETE FROM event_intervals WHERE id IN (
+            SELECT id FROM event_intervals WHERE end_ts < ? LIMIT ?
+        )
+        RETURNING user_email
+    ''', (now - SCHEDULE_RETENTION_DAYS * 86400, SCHEDULE_SWEEP_BATCH)).fetchall()]
+    _bump_generations(conn, set(users))
+    if len(users) < SCHEDULE_SWEEP_BATCH:
+        _last_sweep = now
+    return len(users)
+
+
+# -------------------- QUERIES --------------------
+
+def free_slots(busy, start, end, min_seconds):
+    """Gaps of at least `min_seconds` in [start, end) between the (start_ts, end_ts, ...) rows of `busy`."""
+    slots = []
+    cursor = start
+    for row in sorted(busy):
+        if row[0] - cursor >= min_seconds:
+            slots.append((cursor, row[0]))
+        cursor = max(cursor, row[1])
+        if cursor >= end:
+            return slots
+    if end - cursor >= min_seconds:
+        slots.append((cursor, end))
+    return slots
+
+
+def overlapping_sql(conn, user_email, start, end):
+    """Rows overlapping [start, end), from the SQLite indexes, in start order."""
+    return conn.execute(f'''
+        SELECT {_ROW_COLUMNS} FROM event_intervals
+        WHERE user_email = ? AND start_ts >= ? AND start_ts < ? AND end_ts > ? AND is_long = 0
+        UNION ALL
+        SELECT {_ROW_COLUMNS} FROM event_intervals
+        WHERE user_email = ? AND is_long = 1 AND start_ts < ? AND end_ts > ?
+        ORDER BY start_ts, end_ts, all_day, id
+    ''', (user_email, start - LONG_EVENT_SECONDS, end, start, user_email, end, start)).fetchall()
+
+
+class _SortedIntervals:
+    """Intervals sorted by start; holds the span of the longest one to bound searches."""
+
+    def __init__(self):
+        self.rows = []
+        self.starts = []
+        self.max_span = 0
+
+    def add(self, rows):
+        if not rows:
+            return
+        self.max_span = max(self.max_span, *(row[1] - row[0] for row in rows))
+        if len(rows) > 64:
+            self.rows.extend(rows)
+            self.rows.sort()
+            self.starts = [row[0] for row in self.rows]
+            return
+        for row in rows:
+            i = bisect_left(self.rows, row)
+            self.rows.insert(i, row)
+            self.starts.insert(i, row[0])
+
+    def overlapping(self, start, end):
+        lo = bisect_left(self.starts, start - self.max_span)
+        hi = bisect_left(self.starts, end)
+        return [row for row in self.rows[lo:hi] if row[1] > start]
+
+
+class _IntervalIndex:
+    """One user's intervals, with long events kept apart so they don't widen every search."""
+
+    def __init__(self, rows, last_id, generation):
+        self.short = _SortedIntervals()
+        self.long = _SortedIntervals()
+        self.last_id = last_id
+        self.generation = generation
+        self.add(rows)
+
+    def add(self, rows):
+        self.short.add([row for row in rows if row[1] - row[0] <= LONG_EVENT_SECONDS])
+        self.long.add([row for row in rows if row[1] - row[0] > LONG_EVENT_SECONDS])
+
+    def overlapping(self, start, end):
+        found = self.short.overlapping(start, end)
+        for row in self.long.overlapping(start, end):
+            insort(found, row)
+        return found
+
+
+_indexes = OrderedDict()
+# Guards _indexes and the indexes in it; reads run on several threads
+_index_lock = threading.Lock()
+
+
+def _index(conn, user_email):
+    """The user's index, built on first use and brought up to date with rows stored since (call with the lock held).
+
+    Rebuilt from scratch after any of the user's intervals were deleted.
+    """
+    row = conn.execute('SELECT last_id, generation FROM interval_heads WHERE user_email = ?',
+                       (user_email,)).fetchone()
+    head, generation = row if row else (0, 0)
+    index = _indexes.get(user_email)
+    if index is None or index.generation != generation:
+        rows = conn.execute(f'SELECT {_ROW_COLUMNS} FROM event_intervals WHERE user_email = ? AND id <= ?',
+                            (user_email, head)).fetchall()
+        index = _indexes[user_email] = _IntervalIndex(rows, head, generation)
+    elif head > index.last_id:
+        index.add(conn.execute(f'''
+            SELECT {_ROW_COLUMNS} FROM event_intervals INDEXED BY idx_event_intervals_user
+            WHERE user_email = ? AND id > ? AND id <= ?
+        ''', (user_email, index.last_id, head)).fetchall())
+        index.last_id = head
+    _indexes.move_to_end(user_email)
+    while len(_indexes) > SCHEDULE_INDEX_USERS:
+        _indexes.popitem(last=False)
+    return index
+
+
+def overlapping(conn, user_email, start, end, use_index=SCHEDULE_INDEX_ENABLED):
+    """Rows (start_ts, end_ts, all_day, id, title, gmail_thread) overlapping [start, end), in start order."""
+    user_email = user_email.strip().lower()
+    if not use_index:
+        return overlapping_sql(conn, user_email, start, end)
+    with _index_lock:
+        return _index(conn, user_email).overlapping(start, end)
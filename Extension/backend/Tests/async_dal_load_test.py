@@ -0,0 +1,96 @@
+"""Show that concurrent /parse-style streams no longer serialize on SQLite writes.
+
+Each simulated stream waits on a fake LLM call and then dedups the chunk's
+events, exactly like gmail_view.generate_events. A heartbeat task measures
+how long the event loop is blocked. With the sync DAL every write stalls all
+streams; with the async DAL the loop stays responsive, and writes that queue
+up behind each other share one commit.
+
+Each mode runs `repeats` times, alternating, and the medians are compared.
+The script fails unless the async DAL's wall time is at most the sync DAL's
+and its loop lag p99 is lower.
+
+Run from the backend directory:
+    python -m Tests.async_dal_load_test [streams] [chunks_per_stream] [events_per_chunk] [repeats]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="async_dal_load_")
+os.environ["EVENTS_DB"] = os.path.join(_tmpdir, "events.db")
+# fsync on every commit, so the cost of blocking on disk is visible
+os.environ.setdefault("EVENTS_DB_SYNCHRONOUS", "FULL")
+
+from DAL import gmail_dal  # noqa: E402  (EVENTS_DB must be set first)
+from DAL.async_dal import remove_duplicates_async  # noqa: E402
+
+LLM_LATENCY = 0.05
+
+
+def chunk_events(stream, chunk, n):
+    return [{"raw_subject": f"s{stream}-c{chunk}-e{i}", "sender": "load@example.com"} for i in range(n)]
+
+
+async def heartbeat(stop, lags, interval=0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def stream(idx, chunks, per_chunk, use_async):
+    user = f"user{idx}@example.com"
+    start = time.perf_counter()
+    for chunk in range(chunks):
+        await asyncio.sleep(LLM_LATENCY)
+        events = chunk_events(idx, chunk, per_chunk)
+        if use_async:
+            await remove_duplicates_async(user, events)
+        else:
+            gmail_dal.remove_duplicates(user, events)
+    return time.perf_counter() - start
+
+
+async def run(streams, chunks, per_chunk, use_async):
+    conn = gmail_dal.get_connection()
+    # Both runs start from the same empty tables
+    with conn:
+        for table in ('event_fingerprints', 'event_intervals', 'digest_items', 'digest_stale', 'digest_heads'):
+            conn.execute(f'DELETE FROM {table}')
+    stop, lags = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    start = time.perf_counter()
+    durations = await asyncio.gather(*(stream(i, chunks, per_chunk, use_async) for i in range(streams)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await beat
+    lags.sort()
+    lag_p99 = lags[int(len(lags) * 0.99) - 1]
+    label = "async DAL" if use_async else "sync DAL"
+    print(f"{label:<10} streams={streams} wall={wall:6.2f}s "
+          f"stream p50={statistics.median(durations):6.2f}s "
+          f"loop lag p99={lag_p99 * 1000:7.2f}ms max={lags[-1] * 1000:7.2f}ms")
+    return wall, lag_p99
+
+
+def main():
+    streams, chunks, per_chunk, repeats = ([int(a) for a in sys.argv[1:5]] + [50, 20, 40, 3][len(sys.argv[1:5]):])
+    results = {False: [], True: []}
+    for _ in range(repeats):
+        for use_async in (False, True):
+            results[use_async].append(asyncio.run(run(streams, chunks, per_chunk, use_async)))
+    (sync_wall, sync_lag), (async_wall, async_lag) = (
+        [statistics.median(values) for values in zip(*results[use_async])] for use_async in (False, True))
+    ok = async_wall <= sync_wall and async_lag < sync_lag
+    print(f"{'ok  ' if ok else 'FAIL'} median wall async {async_wall:.2f}s vs sync {sync_wall:.2f}s, "
+          f"loop lag p99 async {async_lag * 1000:.2f}ms vs sync {sync_lag * 1000:.2f}ms")
+    if not ok:
+        sys.exit("the async DAL is not ahead of the sync DAL")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Conflict and free-slot lookups for a user with a large event history.
+
+Stores `n_events` events for one user (plus other users' events around them)
+over three years: mostly 30-120 minute meetings, some all-day deadlines and
+a few multi-day conferences. Every overlap query is checked against a linear
+scan, through both the in-memory interval index and the SQLite range
+queries. Then it times:
+  - 1-hour conflict checks and 1-week free-slot searches on each path
+  - the linear scan the index replaces
+  - building the index, and catching up after new events are stored while
+    other users store many more
+Then it dismisses some items and sweeps out the oldest intervals, and checks
+both paths against a linear scan again.
+
+Run from the backend directory:
+    python -m Tests.availability_benchmark [n_events] [n_queries]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from DAL import schedule_dal
+
+USER = "bench@example.edu"
+USER_TIMEZONE = "America/New_York"
+START = datetime(2024, 1, 1)
+DAYS = 3 * 365
+
+
+def event(rng, i):
+    day = START + timedelta(days=rng.randrange(DAYS))
+    kind = rng.random()
+    if kind < 0.02:
+        iso = f"{day:%Y-%m-%d}"
+    elif kind < 0.025:
+        iso = f"{day:%Y-%m-%d}/{day + timedelta(days=rng.randrange(2, 5)):%Y-%m-%d}"
+    else:
+        start = day + timedelta(hours=rng.randrange(8, 20), minutes=rng.choice((0, 15, 30, 45)))
+        iso = f"{start:%Y-%m-%dT%H:%M}/{start + timedelta(minutes=rng.choice((30, 45, 60, 90, 120))):%Y-%m-%dT%H:%M}"
+    return {"event": f"Event {i}", "time": {"iso": iso}, "gmailThread": f"thread{i:06d}"}
+
+
+def linear(rows, start, end):
+    return sorted(row for row in rows if row[0] < end and row[1] > start)
+
+
+def percentiles(fn, windows):
+    times = []
+    for start, end in windows:
+        began = time.perf_counter()
+        fn(start, end)
+        times.append(time.perf_counter() - began)
+    times.sort()
+    return times[len(times) // 2] * 1000, times[int(len(times) * 0.99)] * 1000
+
+
+def main(n, n_queries):
+    rng = random.Random(0)
+    conn = sqlite3.connect(os.path.join(tempfile.mkdtemp(prefix="availability_bench_"), "events.db"))
+    with conn:
+        schedule_dal.create_tables(conn)
+        for user, count in ((USER, n), ("other1@example.edu", n // 5), ("other2@example.edu", n // 5)):
+            events = [event(rng, i) for i in range(count)]
+            for i in range(0, count, 5000):
+                schedule_dal.store(conn, user, events[i:i + 5000], USER_TIMEZONE)
+    rows = conn.execute(f'SELECT {schedule_dal._ROW_COLUMNS} FROM event_intervals WHERE user_email = ?',
+                        (USER,)).fetchall()
+
+    span = (int(START.timestamp()), int((START + timedelta(days=DAYS)).timestamp()))
+    hours = [(start, start + 3600) for start in (rng.randrange(*span) for _ in range(n_queries))]
+    weeks = [(start, start + 7 * 86400) for start in (rng.randrange(*span) for _ in range(n_queries // 10))]
+
+    began = time.perf_counter()
+    schedule_dal.overlapping(conn, USER, 0, 1, use_index=True)
+    build = time.perf_counter() - began
+
+    failures = 0
+    for start, end in hours[:200] + weeks[:20]:
+        expected = linear(rows, start, end)
+        for use_index in (True, False):
+            if sorted(schedule_dal.overlapping(conn, USER, start, end, use_index)) != expected:
+                failures += 1
+    print(f"{'ok  ' if not failures else 'FAIL'} {len(rows):,} intervals: index and SQL match a linear scan "
+          f"on 220 windows ({failures} mismatches)")
+
+    print(f"index build: {build * 1000:.0f} ms")
+    for label, fn in (("index", lambda s, e: schedule_dal.overlapping(conn, USER, s, e, use_index=True)),
+                      ("sql", lambda s, e: schedule_dal.overlapping(conn, USER, s, e, use_index=False)),
+                      ("linear scan", lambda s, e: linear(rows, s, e))):
+        p50, p99 = percentiles(fn, hours)
+        print(f"conflicts, 1h window   {label:<12} p50={p50:8.3f} ms p99={p99:8.3f} ms")
+    for label, use_index in (("index", True), ("sql", False)):
+        def slots(s, e):
+            busy = [row for row in schedule_dal.overlapping(conn, USER, s, e, use_index) if not row[2]]
+            return schedule_dal.free_slots(busy, s, e, 1800)
+        p50, p99 = percentiles(slots, weeks)
+        print(f"free slots, 1w window  {label:<12} p50={p50:8.3f} ms p99={p99:8.3f} ms")
+
+    with conn:
+        schedule_dal.store(conn, USER, [event(rng, n + i) for i in range(50)], USER_TIMEZONE,
+                           item_ids=list(range(1, 51)))
+        # Another user's rows after ours; catching up must not read them
+        schedule_dal.store(conn, "other1@example.edu", [event(rng, i) for i in range(n // 5)], USER_TIMEZONE)
+    began = time.perf_counter()
+    schedule_dal.overlapping(conn, USER, *hours[0], use_index=True)
+    print(f"catch-up after 50 new events (and {n // 5:,} for another user): "
+          f"{(time.perf_counter() - began) * 1000:.2f} ms")
+
+    # Dismiss half the new items and expire the first year; both paths must forget them
+    expire_at = START + timedelta(days=365 + schedule_dal.SCHEDULE_RETENTION_DAYS)
+    with conn:
+        removed = schedule_dal.remove_items(conn, USER, range(1, 26))
+        swept = 0
+        while deleted := schedule_dal.sweep(conn, now=expire_at.timestamp(), force=True):
+            swept += deleted
+    rows = conn.execute(f'SELECT {schedule_dal._ROW_COLUMNS} FROM event_intervals WHERE user_email = ?',
+                        (USER,)).fetchall()
+    changed = 0
+    for start, end in hours[:200] + weeks[:20]:
+        expected = linear(rows, start, end)
+        for use_index in (True, False):
+            if sorted(schedule_dal.overlapping(conn, USER, start, end, use_index)) != expected:
+                changed += 1
+    print(f"{'ok  ' if not changed and removed == 25 else 'FAIL'} dismissed {removed} items and swept "
+          f"{swept:,} expired intervals: index and SQL match a linear scan ({changed} mismatches)")
+    failures += changed + (removed != 25)
+    if failures:
+        sys.exit(f"{failures} mismatch(es)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
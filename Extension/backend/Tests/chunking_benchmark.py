@@ -0,0 +1,101 @@
+"""Microbenchmark the token-budget chunker on synthetic inboxes.
+
+Compares the previous chunker (re-tokenizes the growing piece per sentence,
+builds chunks by string concatenation) with pack_blocks in greedy and
+balanced mode. Snippets are long newsletter-style bodies; about one in
+twenty is larger than a whole chunk so the sentence-splitting path runs.
+
+Run from the backend directory:
+    python -m Tests.chunking_benchmark [n_emails ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Importing the DAL initializes the schema; keep that out of the real events.db
+os.environ.setdefault("EVENTS_DB", os.path.join(tempfile.mkdtemp(prefix="chunk_bench_"), "events.db"))
+
+from DAL.gmail_dal import MAX_TOKENS, build_email_blocks, count_tokens, pack_blocks  # noqa: E402
+
+WORDS = ("workshop seminar deadline registration newsletter update campus library "
+         "students faculty event spring fall reminder meeting office hours project "
+         "submit form portal discount offer weekly digest community volunteer").split()
+
+
+def synthetic_inbox(n, seed=0):
+    rng = random.Random(seed)
+    emails = []
+    for i in range(n):
+        n_sentences = rng.randint(400, 900) if i % 20 == 0 else rng.randint(5, 60)
+        snippet = ". ".join(" ".join(rng.choices(WORDS, k=rng.randint(6, 18))).capitalize() for _ in range(n_sentences))
+        emails.append({
+            "subject": f"Weekly digest #{i}",
+            "sender": f"news{i % 37}@example.edu",
+            "snippet": snippet,
+            "gmailThread": f"thread{i:06d}",
+        })
+    return emails
+
+
+def legacy_chunk_blocks(blocks, max_tokens=MAX_TOKENS):
+    chunks = []
+    current_chunk = ""
+    current_tokens = 0
+
+    tokenized_blocks = [(block, count_tokens(block)) for block in blocks]
+
+    for block, block_tokens in tokenized_blocks:
+        if block_tokens > max_tokens:
+            sentences = block.split(". ")
+            temp = ""
+            for sentence in sentences:
+                if count_tokens(temp + sentence) > max_tokens:
+                    if temp:
+                        chunks.append(temp.strip())
+                    temp = sentence + ". "
+                else:
+                    temp += sentence + ". "
+            if temp.strip():
+                chunks.append(temp.strip())
+            continue
+
+        if current_tokens + block_tokens > max_tokens:
+            chunks.append(current_chunk.strip())
+            current_chunk = block + "\n\n"
+            current_tokens = block_tokens
+        else:
+            current_chunk += block + "\n\n"
+            current_tokens += block_tokens
+
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+
+    return chunks
+
+
+def spread(sizes):
+    return f"min={min(sizes):5d} max={max(sizes):5d}"
+
+
+def main(sizes):
+    for n in sizes:
+        blocks, _ = build_email_blocks(synthetic_inbox(n), prefilter=False)
+
+        start = time.perf_counter()
+        legacy = legacy_chunk_blocks(blocks)
+        legacy_s = time.perf_counter() - start
+        print(f"n={n:<6} legacy    {legacy_s:8.3f}s chunks={len(legacy):<5} tokens/chunk {spread([count_tokens(c) for c in legacy])}")
+
+        for balanced in (False, True):
+            start = time.perf_counter()
+            packed = pack_blocks(blocks, balanced=balanced)
+            elapsed = time.perf_counter() - start
+            label = "balanced" if balanced else "greedy"
+            print(f"n={n:<6} {label:<9} {elapsed:8.3f}s chunks={len(packed):<5} tokens/chunk "
+                  f"{spread([tokens for _, tokens in packed])}  speedup x{legacy_s / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000])
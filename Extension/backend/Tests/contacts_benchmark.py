@@ -0,0 +1,107 @@
+"""Autocomplete latency for /contacts on a user with many contacts.
+
+Compares the old approach (load every contact, substring scan in Python),
+the SQL prefix range scan, and the in-memory prefix index. Every index
+page is checked against the SQL page, before and after write-through
+updates, so the two paths must agree on matches and ranking.
+
+Run from the backend directory:
+    python -m Tests.contacts_benchmark [n_contacts] [n_queries]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ["EVENTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="contacts_bench_"), "events.db")
+
+from DAL import gmail_dal  # noqa: E402
+
+USER = "bench@example.edu"
+FIRST = ("alex sam jordan taylor morgan casey riley jamie chris pat dana lee kim robin "
+         "drew avery quinn reese skyler emerson").split()
+LAST = ("smith jones brown miller davis garcia wilson moore taylor thomas white harris "
+        "martin thompson clark lewis walker hall young allen").split()
+DOMAINS = ("swarthmore.edu gmail.com haverford.edu brynmawr.edu outlook.com "
+           "cs.swarthmore.edu yahoo.com").split()
+DAY = 86400
+
+
+def populate(n, rng):
+    emails = [f"{rng.choice(FIRST)}.{rng.choice(LAST)}{i}@{rng.choice(DOMAINS)}" for i in range(n)]
+    now = time.time()
+    # One use of everyone over the last year, then a skewed tail of repeat uses
+    uses = [(email, now - rng.uniform(0, 365 * DAY)) for email in emails]
+    uses += [(emails[int(rng.paretovariate(1.2)) % n], now - rng.uniform(0, 90 * DAY)) for _ in range(n)]
+    uses.sort(key=lambda use: use[1])
+    for i in range(0, len(uses), 500):
+        batch = uses[i:i + 500]
+        for email, used_at in batch:
+            gmail_dal.save_contacts(USER, [email], now=used_at)
+    return emails
+
+
+def queries(emails, n, rng):
+    result = []
+    for _ in range(n):
+        email = rng.choice(emails)
+        result.append(email[:rng.choice((0, 1, 1, 2, 2, 3, 3, 4, 5, 6, 8))])
+    return result + ["zz", "nobody@"]
+
+
+def legacy_search(query, limit):
+    contacts = gmail_dal.get_suggested_contacts(USER)
+    return [email for email in contacts if not query or query in email.lower()][:limit]
+
+
+def timed(fn, qs):
+    times = []
+    for q in qs:
+        start = time.perf_counter()
+        fn(q)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times
+
+
+def report(label, times):
+    def pct(p):
+        return times[min(len(times) - 1, int(len(times) * p))] * 1000
+    print(f"{label:<16} p50={pct(0.50):8.3f}ms p99={pct(0.99):8.3f}ms max={times[-1] * 1000:8.3f}ms")
+
+
+def check(qs, limit=10):
+    for q in qs:
+        for offset in (0, 40, 60):
+            expected = gmail_dal.search_contacts(USER, q, limit, offset, use_index=False)
+            actual = gmail_dal.search_contacts(USER, q, limit, offset, use_index=True)
+            assert actual == expected, (q, offset, actual, expected)
+
+
+def main(n, n_queries):
+    rng = random.Random(7)
+    start = time.perf_counter()
+    emails = populate(n, rng)
+    print(f"populated {n} contacts in {time.perf_counter() - start:.1f}s")
+    qs = queries(emails, n_queries, rng)
+
+    report("legacy scan", timed(lambda q: legacy_search(q, 10), qs[:max(50, n_queries // 20)]))
+    report("sql prefix", timed(lambda q: gmail_dal.search_contacts(USER, q, 10, use_index=False), qs))
+
+    start = time.perf_counter()
+    gmail_dal.search_contacts(USER, "", 10)
+    print(f"index build      {(time.perf_counter() - start) * 1000:8.1f}ms")
+    report("prefix index", timed(lambda q: gmail_dal.search_contacts(USER, q, 10), qs))
+
+    check(qs[:500])
+    # Write-through: new and repeat uses must show up in the loaded index
+    for email in rng.sample(emails, 200) + [f"new.contact{i}@swarthmore.edu" for i in range(50)]:
+        gmail_dal.save_contacts(USER, [email])
+    check(qs[:500] + ["new", "new.contact1"])
+    print("index pages match the SQL pages before and after write-through")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main(*(args + [50000, 5000][len(args):]))
@@ -0,0 +1,115 @@
+"""Compare per-event and batched dedup/insert throughput of the events DAL.
+
+Run from the backend directory:
+    python -m Tests.dal_benchmark            # 1k and 100k events
+    python -m Tests.dal_benchmark 1000 5000  # custom sizes
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="dal_bench_")
+os.environ["EVENTS_DB"] = os.path.join(_tmpdir, "events.db")
+
+from DAL import gmail_dal  # noqa: E402  (EVENTS_DB must be set first)
+
+USER = "bench@example.com"
+
+
+def make_events(n):
+    # Every 10th event repeats an earlier one so the dedup path is exercised
+    events = []
+    for i in range(n):
+        j = i - 9 if i % 10 == 9 else i
+        events.append({"raw_subject": f"Subject {j}", "sender": f"sender{j % 50}@example.com"})
+    return events
+
+
+# The pre-refactor DAL: one connection and one commit per call
+def legacy_event_seen(db, user_email, raw_subject, sender):
+    conn = sqlite3.connect(db)
+    c = conn.cursor()
+    c.execute('''
+        SELECT 1 FROM events
+        WHERE user_email = ? AND raw_subject = ? AND sender = ?
+    ''', (user_email.strip().lower(), raw_subject.strip().lower(), sender.strip().lower()))
+    result = c.fetchone()
+    conn.close()
+    return result is not None
+
+
+def legacy_save_event(db, user_email, raw_subject, sender):
+    conn = sqlite3.connect(db)
+    c = conn.cursor()
+    try:
+        c.execute('''
+            INSERT OR IGNORE INTO events (user_email, raw_subject, sender)
+            VALUES (?, ?, ?)
+        ''', (user_email.strip().lower(), raw_subject.strip().lower(), sender.strip().lower()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def legacy_remove_duplicates(db, user_email, events):
+    unique_events = []
+    for event in events:
+        if not legacy_event_seen(db, user_email, event['raw_subject'], event['sender']):
+            legacy_save_event(db, user_email, event['raw_subject'], event['sender'])
+            unique_events.append(event)
+    return unique_events
+
+
+def legacy_db():
+    db = os.path.join(_tmpdir, f"legacy_{time.time_ns()}.db")
+    conn = sqlite3.connect(db)
+    conn.execute('''
+        CREATE TABLE events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_email TEXT NOT NULL,
+            raw_subject TEXT NOT NULL,
+            sender TEXT NOT NULL,
+            UNIQUE(user_email, raw_subject, sender)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+    return db
+
+
+def reset_events():
+    conn = gmail_dal.get_connection()
+    with conn:
+        conn.execute('DELETE FROM event_fingerprints')
+
+
+def bench(label, n, fn):
+    start = time.perf_counter()
+    kept = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} n={n:<7} kept={kept:<7} {elapsed:8.3f}s  {n / elapsed:12,.0f} events/s")
+
+
+def main(sizes):
+    for n in sizes:
+        events = make_events(n)
+
+        db = legacy_db()
+        bench("legacy per-event", n, lambda: len(legacy_remove_duplicates(db, USER, events)))
+
+        reset_events()
+        def per_chunk():
+            # One remove_duplicates call per 50 events, roughly one LLM chunk
+            return sum(len(gmail_dal.remove_duplicates(USER, events[i:i + 50])) for i in range(0, n, 50))
+        bench("batched per 50-event chunk", n, per_chunk)
+
+        reset_events()
+        def whole_list():
+            return len(gmail_dal.remove_duplicates(USER, events))
+        bench("batched whole list", n, whole_list)
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 100000])
@@ -0,0 +1,173 @@
+"""Check the fuzzy event dedup rules and time the batched lookup against a large history.
+
+It checks that:
+  - reply/forward prefixes, list tags and +tags don't make a new event
+  - a reworded title for the same slot is dropped from the same sender; from
+    another sender (a forward) only near-identical text is
+  - different numbers ("Section 2" / "Section 3"), days or times are kept
+  - undated events only match by key
+  - expired fingerprints are swept in batches
+
+Then it stores `history` events spread over a year and times
+remove_duplicates on 50-event chunks, about one LLM chunk each, and
+SimHash on its own. It fails when either is slower than its threshold
+(DEDUP_CHECK_MAX_CHUNK_MS, DEDUP_CHECK_MAX_SIMHASH_MS), which are set
+well above what a development machine measures.
+
+Run from the backend directory:
+    python -m Tests.dedup_check [history]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ["EVENTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="dedup_check_"), "events.db")
+os.environ.setdefault("DEDUP_SWEEP_BATCH", "100")
+
+from DAL import dedup_dal, gmail_dal  # noqa: E402  (EVENTS_DB must be set first)
+
+USER = "student@example.edu"
+# Regression thresholds: well above the sandbox's 20 ms per chunk and 0.03 ms per SimHash
+MAX_CHUNK_MS = float(os.getenv("DEDUP_CHECK_MAX_CHUNK_MS", "35"))
+MAX_SIMHASH_MS = float(os.getenv("DEDUP_CHECK_MAX_SIMHASH_MS", "0.08"))
+
+
+def event(title, subject, sender, iso, context=""):
+    return {"event": title, "raw_subject": subject, "sender": sender, "time": {"iso": iso}, "context": context}
+
+
+CASES = [
+    # (description, stored event, incoming event, expected duplicate)
+    ("reply prefix and list tag",
+     event("CS Info Session", "[cs-announce] CS info session", "Chris <chris@cs.example.edu>", "2025-04-10T16:30"),
+     event("CS Info Session", "Re: FW: [cs-announce] CS info session!", "chris+list@cs.example.edu",
+           "2025-04-10T16:30"), True),
+    ("reworded title, same sender",
+     event("Weekly Sync", "Weekly sync", "pm@example.edu", "2025-04-14T10:00", "Agenda in the doc"),
+     event("Weekly Sync Meeting", "Updated: weekly sync", "pm@example.edu", "2025-04-14T10:15", "Agenda in the doc"),
+     True),
+    ("forwarded by someone else",
+     event("CS Department Info Session", "CS Dept info session", "chris@cs.example.edu", "2025-04-10T16:30",
+           "Fall course planning event in Sci 204"),
+     event("CS Department Info Session", "Fwd: info session", "bob@example.edu", "2025-04-10T16:30",
+           "Fall course planning event in Sci 204"), True),
+    # Across senders only near-identical text counts: "CS" and "Math" department sessions differ by ~8 bits
+    ("reworded by someone else",
+     event("CS Department Info Session", "CS Dept info session", "chris@cs.example.edu", "2025-04-10T16:30",
+           "Fall course planning event in Sci 204"),
+     event("CS Dept Info Session for Fall", "Fwd: info session", "bob@example.edu", "2025-04-10T16:30",
+           "Fall course planning event in Sci 204"), False),
+    ("different section number",
+     event("Section 2 review", "Review sessions", "ta@example.edu", "2025-04-11T10:00"),
+     event("Section 3 review", "Review sessions (3)", "ta@example.edu", "2025-04-11T10:00"), False),
+    ("same title, next week",
+     event("Weekly sync", "Weekly sync", "pm@example.edu", "2025-04-14T10:00"),
+     event("Weekly sync", "Weekly sync", "pm@example.edu", "2025-04-21T10:00"), False),
+    ("same day, hours apart",
+     event("Office hours", "Office hours", "prof@example.edu", "2025-04-15T09:00"),
+     event("Office hours", "Office hours moved", "prof@example.edu", "2025-04-15T15:00"), False),
+    ("undated, same key",
+     event("Club meeting", "Club meeting", "club@example.edu", "Not specified"),
+     event("Club meeting", "RE: Club meeting", "Club@Example.edu", "Not specified"), True),
+    ("undated, reworded",
+     event("Club meeting", "Club meeting", "club@example.edu", "Not specified"),
+     event("Club meetup", "Club meetup", "club@example.edu", "Not specified"), False),
+]
+
+
+def reset():
+    conn = gmail_dal.get_connection()
+    with conn:
+        conn.execute('DELETE FROM event_fingerprints')
+
+
+def check_cases():
+    failures = 0
+    for description, stored, incoming, expected in CASES:
+        reset()
+        gmail_dal.remove_duplicates(USER, [stored])
+        duplicate = not gmail_dal.remove_duplicates(USER, [incoming])
+        # The same pair in one batch must give the same answer
+        reset()
+        duplicate_in_batch = len(gmail_dal.remove_duplicates(USER, [stored, incoming])) == 1
+        ok = duplicate == duplicate_in_batch == expected
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {description:<28} duplicate={duplicate} in_batch={duplicate_in_batch}")
+    return failures
+
+
+def check_sweep():
+    reset()
+    conn = gmail_dal.get_connection()
+    now = time.time()
+    old = now - (dedup_dal.DEDUP_RETENTION_DAYS + 1) * 86400
+    with conn:
+        dedup_dal.new_events(conn, USER, [event(f"Old {i}", f"Old {i}", "a@example.edu", "2024-01-01T10:00")
+                                          for i in range(250)], now=old)
+        dedup_dal.new_events(conn, USER, [event("Recent", "Recent", "a@example.edu", "2025-01-01T10:00")], now=now)
+    batches = []
+    while True:
+        with conn:
+            deleted = dedup_dal.sweep(conn, now=now, force=True)
+        if not deleted:
+            break
+        batches.append(deleted)
+    left = conn.execute('SELECT COUNT(*) FROM event_fingerprints').fetchone()[0]
+    ok = sum(batches) == 250 and left == 1 and max(batches) <= dedup_dal.DEDUP_SWEEP_BATCH
+    print(f"{'ok  ' if ok else 'FAIL'} sweep deleted {sum(batches)} in batches {batches}, {left} left")
+    return not ok
+
+
+def history_event(rng, i):
+    day = rng.randrange(365)
+    month, mday = day // 28 % 12 + 1, day % 28 + 1
+    return event(f"Event {i} {rng.choice(['sync', 'review', 'seminar', 'lab', 'talk'])}", f"Event {i}",
+                 f"sender{rng.randrange(200)}@example.edu",
+                 f"2025-{month:02d}-{mday:02d}T{rng.randrange(8, 18):02d}:{rng.choice(['00', '30'])}",
+                 "Room 101 with the usual group")
+
+
+def bench(history):
+    reset()
+    rng = random.Random(0)
+    stored = [history_event(rng, i) for i in range(history)]
+    for start in range(0, history, 1000):
+        gmail_dal.remove_duplicates(USER, stored[start:start + 1000])
+    count = gmail_dal.get_connection().execute('SELECT COUNT(*) FROM event_fingerprints').fetchone()[0]
+    # Half repeats of stored events, half new ones
+    incoming = [rng.choice(stored) if i % 2 else history_event(rng, history + i) for i in range(5000)]
+    start = time.perf_counter()
+    kept = sum(len(gmail_dal.remove_duplicates(USER, incoming[i:i + 50])) for i in range(0, len(incoming), 50))
+    elapsed = time.perf_counter() - start
+    chunk_ms = elapsed / (len(incoming) / 50) * 1000
+    print(f"history={count:,} stored: {len(incoming):,} events in 50-event chunks, kept={kept:,}, "
+          f"{chunk_ms:.2f} ms/chunk, {len(incoming) / elapsed:,.0f} events/s")
+
+    # Fresh features, so the per-feature hash cache doesn't flatter it
+    features = [dedup_dal._features(f"Unseen event {i} {rng.random()}", f"Room {i} with the usual group")
+                for i in range(5000)]
+    start = time.perf_counter()
+    for feature_list in features:
+        dedup_dal.simhash(feature_list)
+    simhash_ms = (time.perf_counter() - start) / len(features) * 1000
+    print(f"simhash: {simhash_ms:.4f} ms/event")
+
+    failures = 0
+    for label, value, limit in (("ms/chunk", chunk_ms, MAX_CHUNK_MS), ("simhash ms/event", simhash_ms, MAX_SIMHASH_MS)):
+        if value > limit:
+            failures += 1
+            print(f"FAIL {label} {value:.4f} is over the {limit} threshold")
+    return failures
+
+
+def main(history):
+    failures = check_cases() + check_sweep()
+    failures += bench(history)
+    if failures:
+        sys.exit(f"{failures} check(s) failed")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,153 @@
+"""Daily digest reads for a user with a large event history.
+
+Adds `n_events` events for one user (plus other users' events) over three
+years through digest_dal, in batches as /parse admits them. Checks that:
+  - each sampled day's materialized digest matches one rendered from scratch
+  - confirming keeps an item with its new status, dismissing drops it, and
+    both change the version (so the ETag)
+  - the precompute sweep only bumps versions whose rendering changed
+Then it times:
+  - the version lookup behind a 304, and reading a 1-day and a 7-day digest
+  - rendering a stale day, as the first read after a change does
+  - rebuilding a day's digest by scanning the user's whole history
+  - adding one batch of new events, which only marks their days stale
+
+Run from the backend directory:
+    python -m Tests.digest_benchmark [n_events] [n_queries]
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from DAL import digest_dal
+from Utils.time_normalizer import event_interval, get_zone
+
+USER = "bench@example.edu"
+USERS = (USER, "other1@example.edu", "other2@example.edu")
+USER_TIMEZONE = "America/New_York"
+START = datetime(2024, 1, 1)
+DAYS = 3 * 365
+NOW = datetime(2025, 6, 1, 9, 0).timestamp()
+
+
+def event(rng, i):
+    day = START + timedelta(days=rng.randrange(DAYS))
+    kind = rng.random()
+    if kind < 0.03:
+        iso = "Not specified"
+    elif kind < 0.05:
+        iso = f"{day:%Y-%m-%d}"
+    else:
+        start = day + timedelta(hours=rng.randrange(8, 20), minutes=rng.choice((0, 15, 30, 45)))
+        iso = f"{start:%Y-%m-%dT%H:%M}/{start + timedelta(minutes=rng.choice((30, 60, 90))):%Y-%m-%dT%H:%M}"
+    return {"event": f"Event {i}", "time": {"iso": iso, "display": iso}, "context": "Sci 204",
+            "sender": "someone@example.edu", "gmailThread": f"thread{i:06d}"}
+
+
+def scan_day(conn, day):
+    """The day's digest rebuilt the way it would be without the table: read every item of the user's."""
+    items = []
+    for row_id, status, event_json in conn.execute(
+            'SELECT id, status, event FROM digest_items WHERE +user_email = ? ORDER BY id', (USER,)):
+        event = json.loads(event_json)
+        interval = event_interval(event, USER_TIMEZONE)
+        if status == digest_dal.DISMISSED or interval is None:
+            continue
+        if digest_dal.day_number(datetime.fromtimestamp(interval[0], get_zone(USER_TIMEZONE)).date()) == day:
+            items.append((interval[0], row_id))
+    return [row_id for _, row_id in sorted(items)]
+
+
+def materialized_day(conn, day):
+    with conn:
+        digest_dal.render_stale(conn, USER, day, day, NOW)
+    _, rendered, _ = digest_dal.read(conn, USER, day, day)
+    return [item["id"] for item in json.loads(rendered.get(day, "[]")) if item["event"]["time"]["iso"] != "Not specified"]
+
+
+def percentiles(fn, args):
+    times = []
+    for arg in args:
+        began = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - began)
+    times.sort()
+    return times[len(times) // 2] * 1000, times[int(len(times) * 0.99)] * 1000
+
+
+def main(n, n_queries):
+    rng = random.Random(0)
+    conn = sqlite3.connect(os.path.join(tempfile.mkdtemp(prefix="digest_bench_"), "events.db"))
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    with conn:
+        digest_dal.create_tables(conn)
+    began = time.perf_counter()
+    for user, count in zip(USERS, (n, n // 5, n // 5)):
+        events = [event(rng, i) for i in range(count)]
+        for i in range(0, count, 20):
+            # Found over the same three years, so undated events spread over the days they were found on
+            found = START.timestamp() + DAYS * 86400 * i / count
+            with conn:
+                digest_dal.add(conn, user, events[i:i + 20], USER_TIMEZONE, found)
+    print(f"added {n + 2 * (n // 5):,} events in batches of 20: {time.perf_counter() - began:.1f} s")
+    began = time.perf_counter()
+    with conn:
+        stale = sum(digest_dal.render_stale(conn, user, 0, 99991231, NOW) for user in USERS)
+    print(f"rendered {stale:,} stale days: {time.perf_counter() - began:.1f} s")
+
+    failures = 0
+    all_days = digest_dal.day_range(START.date(), DAYS)
+    for day in rng.sample(all_days, 10):
+        if materialized_day(conn, day) != scan_day(conn, day):
+            failures += 1
+    print(f"{'ok  ' if not failures else 'FAIL'} 10 materialized days match a full scan ({failures} mismatches)")
+
+    # A day well after NOW, so its items are low urgency until the sweep runs on the day itself
+    busy = next(day for day in all_days if day >= 20260101 and len(materialized_day(conn, day)) >= 2)
+    ids = materialized_day(conn, busy)
+    before = digest_dal.version(conn, USER)
+    with conn:
+        digest_dal.set_status(conn, USER, ids[0], digest_dal.CONFIRMED, NOW)
+        digest_dal.set_status(conn, USER, ids[1], digest_dal.DISMISSED, NOW)
+    with conn:
+        digest_dal.render_stale(conn, USER, busy, busy, NOW)
+    _, rendered, _ = digest_dal.read(conn, USER, busy, busy)
+    items = {item["id"]: item["status"] for item in json.loads(rendered[busy])}
+    ok = items.get(ids[0]) == "confirmed" and ids[1] not in items and digest_dal.version(conn, USER) == before + 2
+    with conn:
+        unchanged = digest_dal.precompute(conn, USER_TIMEZONE, digest_dal.day_range(START.date(), 7), NOW)
+        moved = digest_dal.precompute(conn, USER_TIMEZONE, [busy],
+                                      datetime.combine(digest_dal.day_date(busy), datetime.min.time(),
+                                                       get_zone(USER_TIMEZONE)).timestamp())
+    ok = ok and unchanged == 0 and moved >= 1
+    failures += not ok
+    print(f"{'ok  ' if ok else 'FAIL'} confirm/dismiss update the day and the version; "
+          f"sweep changed {unchanged} then {moved} digest(s)")
+
+    sample = [rng.choice(all_days) for _ in range(n_queries)]
+    for label, fn in (("version (304)", lambda day: digest_dal.version(conn, USER)),
+                      ("read 1 day", lambda day: digest_dal.read(conn, USER, day, day)),
+                      ("read 7 days", lambda day: digest_dal.read(
+                          conn, USER, day, digest_dal.day_range(digest_dal.day_date(day), 7)[-1])),
+                      ("render 1 day", lambda day: digest_dal._render(conn, USER, [day], NOW)),
+                      ("full scan 1 day", lambda day: scan_day(conn, day))):
+        p50, p99 = percentiles(fn, sample if label != "full scan 1 day" else sample[:5])
+        print(f"{label:<16} p50={p50:8.3f} ms p99={p99:8.3f} ms")
+
+    batch = [event(rng, n + i) for i in range(20)]
+    began = time.perf_counter()
+    with conn:
+        digest_dal.add(conn, USER, batch, USER_TIMEZONE, NOW)
+    print(f"add 20 new events: {(time.perf_counter() - began) * 1000:.2f} ms")
+    if failures:
+        sys.exit(f"{failures} check(s) failed")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
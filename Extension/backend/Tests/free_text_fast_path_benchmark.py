@@ -0,0 +1,79 @@
+"""Fast-path hit rate and latency for /parse_free_text quick-add inputs.
+
+Inputs the local parser declines are the ones that still go to the LLM.
+Before timing, checks the start time the parser gives a few inputs (or that
+it declines them).
+
+Run from the backend directory:
+    python -m Tests.free_text_fast_path_benchmark [repeats]
+"""
+import sys
+
+from nlp import fast_path_stats, parse_simple_free_text
+
+USER_NOW = "2025-04-09T14:00:00Z"
+USER_TIMEZONE = "America/New_York"
+
+SAMPLES = [
+    "coffee with bob@x.com tomorrow 3pm",
+    "Meeting with alice@corp.com on Friday at 10:30am",
+    "Interview April 14 2-3pm",
+    "lunch with sam today at noon",
+    "call 4/20 at 9am",
+    "Project review Thursday from 1 to 2:30pm",
+    "chat w/ bob 2025-05-01 15:00",
+    "Dentist appointment May 3 at 8:45am",
+    "1:1 with jordan@corp.com Monday 11am",
+    "Team sync tomorrow 10-10:30am",
+    "Drinks with the lab Friday 6pm",
+    "Office hours Tuesday 1-2pm",
+    # Expected to fall back to the LLM
+    "schedule sync with team@x.com tomorrow",
+    "coffee next friday 3pm",
+    "Dinner at 7pm PST tomorrow",
+    "standup every monday 9am",
+    "can we meet sometime next week?",
+    "Send a calendar invite to Maxwell for 9:58-10:50 AM about his startup ideas",
+    "lunch tomorrow or thursday at noon",
+    "Call with Priya in the afternoon",
+]
+
+# (text, expected start as "YYYY-MM-DDTHH:MM", or None when it must go to the LLM)
+CHECKS = [
+    ("coffee with bob@x.com tomorrow 3pm", "2025-04-10T15:00"),
+    ("Team sync tomorrow 10-10:30am", "2025-04-10T10:00"),
+    ("Standup tomorrow 9:30", "2025-04-10T09:30"),
+    ("Standup tomorrow at 9", "2025-04-10T09:00"),
+    ("Review friday @ 11", "2025-04-11T11:00"),
+    # A bare number is a count, not a time
+    ("Team sync tomorrow, 8 people", None),
+    ("Dinner friday for 10", None),
+    ("Lunch tomorrow for 8-10", None),
+]
+
+
+def check():
+    failures = 0
+    for text, expected in CHECKS:
+        result = parse_simple_free_text(text, USER_NOW, USER_TIMEZONE, "me@example.com")
+        got = result["events"][0]["time"]["iso"][:16] if result else None
+        ok = got == expected
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {text!r}: {got}" + ("" if ok else f" (expected {expected})"))
+    return failures
+
+
+def main(repeats):
+    failures = check()
+    for _ in range(repeats):
+        for text in SAMPLES:
+            parse_simple_free_text(text, USER_NOW, USER_TIMEZONE, "me@example.com")
+    stats = fast_path_stats()
+    print(f"inputs={stats['hits'] + stats['misses']} hit_rate={stats['hit_rate']:.0%} "
+          f"p50={stats['latency_p50_ms']:.3f}ms p95={stats['latency_p95_ms']:.3f}ms p99={stats['latency_p99_ms']:.3f}ms")
+    if failures:
+        sys.exit(f"{failures} check(s) failed")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
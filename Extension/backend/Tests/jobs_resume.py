@@ -0,0 +1,98 @@
+"""Submit a /jobs backfill, kill the workers halfway, restart, and check nothing is redone.
+
+The LLM is a mock transport that returns one event per email, so the
+script runs offline. It checks that:
+  - after the restart only chunks still pending are sent to the LLM
+  - every email's event is reported exactly once across both runs
+  - the stream endpoint replays all results in order
+
+Run from the backend directory:
+    python -m Tests.jobs_resume [n_emails]
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+
+os.environ["EVENTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="jobs_resume_"), "events.db")
+os.environ["LLM_CACHE"] = "0"
+# The mock has no quota; export LLM_REQUESTS_PER_MIN / LLM_TOKENS_PER_MIN to test the real limits
+os.environ.setdefault("LLM_REQUESTS_PER_MIN", "1000000000")
+os.environ.setdefault("LLM_TOKENS_PER_MIN", "1000000000000")
+os.environ["PREFILTER"] = "0"
+os.environ.setdefault("MAX_REQUEST_TOKENS", "1200")
+os.environ.setdefault("JOB_CHUNK_CONCURRENCY", "2")
+
+import httpx  # noqa: E402
+
+import app  # noqa: E402
+from DAL.async_dal import get_job_async  # noqa: E402
+from DAL.jobs_dal import JOB_FAILED  # noqa: E402
+from Utils import job_worker, openai_utils  # noqa: E402
+
+calls = {"count": 0}
+
+
+async def handler(request):
+    calls["count"] += 1
+    await asyncio.sleep(0.02)
+    prompt = json.loads(request.content)["messages"][-1]["content"]
+    events = [{
+        "event": f"Meeting for {thread}", "raw_subject": f"Meeting {thread}", "sender": "organizer@example.edu",
+        "time": {"start": "2025-05-01T15:00", "end": "", "zone": "", "recurrence": ""}, "context": "",
+        "gmailThread": thread,
+    } for thread in re.findall(r"gmailThread: (\S+)", prompt)]
+    return httpx.Response(200, json={"choices": [{"message": {"content": json.dumps({"events": events})},
+                                                  "finish_reason": "stop"}]})
+
+
+def inbox(n):
+    return [{
+        "subject": f"Meeting {i}",
+        "sender": "organizer@example.edu",
+        "snippet": f"Project sync on May {i % 28 + 1} at 3pm in Sci 204. " * 15,
+        "gmailThread": f"thread{i:05d}",
+    } for i in range(n)]
+
+
+async def wait_for(job_id, predicate):
+    while not predicate(job := await get_job_async(job_id)):
+        if job["status"] == JOB_FAILED:
+            raise AssertionError(f"job failed: {job.get('error')}")
+        await asyncio.sleep(0.01)
+    return job
+
+
+async def main(n):
+    async with app.app.test_app() as test_app:
+        openai_utils._client = httpx.AsyncClient(base_url="http://mock/v1", transport=httpx.MockTransport(handler))
+        client = test_app.test_client()
+        resp = await client.post('/jobs', json={"user_email": "backfill@example.edu", "emails": inbox(n)})
+        job_id = (await resp.get_json())["job_id"]
+
+        job = await wait_for(job_id, lambda job: job["total_chunks"] and job["done_chunks"] >= job["total_chunks"] // 2)
+        await job_worker.stop_workers()
+        job = await get_job_async(job_id)
+        first_run = calls["count"]
+        print(f"stopped after {job['done_chunks']}/{job['total_chunks']} chunks ({first_run} LLM calls)")
+
+        await job_worker.start_workers()
+        job = await wait_for(job_id, lambda job: job["status"] == "done")
+        second_run = calls["count"] - first_run
+        print(f"resumed: {second_run} more LLM calls, status={job['status']} events={job['total_events']}")
+        assert first_run + second_run <= job["total_chunks"] + job_worker.JOB_CHUNK_CONCURRENCY, "chunks redone"
+
+        resp = await client.get(f'/jobs/{job_id}/stream')
+        lines = [json.loads(line) for line in (await resp.get_data()).decode().splitlines()]
+        seqs = [line["seq"] for line in lines[:-1]]
+        threads = [event["gmailThread"] for line in lines[:-1] for event in line["new_events"]]
+        assert seqs == list(range(1, job["total_chunks"] + 1)), seqs
+        assert sorted(threads) == [email["gmailThread"] for email in inbox(n)], "missing or repeated events"
+        assert lines[-1]["complete"] and lines[-1]["total_events"] == n
+        print(f"stream replayed {len(seqs)} chunks and {len(threads)} events exactly once")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
@@ -0,0 +1,342 @@
+"""End-to-end load test of /parse, /parse_free_text and /contacts against the mock LLM.
+
+Starts Tests/mock_llm_server.py and `serve.py --workers N` on a fresh
+database (or targets a running backend with --url). Requests are sent
+open-loop at --rps with Poisson arrivals, so a slow server builds a backlog
+instead of slowing down the load. The request mix is set with --mix. The
+report covers, per endpoint:
+
+- throughput, p50/p95/p99 latency and errors
+- for /parse, time to the first NDJSON line
+- DAL calls made during the run (from the backend's /stats)
+- LLM calls made during the run (from the mock's /stats)
+
+Results are written to Tests/results/<label>-<timestamp>.json. Pass
+--compare with an earlier results file, or "last", to print the change.
+
+Run from the backend directory:
+    python -m Tests.load_test --rps 20 --duration 30 [--workers 2] [--llm-latency 0.8] [--compare last]
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from Tests.mock_llm_server import MockConfig, serve as serve_mock
+from Tests.multiprocess_benchmark import BACKEND_DIR, free_port, wait_for_port
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "Tests", "results")
+# The views save contacts under this account
+USER_EMAIL = "mkumbon1@swarthmore.edu"
+ENDPOINTS = ("parse", "parse_free_text", "contacts")
+CONTACT_POOL = 500
+
+# Quick-add text the local fast path resolves, and text it hands to the LLM
+_SIMPLE_TEXT = "Coffee with {contact} tomorrow at 3pm"
+_LLM_TEXT = "Can we find an hour with {contact} after the Tuesday standup next week to go over the budget?"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+
+class Workload:
+    """Request bodies; every /parse request carries emails the server hasn't seen."""
+
+    def __init__(self, emails_per_request, seed):
+        self.emails_per_request = emails_per_request
+        self.rng = random.Random(seed)
+        self.ids = itertools.count()
+        self.contacts = [f"{name}.{i}@example.edu"
+                         for i, name in enumerate(itertools.islice(itertools.cycle(
+                             ["alex", "sam", "jordan", "taylor", "casey", "riley", "morgan", "jamie"]), CONTACT_POOL))]
+
+    def body(self, endpoint):
+        n = next(self.ids)
+        if endpoint == "parse":
+            emails = [{
+                "subject": f"Project sync #{n}-{i}",
+                "sender": "pm@example.edu",
+                "snippet": f"Hi all, the project sync moves to Thursday May {i % 28 + 1} at 3pm in Sci 204. "
+                           "Please bring your status updates.",
+                "gmailThread": f"load{n}t{i}",
+            } for i in range(self.emails_per_request)]
+            return {"text": json.dumps({"emails": emails}), "user_timezone": "America/New_York",
+                    "stream_mode": "delta"}
+        if endpoint == "parse_free_text":
+            template = _SIMPLE_TEXT if self.rng.random() < 0.5 else _LLM_TEXT
+            return {"text": template.format(contact=self.rng.choice(self.contacts)),
+                    "user_timezone": "America/New_York", "user_now": "2025-04-28T10:00:00-04:00"}
+        contact = self.rng.choice(self.contacts)
+        return {"user_email": USER_EMAIL, "query": contact[:self.rng.randint(1, 4)], "limit": 10}
+
+
+async def timed_request(client, endpoint, body):
+    """(status, seconds to the complete response, seconds to the first NDJSON line or None)"""
+    start = time.perf_counter()
+    first_line = None
+    async with client.stream("POST", f"/{endpoint}", json=body) as resp:
+        if endpoint == "parse":
+            async for line in resp.aiter_lines():
+                if line and first_line is None:
+                    first_line = time.perf_counter() - start
+        else:
+            await resp.aread()
+    return resp.status_code, time.perf_counter() - start, first_line
+
+
+async def fetch_stats(client, url, samples=1):
+    """The backend's /stats, one per worker pid seen in `samples` requests."""
+    by_pid = {}
+    for _ in range(samples):
+        try:
+            stats = (await client.get(url)).json()
+        except httpx.HTTPError:
+            continue
+        by_pid[stats.get("pid")] = stats
+    return by_pid
+
+
+def db_op_delta(before, after):
+    """Sum of DAL calls per function made during the run, across the worker pids sampled both times."""
+    delta = {}
+    for pid, stats in after.items():
+        prior = before.get(pid, {}).get("db_ops", {})
+        for name, counts in stats.get("db_ops", {}).items():
+            calls = counts["calls"] - prior.get(name, {}).get("calls", 0)
+            if calls:
+                delta[name] = delta.get(name, 0) + calls
+    return dict(sorted(delta.items()))
+
+
+async def run_load(args, url, llm_url):
+    mix = [(endpoint, weight) for endpoint, weight in args.mix.items() if weight > 0]
+    endpoints, weights = zip(*mix)
+    workload = Workload(args.emails, args.seed)
+    arrivals = random.Random(args.seed)
+    records = []
+    lag = []
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=None, max_keepalive_connections=200)) as client:
+        # Give /contacts something to rank, and open the server's connections and caches
+        for contact in workload.contacts:
+            await client.post("/parse_free_text", json={
+                "text": _SIMPLE_TEXT.format(contact=contact), "user_now": "2025-04-28T10:00:00-04:00"})
+        samples = 4 * args.workers
+        db_before = await fetch_stats(client, "/stats", samples)
+        llm_before = (await client.get(f"{llm_url}/stats")).json() if llm_url else {}
+
+        async def one(endpoint, scheduled):
+            body = workload.body(endpoint)
+            lag.append(time.perf_counter() - scheduled)
+            try:
+                status, latency, first_line = await timed_request(client, endpoint, body)
+                records.append({"endpoint": endpoint, "status": status, "latency": latency, "first_line": first_line})
+            except httpx.HTTPError as e:
+                records.append({"endpoint": endpoint, "status": None, "error": type(e).__name__,
+                                "latency": time.perf_counter() - scheduled, "first_line": None})
+
+        tasks = []
+        start = time.perf_counter()
+        next_at = start
+        while next_at < start + args.duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = arrivals.choices(endpoints, weights)[0]
+            tasks.append(asyncio.create_task(one(endpoint, next_at)))
+            next_at += arrivals.expovariate(args.rps)
+        sent_for = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+        db_after = await fetch_stats(client, "/stats", samples)
+        llm_after = (await client.get(f"{llm_url}/stats")).json() if llm_url else {}
+
+    return summarize(records, sent_for, elapsed, lag, db_op_delta(db_before, db_after),
+                     {k: v - llm_before.get(k, 0) for k, v in llm_after.items()}, sorted(db_after))
+
+
+def summarize(records, sent_for, elapsed, lag, db_ops, llm_calls, pids):
+    def latency_summary(values):
+        return {f"p{int(p * 100)}_ms": round(percentile(values, p) * 1000, 1) if values else None
+                for p in (0.50, 0.95, 0.99)}
+
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        rows = [r for r in records if r["endpoint"] == endpoint]
+        if not rows:
+            continue
+        ok = [r for r in rows if r["status"] == 200]
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "ok": len(ok),
+            "errors": len(rows) - len(ok),
+            "throughput_rps": round(len(ok) / elapsed, 2),
+            "latency": latency_summary([r["latency"] for r in ok]),
+        }
+        first_lines = [r["first_line"] for r in ok if r["first_line"] is not None]
+        if first_lines:
+            endpoints[endpoint]["first_ndjson_line"] = latency_summary(first_lines)
+    return {
+        "offered_rps": round(len(records) / sent_for, 2),
+        "achieved_rps": round(sum(e["ok"] for e in endpoints.values()) / elapsed, 2),
+        "elapsed_s": round(elapsed, 2),
+        # How late the generator itself sent requests; large values mean the client, not the server, saturated
+        "send_lag_p99_ms": round(percentile(lag, 0.99) * 1000, 1) if lag else None,
+        "endpoints": endpoints,
+        "db_ops": db_ops,
+        "db_ops_worker_pids": pids,
+        "llm_calls": llm_calls,
+    }
+
+
+def start_stack(args):
+    """Start the mock LLM and serve.py; returns (url, llm_url, stop)."""
+    llm_port, port = free_port(), free_port()
+    mock = multiprocessing.Process(target=serve_mock, daemon=True, args=(llm_port, MockConfig(
+        latency=args.llm_latency, jitter=args.llm_jitter, tokens_per_second=args.llm_tokens_per_second,
+        error_rate=args.llm_error_rate, rate_limit_rate=args.llm_rate_limit_rate, seed=args.seed)))
+    mock.start()
+    wait_for_port(llm_port)
+    env = dict(os.environ,
+               EVENTS_DB=os.path.join(tempfile.mkdtemp(prefix="load_test_"), "events.db"),
+               OPENAI_API_KEY="mock", OPENAI_BASE_URL=f"http://127.0.0.1:{llm_port}/v1", OPENAI_HTTP2="0",
+               LLM_CACHE="0", JOB_WORKERS="0")
+    # The mock has no quota; export LLM_REQUESTS_PER_MIN / LLM_TOKENS_PER_MIN to test the real limits
+    env.setdefault("LLM_REQUESTS_PER_MIN", "1000000000")
+    env.setdefault("LLM_TOKENS_PER_MIN", "1000000000000")
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", str(args.workers), "--port", str(port)],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+
+    def stop():
+        server.terminate()
+        server.wait(60)
+        mock.terminate()
+
+    try:
+        wait_for_port(port)
+    except Exception:
+        stop()
+        raise
+    return f"http://127.0.0.1:{port}", f"http://127.0.0.1:{llm_port}/v1", stop
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(report, previous=None):
+    results = report["results"]
+    print(f"offered {results['offered_rps']} req/s, completed {results['achieved_rps']} req/s "
+          f"in {results['elapsed_s']}s (send lag p99 {results['send_lag_p99_ms']}ms)")
+    old = previous["results"]["endpoints"] if previous else {}
+
+    def cell(value, before):
+        if value is None:
+            return "-"
+        if before is None:
+            return f"{value}"
+        change = (value - before) / before if before else 0.0
+        return f"{value} ({change:+.0%})"
+
+    for endpoint, stats in results["endpoints"].items():
+        prior = old.get(endpoint, {})
+        parts = [f"{endpoint:<16} n={stats['requests']:<5} errors={stats['errors']:<4}",
+                 f"rps={cell(stats['throughput_rps'], prior.get('throughput_rps'))}"]
+        for key in ("latency", "first_ndjson_line"):
+            if key in stats:
+                parts.append(key + " " + " ".join(
+                    f"{p}={cell(v, prior.get(key, {}).get(p))}" for p, v in stats[key].items()))
+        print("  ".join(parts))
+    print("DB ops:", ", ".join(f"{name}={calls}" for name, calls in results["db_ops"].items()) or "none recorded")
+    if results["llm_calls"]:
+        print("LLM:", ", ".join(f"{name}={count}" for name, count in results["llm_calls"].items()))
+    if previous:
+        print(f"(compared with {previous['label']} at {previous['commit']}, {previous['timestamp']})")
+
+
+def load_previous(compare):
+    if compare == "last":
+        runs = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), key=os.path.getmtime)
+        compare = runs[-1] if runs else None
+    if not compare:
+        return None
+    with open(compare) as f:
+        return json.load(f)
+
+
+def parse_mix(value):
+    mix = dict.fromkeys(ENDPOINTS, 0.0)
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in mix:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}; expected one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("parse=1,parse_free_text=2,contacts=7"),
+                        help="endpoint weights, e.g. parse=1,parse_free_text=2,contacts=7")
+    parser.add_argument("--emails", type=int, default=20, help="emails per /parse request")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="load a running backend instead of starting one (and the mock)")
+    parser.add_argument("--workers", type=int, default=1, help="serve.py workers when starting the backend")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.3)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0)
+    parser.add_argument("--llm-error-rate", type=float, default=0)
+    parser.add_argument("--llm-rate-limit-rate", type=float, default=0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--compare", help='earlier results file, or "last"')
+    args = parser.parse_args()
+
+    previous = load_previous(args.compare)
+    if args.url:
+        url, llm_url, stop = args.url.rstrip("/"), None, lambda: None
+    else:
+        url, llm_url, stop = start_stack(args)
+    try:
+        results = asyncio.run(run_load(args, url, llm_url))
+    finally:
+        stop()
+
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    report = {
+        "label": args.label,
+        "timestamp": timestamp,
+        "commit": _git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k != "compare"},
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{args.label}-{timestamp}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report, previous)
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Extraction throughput and latency of the hosted backend against the local model pool.
+
+The hosted path calls the mock LLM server (Tests/mock_llm_server.py) through
+the dispatcher, with network-like latency and generation speed. The local
+path runs Utils/local_llm.py workers with the mock's LocalRuntime. It gives
+the same answers and spins the CPU at a CPU model's prompt and generation
+speeds. Both backends get the same fresh emails, packed to each one's
+budget, with `--concurrency` chunks in flight. The report has emails/s, per-chunk
+latency and the local pool's warm-up time.
+
+Pass --runtime gpt4all (and LOCAL_LLM_MODEL / LOCAL_LLM_MODEL_PATH) to time
+a real local model instead of the stand-in.
+
+Run from the backend directory:
+    python -m Tests.local_backend_benchmark [--emails 400] [--concurrency 8] [--local-workers 2] ...
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from Tests.mock_llm_server import MockConfig, serve as serve_mock
+from Tests.multiprocess_benchmark import free_port, wait_for_port
+
+
+def make_emails(n):
+    return [{
+        "subject": f"Project sync #{i}",
+        "sender": "pm@example.edu",
+        "snippet": f"Hi all, the project sync moves to Thursday May {i % 28 + 1} at 3pm in Sci 204. "
+                   "Please bring your status updates and the draft of the report.",
+        "gmailThread": f"bench{i:05d}",
+    } for i in range(n)]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(backend, blocks, emails, concurrency, structured, max_chunk_tokens):
+    from DAL.gmail_dal import pack_blocks
+    from Utils import openai_utils
+
+    overhead, budget = openai_utils.extraction_budget(structured, backend)
+    chunks = [(pieces, tokens + overhead)
+              for pieces, tokens in pack_blocks(blocks, max_tokens=min(budget, max_chunk_tokens))]
+
+    warm_up = 0.0
+    if backend == "local":
+        start = time.perf_counter()
+        await openai_utils.get_local_pool()
+        warm_up = time.perf_counter() - start
+    limit = asyncio.Semaphore(concurrency)
+    latencies, events, failed = [], 0, 0
+
+    async def run_chunk(pieces, tokens):
+        nonlocal events, failed
+        async with limit:
+            start = time.perf_counter()
+            try:
+                result = await openai_utils.extract_events(pieces, "bench@example.edu", tokens, structured, backend)
+            except Exception:
+                # e.g. a json-mode reply cut off at max_tokens, as in /parse
+                failed += 1
+                result = []
+            latencies.append(time.perf_counter() - start)
+            events += len(result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_chunk(pieces, tokens) for pieces, tokens in chunks))
+    wall = time.perf_counter() - start
+    pool = openai_utils.local_pool_stats() if backend == "local" else None
+    batches = f"  batches={pool['batches']}" if pool else ""
+    print(f"{backend:<7} emails={emails:<5} chunks={len(chunks):<4} events={events:<5} failed={failed:<3} {wall:7.2f}s "
+          f"{emails / wall:8.1f} emails/s  chunk p50={percentile(latencies, 0.5) * 1000:7.0f}ms "
+          f"p95={percentile(latencies, 0.95) * 1000:7.0f}ms  warm-up={warm_up:.2f}s{batches}")
+
+
+async def main(args):
+    from DAL.gmail_dal import build_email_blocks
+    from Utils import openai_utils
+
+    blocks, _ = build_email_blocks(make_emails(args.emails), prefilter=False)
+    await openai_utils.init_client()
+    try:
+        for backend in args.backends:
+            await run(backend, blocks, args.emails, args.concurrency, args.structured, args.max_chunk_tokens)
+    finally:
+        await openai_utils.close_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8, help="chunks in flight")
+    parser.add_argument("--structured", action="store_true", help="use the json_schema extraction mode")
+    # Full-size json-mode chunks make replies longer than max_tokens; this keeps them whole
+    parser.add_argument("--max-chunk-tokens", type=int, default=2000, help="email tokens per chunk at most")
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"])
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="hosted: seconds before the first byte")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80, help="hosted: generation speed")
+    parser.add_argument("--local-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--local-batch", type=int, default=1)
+    parser.add_argument("--local-tokens-per-second", type=float, default=400,
+                        help="stand-in runtime: generation speed of one worker")
+    parser.add_argument("--runtime", default="Tests.mock_llm_server:LocalRuntime")
+    args = parser.parse_args()
+
+    port = free_port()
+    mock = multiprocessing.Process(target=serve_mock, daemon=True, args=(port, MockConfig(
+        latency=args.llm_latency, jitter=0.2, tokens_per_second=args.llm_tokens_per_second)))
+    mock.start()
+    wait_for_port(port)
+    # Read when Utils is imported, so set before main() imports it
+    os.environ.update(
+        EVENTS_DB=os.path.join(tempfile.mkdtemp(prefix="local_backend_"), "events.db"), LLM_CACHE="0",
+        OPENAI_API_KEY="mock", OPENAI_BASE_URL=f"http://127.0.0.1:{port}/v1", OPENAI_HTTP2="0",
+        LOCAL_LLM_RUNTIME=args.runtime, LOCAL_LLM_WORKERS=str(args.local_workers),
+        LOCAL_LLM_BATCH=str(args.local_batch), MOCK_LOCAL_TOKENS_PER_SECOND=str(args.local_tokens_per_second))
+    os.environ.setdefault("LLM_REQUESTS_PER_MIN", "1000000000")
+    os.environ.setdefault("LLM_TOKENS_PER_MIN", "1000000000000")
+    try:
+        asyncio.run(main(args))
+    finally:
+        mock.terminate()
@@ -0,0 +1,273 @@
+"""Deterministic local stand-in for the OpenAI /v1/chat/completions endpoint.
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 (and
+OPENAI_HTTP2=0, since it speaks HTTP/1.1). It answers every prompt the
+backend sends:
+
+- Gmail extraction (json_object or json_schema): events for each
+  `gmailThread:` block of the prompt, with `source` set in schema mode
+- /parse_free_text: one event with the emails found in the text as participants
+- stream=True: the same content as SSE deltas, paced at --tokens-per-second
+
+Latency, 5xx and 429 (with Retry-After) injection are drawn from a random
+generator seeded by --seed, the request body and how many times that body
+was sent before. The same run therefore gets the same failures in any
+arrival order, and a retried request gets a fresh draw. Replies longer
+than the request's max_tokens are cut off with finish_reason "length".
+GET /stats returns the request counters.
+
+LocalRuntime gives the same answers as a local-model runtime for
+Utils/local_llm.py (LOCAL_LLM_RUNTIME=Tests.mock_llm_server:LocalRuntime).
+It spins the CPU for the time a CPU model would take to read the prompt
+and generate the reply.
+
+Run from the backend directory:
+    python -m Tests.mock_llm_server [--port 8089] [--latency 0.5] [--error-rate 0.02] ...
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+
+_BLOCK_RE = re.compile(r"^gmailThread: (.*)\nFrom: (.*)\nSubject: (.*)$", re.MULTILINE)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_FREE_TEXT_RE = re.compile(r"Text to analyze:\s*(.*)", re.DOTALL)
+# The real tokenizer averages about four characters of JSON per token
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class MockConfig:
+    latency: float = float(os.getenv("MOCK_LLM_LATENCY", "0"))
+    jitter: float = float(os.getenv("MOCK_LLM_JITTER", "0"))
+    tokens_per_second: float = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "0"))
+    error_rate: float = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+    rate_limit_rate: float = float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0"))
+    retry_after: float = float(os.getenv("MOCK_LLM_RETRY_AFTER", "1"))
+    events_per_email: int = int(os.getenv("MOCK_LLM_EVENTS_PER_EMAIL", "1"))
+    events_file: str | None = os.getenv("MOCK_LLM_EVENTS_FILE")
+    seed: int = int(os.getenv("MOCK_LLM_SEED", "0"))
+
+
+class MockLLM:
+    """ASGI app; one instance per server process."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.templates = None
+        if config.events_file:
+            with open(config.events_file) as f:
+                self.templates = json.load(f)
+        self.counters = Counter()
+        # Times each request body was seen, so retries draw differently
+        self._attempts: OrderedDict[str, int] = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] == "GET" and scope["path"].endswith("/stats"):
+            await _send_json(send, 200, dict(self.counters))
+            return
+        if not scope["path"].endswith("/chat/completions"):
+            await _send_json(send, 404, {"error": {"message": "not found"}})
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        rng = self._rng(body)
+        payload = json.loads(body)
+        self.counters["requests"] += 1
+
+        await asyncio.sleep(self.config.latency * (1 + self.config.jitter * (2 * rng.random() - 1)))
+        roll = rng.random()
+        if roll < self.config.rate_limit_rate:
+            self.counters["rate_limited"] += 1
+            await _send_json(send, 429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                             [(b"retry-after", str(self.config.retry_after).encode())])
+            return
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self.counters["errors"] += 1
+            await _send_json(send, 500, {"error": {"message": "The server had an error", "type": "server_error"}})
+            return
+
+        content, events = self._completion(payload)
+        max_chars = payload.get("max_tokens", 4096) * CHARS_PER_TOKEN
+        finish_reason = "stop"
+        if len(content) > max_chars:
+            content, finish_reason = content[:max_chars], "length"
+            self.counters["truncated"] += 1
+        self.counters["events"] += events
+        usage = {"prompt_tokens": len(body) // CHARS_PER_TOKEN, "completion_tokens": len(content) // CHARS_PER_TOKEN}
+
+        if payload.get("stream"):
+            self.counters["streamed"] += 1
+            await self._stream(send, content, finish_reason)
+        else:
+            await asyncio.sleep(self._generation_time(content))
+            await _send_json(send, 200, {
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+    def _rng(self, body: bytes) -> random.Random:
+        digest = hashlib.sha1(body).hexdigest()
+        attempt = self._attempts.pop(digest, 0)
+        self._attempts[digest] = attempt + 1
+        if len(self._attempts) > 100_000:
+            self._attempts.popitem(last=False)
+        return random.Random(f"{self.config.seed}:{digest}:{attempt}")
+
+    def _generation_time(self, content: str) -> float:
+        if not self.config.tokens_per_second:
+            return 0.0
+        return len(content) / CHARS_PER_TOKEN / self.config.tokens_per_second
+
+    def _completion(self, payload: dict) -> tuple[str, int]:
+        """Reply text for a request, and the number of events in it."""
+        prompt = payload["messages"][-1]["content"]
+        schema = (payload.get("response_format") or {}).get("type") == "json_schema"
+        blocks = _BLOCK_RE.findall(prompt)
+        if blocks:
+            events = [self._email_event(source, *block, n)
+                      for source, block in enumerate(blocks) for n in range(self.config.events_per_email)]
+            if not schema:
+                for event in events:
+                    event.pop("source")
+        else:
+            match = _FREE_TEXT_RE.search(prompt)
+            events = [self._free_text_event(match.group(1).strip() if match else prompt)]
+        return json.dumps({"events": events}), len(events)
+
+    def _email_event(self, source, thread, sender, subject, n):
+        template = self.templates[(source + n) % len(self.templates)] if self.templates else {
+            "event": subject.strip() or "Meeting",
+            "time": {"start": f"2025-05-{source % 28 + 1:02d}T{9 + n % 3:02d}:00", "end": "", "zone": "",
+                     "recurrence": ""},
+            "context": "",
+        }
+        suffix = f" ({n + 1})" if n else ""
+        return {
+            "source": source,
+            **template,
+            "event": template["event"] + suffix,
+            "raw_subject": subject + suffix,
+            "sender": sender,
+            "gmailThread": thread,
+        }
+
+    @staticmethod
+    def _free_text_event(text):
+        return {
+            "title": " ".join(text.split()[:6]) or "Meeting",
+            "time": {"start": "2025-05-01T15:00", "end": "2025-05-01T16:00", "zone": ""},
+            "participants": sorted(set(_EMAIL_RE.findall(text))),
+            "description": text[:200],
+        }
+
+    async def _stream(self, send, content, finish_reason):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]})
+
+        async def frame(delta, finish=None):
+            chunk = {"object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(chunk)}\n\n".encode(),
+                        "more_body": True})
+
+        await frame({"role": "assistant", "content": ""})
+        # One frame per token like the real API; sleep per batch of frames to keep timers coarse
+        batch = max(1, int(self.config.tokens_per_second * 0.02))
+        for start in range(0, len(content), CHARS_PER_TOKEN * batch):
+            piece = content[start:start + CHARS_PER_TOKEN * batch]
+            for offset in range(0, len(piece), CHARS_PER_TOKEN):
+                await frame({"content": piece[offset:offset + CHARS_PER_TOKEN]})
+            await asyncio.sleep(self._generation_time(piece))
+        await frame({}, finish_reason)
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+
+class LocalRuntime:
+    """Stand-in for a local model in a Utils/local_llm.py worker.
+
+    Costs are busy CPU time, not sleeps, so workers compete for cores like a
+    real model would: MOCK_LOCAL_LOAD_SECONDS to load, MOCK_LOCAL_PREFILL_TPS
+    prompt tokens/s and MOCK_LOCAL_TOKENS_PER_SECOND generated tokens/s.
+    """
+
+    def __init__(self, model, model_path, threads, n_ctx):
+        self.mock = MockLLM(MockConfig())
+        self.prefill_tps = float(os.getenv("MOCK_LOCAL_PREFILL_TPS", "2000"))
+        self.tokens_per_second = float(os.getenv("MOCK_LOCAL_TOKENS_PER_SECOND", "400"))
+        _spin(float(os.getenv("MOCK_LOCAL_LOAD_SECONDS", "0")))
+
+    def complete_batch(self, requests):
+        return [self._complete(*request) for request in requests]
+
+    def _complete(self, system, prompt, max_tokens, temperature):
+        # _post_local writes the schema into the system prompt; the schema asks for `source`
+        kind = "json_schema" if '"source"' in system else "json_object"
+        content, _ = self.mock._completion({"messages": [{"role": "user", "content": prompt}],
+                                            "response_format": {"type": kind}})
+        finish_reason = "stop"
+        if len(content) > max_tokens * CHARS_PER_TOKEN:
+            content, finish_reason = content[:max_tokens * CHARS_PER_TOKEN], "length"
+        _spin((len(system) + len(prompt)) / CHARS_PER_TOKEN / self.prefill_tps
+              + len(content) / CHARS_PER_TOKEN / self.tokens_per_second)
+        return content, finish_reason
+
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def _send_json(send, status, body, headers=()):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), *headers]})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+def serve(port: int, config: MockConfig | None = None, host: str = "127.0.0.1"):
+    """Run the mock in this process (blocking); start it in a multiprocessing.Process from scripts."""
+    import uvicorn
+    uvicorn.run(MockLLM(config or MockConfig()), host=host, port=port, log_level="error", lifespan="off")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    defaults = MockConfig()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="latency varies by ± this fraction")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second,
+                        help="generation speed after the first byte; 0 sends the reply at once")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="share of requests answered 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate,
+                        help="share of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Retry-After seconds on 429s")
+    parser.add_argument("--events-per-email", type=int, default=defaults.events_per_email)
+    parser.add_argument("--events-file", default=defaults.events_file,
+                        help="JSON list of event templates to answer with instead of the generated ones")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    print(f"Mock LLM on http://{host}:{port}/v1", flush=True)
+    serve(port, MockConfig(**args), host)
+
+
+if __name__ == "__main__":
+    main()
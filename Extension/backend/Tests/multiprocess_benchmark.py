@@ -0,0 +1,125 @@
+"""/parse throughput of serve.py at different worker counts, with the LLM stubbed.
+
+Starts the mock LLM (Tests/mock_llm_server.py) answering instantly with one
+event per email, then for each worker count starts `serve.py --workers N` against
+it and keeps CONCURRENCY /parse requests in flight for DURATION seconds.
+Every request carries fresh emails, so nothing is skipped as already
+processed and all the CPU work happens: block building, prefiltering,
+token counting, packing, JSON and dedup writes.
+
+Run from the backend directory:
+    python -m Tests.multiprocess_benchmark [workers ...]
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from Tests.mock_llm_server import serve as serve_mock
+
+DURATION = float(os.getenv("BENCH_DURATION", "15"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "32"))
+EMAILS_PER_REQUEST = int(os.getenv("BENCH_EMAILS", "40"))
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on {port}")
+
+
+_ids = itertools.count()
+
+
+def request_body():
+    n = next(_ids)
+    emails = [{
+        "subject": f"Project sync #{n}-{i}",
+        "sender": "pm@example.edu",
+        "snippet": f"Hi all, the project sync moves to Thursday May {i % 28 + 1} at 3pm in Sci 204. "
+                   "Please bring your status updates and the draft of the report. " * 3,
+        "gmailThread": f"r{n}t{i}",
+    } for i in range(EMAILS_PER_REQUEST)]
+    return {"text": json.dumps({"emails": emails}), "user_timezone": "America/New_York", "stream_mode": "delta"}
+
+
+async def load(port):
+    latencies = []
+    deadline = time.monotonic() + DURATION
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+        async def user():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                resp = await client.post("/parse", json=request_body())
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+        start = time.monotonic()
+        await asyncio.gather(*(user() for _ in range(CONCURRENCY)))
+        return latencies, time.monotonic() - start
+
+
+def run(workers, llm_port):
+    port = free_port()
+    env = dict(os.environ,
+               EVENTS_DB=os.path.join(tempfile.mkdtemp(prefix="mp_bench_"), "events.db"),
+               LLM_CACHE="0", OPENAI_API_KEY="stub", OPENAI_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+               OPENAI_HTTP2="0", GMAIL_STREAM_EVENTS="0", JOB_WORKERS="0",
+               # Measure the server, not the provider rate limits the dispatcher enforces
+               LLM_REQUESTS_PER_MIN="1000000000", LLM_TOKENS_PER_MIN="1000000000000")
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)],
+                              cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        asyncio.run(load_warmup(port))
+        latencies, elapsed = asyncio.run(load(port))
+    finally:
+        server.terminate()
+        server.wait(60)
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+async def load_warmup(port):
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+        await asyncio.gather(*(client.post("/parse", json=request_body()) for _ in range(CONCURRENCY)))
+
+
+def main(worker_counts):
+    llm_port = free_port()
+    stub = multiprocessing.Process(target=serve_mock, args=(llm_port,), daemon=True)
+    stub.start()
+    wait_for_port(llm_port)
+    print(f"cores={os.cpu_count()} concurrency={CONCURRENCY} emails/request={EMAILS_PER_REQUEST} duration={DURATION}s")
+    baseline = None
+    try:
+        for workers in worker_counts:
+            rps, p50, p95 = run(workers, llm_port)
+            baseline = baseline or rps / workers
+            print(f"workers={workers:<3} {rps:8.1f} req/s  p50={p50 * 1000:7.1f}ms p95={p95 * 1000:7.1f}ms  "
+                  f"scaling efficiency {rps / (baseline * workers):5.0%}")
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1, 2, 4])
@@ -0,0 +1,41 @@
+"""Precision/recall of the nlp.py pre-filter on a labeled fixture set.
+
+An email counts as a positive prediction when the filter keeps it. Recall
+is what matters most: a scheduling email dropped here never reaches the LLM.
+
+Run from the backend directory:
+    python -m Tests.prefilter_eval [threshold ...]
+"""
+import json
+import os
+import sys
+
+from nlp import PREFILTER_THRESHOLD, filter_scheduling_emails
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "prefilter_emails.json")
+
+
+def evaluate(emails, threshold):
+    kept, _ = filter_scheduling_emails(emails, threshold)
+    kept_ids = {email["gmailThread"] for email in kept}
+    tp = sum(1 for e in emails if e["scheduling"] and e["gmailThread"] in kept_ids)
+    fp = sum(1 for e in emails if not e["scheduling"] and e["gmailThread"] in kept_ids)
+    fn = sum(1 for e in emails if e["scheduling"] and e["gmailThread"] not in kept_ids)
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    dropped = 1 - len(kept) / len(emails)
+    return precision, recall, dropped, [e["subject"] for e in emails if e["scheduling"] and e["gmailThread"] not in kept_ids]
+
+
+def main(thresholds):
+    with open(FIXTURES) as f:
+        emails = json.load(f)
+    for threshold in thresholds:
+        precision, recall, dropped, missed = evaluate(emails, threshold)
+        print(f"threshold={threshold:<4} precision={precision:.2f} recall={recall:.2f} dropped={dropped:.0%}")
+        for subject in missed:
+            print(f"    missed: {subject}")
+
+
+if __name__ == "__main__":
+    main([float(arg) for arg in sys.argv[1:]] or [0.5, PREFILTER_THRESHOLD, 1.5, 2.0, 3.0])
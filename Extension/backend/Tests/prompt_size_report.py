@@ -0,0 +1,113 @@
+"""Input tokens per email for /parse extraction, before and after prompt compaction.
+
+"Before" rebuilds every chunk with the old all-in-the-user-message prompt and
+4000-token chunks. "After" uses GMAIL_SYSTEM_PROMPT plus the short per-chunk
+user message, with chunks budgeted against MAX_REQUEST_TOKENS. The uncached
+column counts the system prefix only once when it is long enough for the
+provider's prompt cache (1024 tokens for OpenAI).
+
+Run from the backend directory:
+    python -m Tests.prompt_size_report [n_emails]
+"""
+import json
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("EVENTS_DB", os.path.join(tempfile.mkdtemp(prefix="prompt_report_"), "events.db"))
+
+from DAL.gmail_dal import (  # noqa: E402
+    MAX_REQUEST_TOKENS, build_email_blocks, chunk_blocks, count_tokens, prompt_overhead_tokens,
+)
+from Utils.openai_utils import GMAIL_SYSTEM_PROMPT, _build_prompt  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "prefilter_emails.json")
+PROVIDER_CACHE_MIN_TOKENS = 1024
+USER_TIMEZONE = "America/New_York"
+
+LEGACY_SYSTEM = (
+    "You are a precise assistant that extracts scheduling-related information "
+    "from user-provided website text. Your output MUST be a valid JSON object only. "
+    "Focus on real events, meetings, deadlines, workshops, and reminders. "
+    "Ignore promotions, ads, news articles, and anything unrelated to scheduling. "
+    "Be strict. Output clean, deduplicated, readable data."
+)
+
+
+def legacy_build_prompt(chunk, user_timezone):
+    example_event = {
+        "event": "CS Department Info Session",
+        "raw_subject": "[Reminder] CS Dept Fall info session today!",
+        "time": {"iso": "2025-04-10T16:30/2025-04-10T17:30", "display": "April 10, 4:30 PM – 5:30 PM"},
+        "context": "Fall course planning event in Sci 204",
+        "sender": "Chris Murphy",
+        "urgency": "high",
+        "gmailThread": "17a4c5f0b1c…",
+    }
+    example_block = json.dumps({"events": [example_event]}, indent=2)
+    return f"""
+Extract only scheduling-related information that a college student might reasonably want to add to their calendar.
+
+Format each event as a JSON object with exactly these fields:
+- event: A short, cleaned title for the event (something nice to display to the user)
+- raw_subject: The original subject line from the message (to use it for identifying duplicates later)
+- time: ▸iso: A **single ISO-8601 string** (converted to {user_timezone}) that the UI can pass straight to Google Calendar
+          • If you know both start and end →  `"YYYY-MM-DDTHH:MM/YYYY-MM-DDTHH:MM"`
+          • If you know only the start → `"YYYY-MM-DDTHH:MM"`
+          • If only a day is clear → `"YYYY-MM-DD"`
+          • Otherwise output `"Not specified"`
+        ▸display: The time converted to {user_timezone} in whatever is easiest for a person to read (e.g.,"Every Tuesday, 1–2 PM", "April 10, 4:30 PM EST"). If iso is "Not specified", set display to "Not specified" as well.
+- context: Brief description or purpose of the event
+- sender: Who sent or organized it
+- urgency: "high", "medium", or "low" (based on time sensitivity and proximity)
+- gmailThread: The thread ID of the email this event came from.
+
+TIME ZONE RULES:
+• If a time zone (e.g., EST, PST, GMT) is mentioned in the text, respect it and convert the time from that timezone to {user_timezone}.
+• If no time zone is mentioned, assume the user's time zone is {user_timezone}
+• The ISO string should be the offsetted time(ie converted to the {user_timezone}) (e.g., -05:00 for EST)
+• The display time should also be the converted time and it should be in the {user_timezone}. Also add the usertimezone at the end e.g EST
+
+FIELD RULES
+•urgency
+    -high : starts in ≤48h or hard deadline in ≤48h
+    -medium : within 7 days
+    -low : later than 7 days or date unclear
+• gmailMsgId / gmailThread - take from `data-legacy-message-id` and `data-legacy-thread-id`
+
+Do not explain anything. Do not include markdown. Only output pure JSON.
+
+Output ONLY a valid JSON object like this:
+{example_block}
+
+Text to analyze:
+{chunk}
+"""
+
+
+def inbox(n):
+    with open(FIXTURES) as f:
+        fixtures = json.load(f)
+    return [dict(fixtures[i % len(fixtures)], gmailThread=f"thread{i:06d}") for i in range(n)]
+
+
+def main(n):
+    blocks, _ = build_email_blocks(inbox(n), prefilter=False)
+
+    legacy_chunks = chunk_blocks(blocks, max_tokens=4000, balanced=False)
+    legacy_system = count_tokens(LEGACY_SYSTEM)
+    legacy_total = sum(legacy_system + count_tokens(legacy_build_prompt(chunk, USER_TIMEZONE)) for chunk in legacy_chunks)
+
+    overhead = prompt_overhead_tokens(GMAIL_SYSTEM_PROMPT, _build_prompt(""))
+    chunks = chunk_blocks(blocks, max_tokens=MAX_REQUEST_TOKENS - overhead)
+    system = count_tokens(GMAIL_SYSTEM_PROMPT)
+    total = sum(system + count_tokens(_build_prompt(chunk)) for chunk in chunks)
+    uncached = total - (system * (len(chunks) - 1) if system >= PROVIDER_CACHE_MIN_TOKENS else 0)
+
+    print(f"emails={n} system prompt tokens: before={legacy_system} after={system} (request overhead {overhead})")
+    print(f"before: chunks={len(legacy_chunks):<4} tokens/email={legacy_total / n:7.1f}")
+    print(f"after:  chunks={len(chunks):<4} tokens/email={total / n:7.1f} uncached tokens/email={uncached / n:7.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,163 @@
+"""Send N identical requests at once and check that each chunk reaches the LLM only once.
+
+The LLM is a mock transport that counts calls and answers slowly, so all N
+requests are in flight together. For /parse (streamed, json and structured
+modes) and /parse_free_text it checks that:
+  - the LLM saw one call per chunk, not N
+  - every request completed without errors
+  - across the N responses each event is reported exactly once, because
+    remove_duplicates still runs per request after the shared call
+  - the coalesced counter accounts for the other N - 1 callers of each chunk
+
+It also checks that a caller who goes away doesn't cancel the shared call
+for the others, and that the call is cancelled once nobody waits for it.
+
+Run from the backend directory:
+    python -m Tests.single_flight [n_requests]
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+
+os.environ["EVENTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="single_flight_"), "events.db")
+os.environ["LLM_CACHE"] = "0"
+# The mock has no quota; export LLM_REQUESTS_PER_MIN / LLM_TOKENS_PER_MIN to test the real limits
+os.environ.setdefault("LLM_REQUESTS_PER_MIN", "1000000000")
+os.environ.setdefault("LLM_TOKENS_PER_MIN", "1000000000000")
+os.environ["PREFILTER"] = "0"
+os.environ["JOB_WORKERS"] = "0"
+os.environ.setdefault("MAX_REQUEST_TOKENS", "1500")
+
+import httpx  # noqa: E402
+
+import app  # noqa: E402
+from Utils import openai_utils  # noqa: E402
+from Utils.single_flight import SingleFlight  # noqa: E402
+
+calls = {"count": 0}
+
+
+# Each mode's events on their own day, so fuzzy dedup doesn't match them with another mode's
+DAYS = {"stream": 2, "json": 5, "structured": 6}
+
+
+def _events(prompt, schema):
+    events = []
+    for source, thread in enumerate(re.findall(r"gmailThread: (\S+)", prompt)):
+        day = DAYS[thread.rstrip("0123456789")]
+        event = {"event": f"Review {thread}", "raw_subject": f"Review {thread}", "sender": "prof@example.edu",
+                 "time": {"start": f"2025-05-{day:02d}T10:00", "end": "", "zone": "", "recurrence": ""},
+                 "context": "", "gmailThread": thread}
+        events.append({"source": source, **event} if schema else event)
+    return events
+
+
+async def handler(request):
+    calls["count"] += 1
+    await asyncio.sleep(0.2)
+    payload = json.loads(request.content)
+    prompt = payload["messages"][-1]["content"]
+    if "gmailThread:" in prompt:
+        schema = payload["response_format"]["type"] == "json_schema"
+        content = json.dumps({"events": _events(prompt, schema)})
+    else:
+        content = json.dumps({"events": [{"title": "Budget review", "participants": ["dana@example.edu"],
+                                          "time": {"start": "2025-05-06T14:00", "end": "", "zone": ""}}]})
+    if payload.get("stream"):
+        frames = [f"data: {json.dumps({'choices': [{'delta': {'content': content[i:i + 40]}}]})}\n\n"
+                  for i in range(0, len(content), 40)]
+        return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                              content="".join(frames + ["data: [DONE]\n\n"]).encode())
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}, "finish_reason": "stop"}]})
+
+
+def inbox(tag, n=12):
+    return [{
+        "subject": f"Review {tag}{i}",
+        "sender": "prof@example.edu",
+        "snippet": f"The review session for unit {i} is on Friday May 2 at 10am in Sci 101. " * 8,
+        "gmailThread": f"{tag}{i:03d}",
+    } for i in range(n)]
+
+
+async def parse_concurrently(client, n, mode):
+    emails = inbox(mode)
+    body = {"text": json.dumps({"emails": emails}), "stream_mode": "delta"}
+    if mode == "structured":
+        body["extraction_mode"] = "structured"
+    else:
+        body["stream_events"] = mode == "stream"
+    before_calls, before = calls["count"], openai_utils.single_flight_stats()["coalesced"]
+    responses = await asyncio.gather(*(client.post("/parse", json=body) for _ in range(n)))
+    lines = [[json.loads(line) for line in (await resp.get_data()).decode().splitlines()] for resp in responses]
+    summaries = [resp_lines[-1] for resp_lines in lines]
+    threads = [event["gmailThread"] for resp_lines in lines for line in resp_lines for event in line["new_events"]]
+    chunks = summaries[0]["total_chunks"]
+    upstream = calls["count"] - before_calls
+    coalesced = openai_utils.single_flight_stats()["coalesced"] - before
+    print(f"/parse {mode:<10} requests={n} chunks={chunks} upstream calls={upstream} coalesced={coalesced} "
+          f"events={len(threads)}")
+    assert all(summary.get("complete") and summary["failed_chunks"] == 0 for summary in summaries), summaries
+    assert upstream == chunks, f"{upstream} upstream calls for {chunks} chunks"
+    assert coalesced == chunks * (n - 1), coalesced
+    assert sorted(threads) == [email["gmailThread"] for email in emails], "missing or repeated events"
+
+
+async def free_text_concurrently(client, n):
+    body = {"text": "Can we find an hour with dana@example.edu after the Tuesday standup to go over the budget?",
+            "user_timezone": "America/New_York", "user_now": "2025-04-28T10:00:00-04:00"}
+    before_calls = calls["count"]
+    responses = await asyncio.gather(*(client.post("/parse_free_text", json=body) for _ in range(n)))
+    results = [await resp.get_json() for resp in responses]
+    upstream = calls["count"] - before_calls
+    print(f"/parse_free_text  requests={n} upstream calls={upstream}")
+    assert all(resp.status_code == 200 for resp in responses), results
+    assert all(result["events"][0]["title"] == "Budget review" for result in results), results
+    assert upstream == 1, f"{upstream} upstream calls"
+
+
+async def check_cancellation():
+    flights, state = SingleFlight(), {"runs": 0, "cancelled": 0}
+
+    async def slow():
+        state["runs"] += 1
+        try:
+            await asyncio.sleep(0.2)
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        return "reply"
+
+    callers = [asyncio.create_task(flights.call("key", slow)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    callers[0].cancel()
+    results = await asyncio.gather(*callers, return_exceptions=True)
+    assert isinstance(results[0], asyncio.CancelledError) and results[1:] == ["reply", "reply"], results
+    assert state == {"runs": 1, "cancelled": 0}, state
+
+    callers = [asyncio.create_task(flights.call("key", slow)) for _ in range(2)]
+    await asyncio.sleep(0.05)
+    for caller in callers:
+        caller.cancel()
+    await asyncio.gather(*callers, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert state == {"runs": 2, "cancelled": 1} and flights.stats()["in_flight"] == 0, state
+    print("cancellation: others keep the shared call; it stops when every caller has gone")
+
+
+async def main(n):
+    async with app.app.test_app() as test_app:
+        openai_utils._client = httpx.AsyncClient(base_url="http://mock/v1", transport=httpx.MockTransport(handler))
+        client = test_app.test_client()
+        for mode in ("stream", "json", "structured"):
+            await parse_concurrently(client, n, mode)
+        await free_text_concurrently(client, n)
+    await check_cancellation()
+    print(openai_utils.single_flight_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8))
@@ -0,0 +1,165 @@
+"""Cold-start time of the backend: process start to first response and to ready.
+
+Each run starts a fresh server process on an empty database and polls
+GET /ready until it answers 200. It records:
+  - import: time to import the app (single-process mode only)
+  - first response: process start to the first HTTP response of any status
+  - ready: process start to /ready answering 200, and the warm-up steps'
+    own times as the server reports them
+
+`--workers 1` starts the app directly under uvicorn, as `python app.py` does.
+`--workers N` starts `serve.py --workers N`, where the parent warms up before
+forking.
+
+Results are written to Tests/results/startup/<label>-<timestamp>.json with
+the commit they were measured at. Pass --compare with an earlier results
+file, or "last", to print the change.
+
+Run from the backend directory:
+    python -m Tests.startup_benchmark [--runs 5] [--workers 1] [--compare last]
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from Tests.load_test import _git_commit
+from Tests.multiprocess_benchmark import BACKEND_DIR, free_port
+
+RESULTS_DIR = os.path.join(BACKEND_DIR, "Tests", "results", "startup")
+
+# Imports and serves the app the way app.py does, printing the import time first
+_LAUNCHER = """
+import sys, time
+began = time.perf_counter()
+import app
+print(time.perf_counter() - began, flush=True)
+import uvicorn
+uvicorn.run(app.app, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def start_server(workers, port, env):
+    if workers == 1:
+        command = [sys.executable, "-c", _LAUNCHER, str(port)]
+    else:
+        command = [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port)]
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True)
+
+
+def one_run(workers, timeout):
+    port = free_port()
+    env = dict(os.environ, EVENTS_DB=os.path.join(tempfile.mkdtemp(prefix="startup_bench_"), "events.db"),
+               LLM_CACHE_DB=os.path.join(tempfile.mkdtemp(prefix="startup_bench_"), "llm_cache.db"),
+               OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "startup-benchmark"), JOB_WORKERS="0")
+    began = time.perf_counter()
+    server = start_server(workers, port, env)
+    first_response = ready = None
+    try:
+        with httpx.Client(timeout=1) as client:
+            while time.perf_counter() - began < timeout:
+                try:
+                    response = client.get(f"http://127.0.0.1:{port}/ready")
+                except httpx.TransportError:
+                    if server.poll() is not None:
+                        raise RuntimeError(f"server exited with status {server.returncode}")
+                    time.sleep(0.005)
+                    continue
+                now = time.perf_counter() - began
+                first_response = first_response or now
+                if response.status_code == 200:
+                    ready = now
+                    break
+                time.sleep(0.005)
+        if ready is None:
+            raise RuntimeError(f"not ready after {timeout}s")
+        status = response.json()
+    finally:
+        server.terminate()
+        server.wait(30)
+    imported = float(server.stdout.readline() or "nan") if workers == 1 else None
+    return {"import_s": imported, "first_response_s": first_response, "ready_s": ready, "steps": status["steps"]}
+
+
+def summarize(runs):
+    def median(key):
+        values = [run[key] for run in runs if run[key] is not None]
+        return round(statistics.median(values), 4) if values else None
+
+    steps = sorted({name for run in runs for name in run["steps"]})
+    return {
+        "import_s": median("import_s"),
+        "first_response_s": median("first_response_s"),
+        "ready_s": median("ready_s"),
+        "steps": {name: round(statistics.median(run["steps"].get(name, 0) for run in runs), 4) for name in steps},
+    }
+
+
+def print_report(report, previous=None):
+    old = previous["results"] if previous else {}
+
+    def cell(value, before):
+        if value is None:
+            return "-"
+        if not before:
+            return f"{value * 1000:.0f} ms"
+        return f"{value * 1000:.0f} ms ({(value - before) / before:+.0%})"
+
+    results = report["results"]
+    print(f"median of {report['config']['runs']} run(s), {report['config']['workers']} worker(s)")
+    for key in ("import_s", "first_response_s", "ready_s"):
+        print(f"  {key[:-2].replace('_', ' '):<16} {cell(results[key], old.get(key))}")
+    for name, seconds in results["steps"].items():
+        print(f"  step {name:<11} {cell(seconds, old.get('steps', {}).get(name))}")
+    if previous:
+        print(f"(compared with {previous['label']} at {previous['commit']}, {previous['timestamp']})")
+
+
+def load_previous(compare):
+    if compare == "last":
+        runs = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), key=os.path.getmtime)
+        compare = runs[-1] if runs else None
+    if not compare:
+        return None
+    with open(compare) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--label", default="startup")
+    parser.add_argument("--compare", help='earlier results file, or "last"')
+    args = parser.parse_args()
+
+    previous = load_previous(args.compare)
+    runs = [one_run(args.workers, args.timeout) for _ in range(args.runs)]
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    report = {
+        "label": args.label,
+        "timestamp": timestamp,
+        "commit": _git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k != "compare"},
+        "results": summarize(runs),
+        "runs": runs,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{args.label}-{timestamp}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report, previous)
+    print(f"Saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Time to first event for one /parse chunk, buffered vs streamed completion.
+
+A mock transport generates the completion at a fixed token rate, either as
+one JSON body (what _ask_openai_gmail waits for) or as an SSE stream that
+_stream_openai_gmail parses event by event. No network or API key needed.
+
+Run from the backend directory:
+    python -m Tests.streaming_ttfe_benchmark [events_per_chunk] [tokens_per_second]
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="stream_ttfe_")
+os.environ["EVENTS_DB"] = os.path.join(_tmpdir, "events.db")
+os.environ["LLM_CACHE"] = "0"
+# The mock has no quota; export LLM_REQUESTS_PER_MIN / LLM_TOKENS_PER_MIN to test the real limits
+os.environ.setdefault("LLM_REQUESTS_PER_MIN", "1000000000")
+os.environ.setdefault("LLM_TOKENS_PER_MIN", "1000000000000")
+
+import httpx  # noqa: E402
+
+from Utils import openai_utils  # noqa: E402
+
+FIRST_TOKEN_LATENCY = 0.4
+TOKENS_PER_PIECE = 4
+CHARS_PER_TOKEN = 4
+
+
+def completion_text(n_events):
+    events = [{
+        "event": f"Study group {i}",
+        "raw_subject": f"Re: study group for midterm {i}",
+        "time": {"start": f"2025-04-{10 + i % 18:02d}T16:30", "end": f"2025-04-{10 + i % 18:02d}T17:30",
+                 "zone": "", "recurrence": ""},
+        "context": "Midterm review session in the Science Center, bring practice problems",
+        "sender": "Teaching Assistant",
+        "gmailThread": f"thread{i:06d}",
+    } for i in range(n_events)]
+    return json.dumps({"events": events}, indent=2)
+
+
+def mock_transport(text, tokens_per_second):
+    piece = TOKENS_PER_PIECE * CHARS_PER_TOKEN
+    delay = TOKENS_PER_PIECE / tokens_per_second
+
+    async def sse():
+        await asyncio.sleep(FIRST_TOKEN_LATENCY)
+        for i in range(0, len(text), piece):
+            await asyncio.sleep(delay)
+            chunk = {"choices": [{"delta": {"content": text[i:i + piece]}}]}
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    async def handler(request):
+        if json.loads(request.content).get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=sse())
+        await asyncio.sleep(FIRST_TOKEN_LATENCY + delay * len(text) / piece)
+        return httpx.Response(200, json={"choices": [{"message": {"content": text}, "finish_reason": "stop"}]})
+
+    return httpx.MockTransport(handler)
+
+
+async def run(n_events, tokens_per_second):
+    text = completion_text(n_events)
+    openai_utils._client = httpx.AsyncClient(base_url="http://mock/v1",
+                                             transport=mock_transport(text, tokens_per_second))
+    print(f"completion: {n_events} events, ~{len(text) // CHARS_PER_TOKEN} tokens at {tokens_per_second} tok/s")
+
+    start = time.perf_counter()
+    events = await openai_utils._ask_openai_gmail("bench prompt")
+    buffered = time.perf_counter() - start
+    print(f"buffered  first event {buffered:6.2f}s  last event {buffered:6.2f}s  events={len(events)}")
+
+    start = time.perf_counter()
+    first, count = None, 0
+    async for _ in openai_utils._stream_openai_gmail("bench prompt"):
+        count += 1
+        first = first or time.perf_counter() - start
+    last = time.perf_counter() - start
+    print(f"streamed  first event {first:6.2f}s  last event {last:6.2f}s  events={count}  "
+          f"time-to-first-event x{buffered / first:.1f} faster")
+
+
+def main():
+    n_events = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    tokens_per_second = float(sys.argv[2]) if len(sys.argv) > 2 else 80
+    asyncio.run(run(n_events, tokens_per_second))
+
+
+if __name__ == "__main__":
+    main()
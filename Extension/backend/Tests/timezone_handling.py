@@ -1,114 +1,111 @@
-import asyncio
-import requests
-import json
-import os
-
-
-# Replace with your actual OpenAI API key
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
-
-def _build_prompt(chunk:str, user_timezone: str)->str:
-    example_event = {
-    "event": "CS Department Info Session",
-    "raw_subject": "[Reminder] CS Dept Fall info session today!",
-    "time": {
-        "iso": "2025-04-10T16:30/2025-04-10T17:30",
-        "display": "April 10, 4:30 PM – 5:30 PM"
-    },
-    "context": "Fall course planning event in Sci 204",
-    "sender": "Chris Murphy",
-    "urgency": "high",
-    "gmailThread": "17a4c5f0b1c…"
-}
-    example_block = json.dumps({"events": [example_event]}, indent=2)
-    return f"""
-Extract only scheduling-related information that a college student might reasonably want to add to their calendar.
-
-Format each event as a JSON object with exactly these fields:
-- event: A short, cleaned title for the event (something nice to display to the user)
-- raw_subject: The original subject line from the message (to use it for identifying duplicates later)
-- time: ▸iso: A **single ISO-8601 string** (converted to {user_timezone}) that the UI can pass straight to Google Calendar  
-          • If you know both start and end →  `"YYYY-MM-DDTHH:MM/YYYY-MM-DDTHH:MM"`  
-          • If you know only the start → `"YYYY-MM-DDTHH:MM"`  
-          • If only a day is clear → `"YYYY-MM-DD"`  
-          • Otherwise output `"Not specified"`
-        ▸display: The time converted to {user_timezone} in whatever is easiest for a person to read (e.g.,"Every Tuesday, 1–2 PM", "April 10, 4:30 PM EST"). If iso is "Not specified", set display to "Not specified" as well.
-- context: Brief description or purpose of the event
-- sender: Who sent or organized it
-- urgency: "high", "medium", or "low" (based on time sensitivity and proximity)
-- gmailThread: The thread ID of the email this event came from.
-
-TIME ZONE RULES:
-• If a time zone (e.g., EST, PST, GMT) is mentioned in the text, respect it and convert the time from that timezone to {user_timezone}.
-• If no time zone is mentioned, assume the user's time zone is {user_timezone}
-• The ISO string should be the offsetted time(ie converted to the {user_timezone}) (e.g., -05:00 for EST)
-• The display time should also be the converted time and it should be in the {user_timezone}. Also add the usertimezone at the end e.g EST
-
-FIELD RULES 
-•urgency  
-    -high : starts in ≤48h or hard deadline in ≤48h  
-    -medium : within 7 days  
-    -low : later than 7 days or date unclear  
-• gmailMsgId / gmailThread - take from `data-legacy-message-id` and `data-legacy-thread-id`
-
-Do not explain anything. Do not include markdown. Only output pure JSON.
-
-Output ONLY a valid JSON object like this:
-{example_block}
-
-Text to analyze:
-{chunk}
+"""Check the local time normalization that replaced timezone math in the prompts.
+
+The model now copies times as written, plus the zone the text states. Each case
+below is a raw `time` object as the model would return it for a sample email,
+and the `iso`/`display`/`urgency` the UI should get for a user in New York:
+  - stated zones (EST, PST, GMT, offsets, IANA names) are converted
+  - no stated zone means the user's own
+  - ranges crossing midnight, date-only and recurring events render sensibly
+  - unparseable times become "Not specified" instead of a bad ISO string
+
+Then it times normalize_email_events on a large batch.
+
+Run from the backend directory:
+    python -m Tests.timezone_handling [events]
 """
+import sys
+import time
+from datetime import datetime
+
+from Utils.time_normalizer import get_zone, normalize_email_events, normalize_free_text_events
+
+USER_TIMEZONE = "America/New_York"
+NOW = datetime(2025, 4, 29, 9, 0, tzinfo=get_zone(USER_TIMEZONE))
+
+
+def raw(start, end="", zone="", recurrence=""):
+    return {"start": start, "end": end, "zone": zone, "recurrence": recurrence}
+
+
+CASES = [
+    # (description, model's raw time, expected iso, expected display, expected urgency)
+    ("'3 PM EST' on April 30",
+     raw("2025-04-30T15:00", zone="EST"), "2025-04-30T15:00", "April 30, 3:00 PM EDT", "high"),
+    ("'1 PM PST' office hours",
+     raw("2025-05-02T13:00", "2025-05-02T14:00", "PST"), "2025-05-02T16:00/2025-05-02T17:00",
+     "May 2, 4:00 PM – 5:00 PM EDT", "medium"),
+    ("no zone stated",
+     raw("2025-05-05T10:00"), "2025-05-05T10:00", "May 5, 10:00 AM EDT", "medium"),
+    ("'5:30 PM GMT' club meeting",
+     raw("2025-05-07T17:30", zone="GMT"), "2025-05-07T13:30", "May 7, 1:30 PM EDT", "low"),
+    ("UTC offset",
+     raw("2025-06-01T09:00", zone="GMT+2"), "2025-06-01T03:00", "June 1, 3:00 AM EDT", "low"),
+    ("IANA zone, across a day boundary",
+     raw("2025-04-30T08:00", "2025-04-30T09:30", "Asia/Tokyo"), "2025-04-29T19:00/2025-04-29T20:30",
+     "April 29, 7:00 PM – 8:30 PM EDT", "high"),
+    ("range past midnight",
+     raw("2025-05-03T23:00", "01:00"), "2025-05-03T23:00/2025-05-04T01:00",
+     "May 3, 11:00 PM – May 4, 1:00 AM EDT", "medium"),
+    ("offset written into the start",
+     raw("2025-04-30T12:00:00-07:00"), "2025-04-30T15:00", "April 30, 3:00 PM EDT", "high"),
+    ("deadline day only",
+     raw("2025-05-01"), "2025-05-01", "May 1", "high"),
+    ("multi-day conference",
+     raw("2025-06-10", "2025-06-12"), "2025-06-10/2025-06-12", "June 10 – June 12", "low"),
+    ("next year",
+     raw("2026-01-15T10:00"), "2026-01-15T10:00", "January 15, 2026, 10:00 AM EST", "low"),
+    ("recurring, no date",
+     raw("13:00", "14:00", "CT", "Every Tuesday"), "Not specified", "Every Tuesday, 2:00 PM – 3:00 PM EDT", "low"),
+    ("already over",
+     raw("2025-04-28T10:00", "2025-04-28T11:00"), "2025-04-28T10:00/2025-04-28T11:00",
+     "April 28, 10:00 AM – 11:00 AM EDT", "low"),
+    ("unknown zone falls back to the user's",
+     raw("2025-05-01T09:00", zone="Mars Time"), "2025-05-01T09:00", "May 1, 9:00 AM EDT", "high"),
+    ("garbage", raw("sometime next week"), "Not specified", "Not specified", "low"),
+    ("nothing", raw(""), "Not specified", "Not specified", "low"),
+    ("legacy iso reply", {"iso": "2025-05-02T16:00/2025-05-02T17:00", "display": "whatever"},
+     "2025-05-02T16:00/2025-05-02T17:00", "May 2, 4:00 PM – 5:00 PM EDT", "medium"),
+]
+
+FREE_TEXT_CASES = [
+    ("'4pm PST' quick add",
+     raw("2025-04-30T16:00", "2025-04-30T17:00", "PST"), "2025-04-30T19:00:00-04:00/2025-04-30T20:00:00-04:00",
+     "Apr 30, 7:00 PM – 8:00 PM EDT"),
+    ("no zone stated",
+     raw("2025-04-30T10:00", "2025-04-30T10:30"), "2025-04-30T10:00:00-04:00/2025-04-30T10:30:00-04:00",
+     "Apr 30, 10:00 AM – 10:30 AM EDT"),
+]
+
+
+def check():
+    failures = 0
+    events = [{"event": description, "time": when} for description, when, *_ in CASES]
+    for (description, _, iso, display, urgency), event in zip(CASES, normalize_email_events(events, USER_TIMEZONE, NOW)):
+        got = (event["time"]["iso"], event["time"]["display"], event["urgency"])
+        ok = got == (iso, display, urgency)
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {description}: {got}" + ("" if ok else f" expected {(iso, display, urgency)}"))
+
+    events = [{"title": description, "time": when} for description, when, *_ in FREE_TEXT_CASES]
+    for (description, _, iso, display), event in zip(FREE_TEXT_CASES,
+                                                     normalize_free_text_events(events, USER_TIMEZONE, NOW)):
+        got = (event["time"]["iso"], event["time"]["display"])
+        ok = got == (iso, display)
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} free text, {description}: {got}" + ("" if ok else f" expected {(iso, display)}"))
+    return failures
+
+
+def benchmark(n):
+    events = [{"event": description, "time": when} for description, when, *_ in CASES] * (n // len(CASES) + 1)
+    events = events[:n]
+    start = time.perf_counter()
+    normalize_email_events(events, USER_TIMEZONE, NOW)
+    elapsed = time.perf_counter() - start
+    print(f"normalized {n} events in {elapsed * 1000:.1f} ms ({elapsed / n * 1e6:.1f} µs/event)")
 
-async def ask_gpt(prompt):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {OPENAI_API_KEY}"
-    }
-    
-    payload = {
-        "model": "gpt-3.5-turbo",  # or "gpt-4" if you have access
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7
-    }
-    
-    try:
-        response = requests.post(OPENAI_API_URL, headers=headers, data=json.dumps(payload))
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.RequestException as e:
-        print(f"Error making API request: {e}")
-        return None
-
-async def test_timezone_conversion():
-    # Fake blocks (chunk examples)
-    emails = [
-        """Subject: Meeting with team
-        From: John Doe <john@example.com>
-        Snippet: Let's meet on April 30, 2025 at 3 PM EST.""",
-
-        """Subject: Office Hours Reminder
-        From: Professor Smith <smith@university.edu>
-        Snippet: Reminder: Office hours are on May 2, 2025, at 1 PM PST.""",
-
-        """Subject: Project Presentation
-        From: Manager <manager@company.com>
-        Snippet: Your project presentation is scheduled for May 5, 2025, 10 AM.""",  # No timezone mentioned
-
-        """Subject: Club Meeting
-        From: Student Club <club@school.edu>
-        Snippet: Meeting on May 7, 2025, at 5:30 PM GMT."""
-    ]
-
-    # Assume user timezone
-    user_timezone = "America/New_York"
-
-    for idx, email_chunk in enumerate(emails):
-        prompt = _build_prompt(email_chunk, user_timezone)
-        events = await ask_gpt(prompt)
-        print(f"\n--- Chunk {idx+1} ---")
-        print(events)
 
 if __name__ == "__main__":
-    asyncio.run(test_timezone_conversion())
\ No newline at end of file
+    failed = check()
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
+    sys.exit(1 if failed else 0)
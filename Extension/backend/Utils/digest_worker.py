@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime
+
+from DAL.async_dal import digest_timezones_async, precompute_digests_async
+from Utils import job_worker
+from Utils.time_normalizer import user_zone
+
+logger = logging.getLogger(__name__)
+
+
+# Local time ("HH:MM") at which each timezone's digests are re-rendered; unset turns the sweep off
+DIGEST_PRECOMPUTE_AT = os.getenv("DIGEST_PRECOMPUTE_AT", "")
+# Days from today the sweep re-renders
+DIGEST_PRECOMPUTE_DAYS = int(os.getenv("DIGEST_PRECOMPUTE_DAYS", "7"))
+DIGEST_SWEEP_POLL = float(os.getenv("DIGEST_SWEEP_POLL", "60"))
+
+_task: asyncio.Task | None = None
+# Local date each timezone was last swept on
+_swept: dict[str, date] = {}
+
+
+async def start_sweeper():
+    """Start the precompute sweep if DIGEST_PRECOMPUTE_AT is set.
+
+    Runs only in the job runner process, so one process sweeps. Called from the app's startup hook.
+    """
+    global _task
+    if not DIGEST_PRECOMPUTE_AT or not job_worker.JOB_RUNNER:
+        return
+    at = datetime.strptime(DIGEST_PRECOMPUTE_AT, "%H:%M").time()
+    _task = asyncio.create_task(_sweep(at))
+
+
+async def stop_sweeper():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+async def sweep_due(at, now=None):
+    """Sweep every timezone whose local time has passed `at` today and that wasn't swept yet today."""
+    for user_timezone in await digest_timezones_async():
+        local = (now or datetime.now().astimezone()).astimezone(user_zone(user_timezone))
+        if local.time() < at or _swept.get(user_timezone) == local.date():
+            continue
+        changed = await precompute_digests_async(user_timezone, DIGEST_PRECOMPUTE_DAYS)
+        _swept[user_timezone] = local.date()
+        logger.info("Precomputed digests", extra={"user_timezone": user_timezone, "changed": changed})
+
+
+async def _sweep(at):
+    while True:
+        try:
+            await sweep_due(at)
+        except Exception:
+            logger.exception("Digest sweep failed")
+        await asyncio.sleep(DIGEST_SWEEP_POLL)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+
+from DAL.async_dal import (
+    complete_job_chunk_async, fail_job_async, get_job_async, get_job_chunk_async, get_job_payload_async,
+    pending_chunks_async, plan_job_async, unfinished_jobs_async,
+)
+from DAL.gmail_dal import build_email_blocks, chunk_threads, pack_blocks
+from DAL.jobs_dal import FINISHED_STATUSES, JOB_QUEUED
+from Utils.openai_utils import ENDPOINT_BACKENDS, extract_events, extraction_budget
+from Utils.time_normalizer import normalize_email_events
+
+logger = logging.getLogger(__name__)
+
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Chunks of one job in flight at once; the LLM dispatcher still applies its global limits
+JOB_CHUNK_CONCURRENCY = int(os.getenv("JOB_CHUNK_CONCURRENCY", "4"))
+# Only one process runs jobs; serve.py turns this off in all but its first worker
+JOB_RUNNER = os.getenv("JOB_RUNNER", "1") == "1"
+# How often the runner looks for jobs submitted to other processes, and streams
+# look for progress made by the runner when it is another process
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+# Jobs waiting in or taken from _queue and not finished yet
+_known: set[str] = set()
+# One event per job with someone waiting on it; set (and replaced) when the job makes progress
+_progress: dict[str, asyncio.Event] = {}
+
+
+def progress_event(job_id: str) -> asyncio.Event:
+    """Event set the next time `job_id` records a chunk. Take it before reading the job's state."""
+    return _progress.setdefault(job_id, asyncio.Event())
+
+
+def _notify(job_id: str):
+    event = _progress.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+
+async def start_workers():
+    """Start the worker pool, which also picks up jobs a previous run didn't finish.
+
+    Called from the app's startup hook; does nothing in a process that isn't the job runner.
+    """
+    global _queue, _workers
+    if not JOB_RUNNER:
+        return
+    _queue = asyncio.Queue()
+    _workers = [asyncio.create_task(_worker()) for _ in range(JOB_WORKERS)]
+    _workers.append(asyncio.create_task(_poll_jobs()))
+
+
+async def stop_workers():
+    """Cancel the workers; their unfinished chunks stay pending and are resumed on the next start."""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _known.clear()
+
+
+def enqueue(job_id: str):
+    """Queue a stored job here if this process is the runner; otherwise the runner's poll finds it."""
+    if _queue is not None and job_id not in _known:
+        _known.add(job_id)
+        _queue.put_nowait(job_id)
+
+
+async def _poll_jobs():
+    while True:
+        for job_id in await unfinished_jobs_async():
+            enqueue(job_id)
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            logger.exception("Job failed", extra={"job_id": job_id})
+            await fail_job_async(job_id, str(e))
+        finally:
+            _known.discard(job_id)
+            _notify(job_id)
+            _queue.task_done()
+
+
+async def _plan(job):
+    """Build, filter and pack a queued job's emails into stored chunks."""
+    loop = asyncio.get_running_loop()
+    emails = await get_job_payload_async(job["id"])
+    blocks, block_stats = await loop.run_in_executor(
+        None, lambda: build_email_blocks(emails, job["user_email"]))
+    overhead, budget = extraction_budget(job["extraction_mode"] == "structured", ENDPOINT_BACKENDS["jobs"])
+    packed = await loop.run_in_executor(None, lambda: pack_blocks(blocks, max_tokens=budget))
+
+    emails_by_thread = {}
+    for email in emails:
+        emails_by_thread.setdefault(email.get("gmailThread", ""), []).append(email)
+    chunks = []
+    for pieces, tokens in packed:
+        threads = chunk_threads("\n\n".join(pieces))
+        chunks.append((pieces, [email for thread in threads for email in emails_by_thread.get(thread, [])],
+                       tokens + overhead))
+    await plan_job_async(job["id"], chunks, block_stats)
+    logger.info("Planned job", extra={"job_id": job["id"], "chunks": len(chunks), "emails": len(emails)})
+
+
+async def run_job(job_id: str):
+    job = await get_job_async(job_id)
+    if job is None or job["status"] in FINISHED_STATUSES:
+        return
+    if job["status"] == JOB_QUEUED:
+        await _plan(job)
+
+    structured = job["extraction_mode"] == "structured"
+    limit = asyncio.Semaphore(JOB_CHUNK_CONCURRENCY)
+
+    async def run_chunk(idx):
+        async with limit:
+            # Load chunk text only when it's about to be sent, so a huge backfill isn't all in memory
+            blocks, prompt_tokens = await get_job_chunk_async(job_id, idx)
+            try:
+                events = await extract_events(blocks, job["user_email"], prompt_tokens, structured,
+                                              ENDPOINT_BACKENDS["jobs"])
+            except Exception as e:
+                logger.warning("Job chunk failed", extra={"job_id": job_id, "chunk": idx, "error": str(e)})
+                await complete_job_chunk_async(job_id, job["user_email"], idx, error=str(e))
+            else:
+                events = normalize_email_events(events, job["user_timezone"])
+                await complete_job_chunk_async(job_id, job["user_email"], idx, events)
+            _notify(job_id)
+
+    await asyncio.gather(*(run_chunk(idx) for idx in await pending_chunks_async(job_id)))
@@ -0,0 +1,89 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def ndjson_line(obj) -> bytes:
+    return dumps(obj) + b"\n"
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n,"
+
+
+class EventArrayParser:
+    """Pull complete objects out of a (possibly still growing) {"events": [...]} document.
+
+    feed() accepts text as it arrives and returns the objects whose closing
+    brace has been seen since the last call. A response cut off mid-object
+    (e.g. at max_tokens) still yields every event that was complete before
+    the cut.
+    """
+
+    def __init__(self, key="events"):
+        self.key = key
+        self.buffer = ""
+        self.pos = None
+        self.done = False
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        found = []
+        if self.pos is None:
+            start = self._array_start()
+            if start is None:
+                return found
+            self.pos = start
+        buffer = self.buffer
+        while not self.done:
+            i = self.pos
+            while i < len(buffer) and buffer[i] in _WHITESPACE:
+                i += 1
+            if i >= len(buffer):
+                break
+            if buffer[i] == "]":
+                self.done = True
+                break
+            try:
+                obj, end = _decoder.raw_decode(buffer, i)
+            except json.JSONDecodeError:
+                break  # incomplete element, wait for more text
+            found.append(obj)
+            self.pos = end
+        return found
+
+    def _array_start(self):
+        i = self.buffer.find(f'"{self.key}"')
+        while i != -1:
+            j = i + len(self.key) + 2
+            while j < len(self.buffer) and self.buffer[j] in " \t\r\n":
+                j += 1
+            if j < len(self.buffer) and self.buffer[j] == ":":
+                j += 1
+                while j < len(self.buffer) and self.buffer[j] in " \t\r\n":
+                    j += 1
+                if j < len(self.buffer) and self.buffer[j] == "[":
+                    return j + 1
+                if j >= len(self.buffer):
+                    return None
+            elif j >= len(self.buffer):
+                return None
+            i = self.buffer.find(f'"{self.key}"', i + 1)
+        return None
+
+
+def recover_events(text: str, key="events"):
+    """Best-effort parse of a possibly truncated response. Returns (events, array_closed)."""
+    parser = EventArrayParser(key)
+    events = [event for event in parser.feed(text) if isinstance(event, dict)]
+    return events, parser.done
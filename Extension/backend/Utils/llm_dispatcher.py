@@ -0,0 +1,211 @@
+import asyncio
+import os
+import random
+import time
+import weakref
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from Utils import metrics
+
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+PER_USER_CONCURRENCY = int(os.getenv("LLM_PER_USER_CONCURRENCY", "8"))
+REQUESTS_PER_MIN = float(os.getenv("LLM_REQUESTS_PER_MIN", "500"))
+TOKENS_PER_MIN = float(os.getenv("LLM_TOKENS_PER_MIN", "300000"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# Completion tokens reserved per request instead of its whole max_tokens;
+# settle() charges or refunds the difference once the real size is known
+COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "512"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Fraction of the provider's rate limits this process may use; serve.py splits them across its workers
+LIMIT_SHARE = 1.0
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to one minute's worth of burst."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        # A request larger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        async with self._lock:  # FIFO, so large requests aren't starved by small ones
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, amount: float):
+        """Take `amount` more (or give back a negative amount). Going below zero delays later acquires."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def reserve_tokens(prompt_tokens: int, max_tokens: int) -> int:
+    """Tokens to charge a request up front: its prompt and the likely, not the largest, completion."""
+    return prompt_tokens + min(max_tokens, COMPLETION_TOKENS_ESTIMATE)
+
+
+def _retry_after(resp: httpx.Response) -> float | None:
+    """Seconds the provider asked us to wait, from Retry-After or retry-after-ms."""
+    ms = resp.headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    value = resp.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+class LLMDispatcher:
+    """Shared gate in front of the chat endpoint.
+
+    Bounds concurrency globally and per user, paces requests to the provider's
+    requests/min and tokens/min limits, and retries 429/5xx/transport errors
+    with jittered exponential backoff that honors Retry-After. A 429 pauses
+    every caller, not just the one that hit it.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, per_user_concurrency=PER_USER_CONCURRENCY,
+                 requests_per_min=REQUESTS_PER_MIN, tokens_per_min=TOKENS_PER_MIN,
+                 max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self.per_user_concurrency = per_user_concurrency
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._users = weakref.WeakValueDictionary()
+        self._requests = TokenBucket(requests_per_min * LIMIT_SHARE)
+        self._tokens = TokenBucket(tokens_per_min * LIMIT_SHARE)
+        self._cooldown_until = 0.0
+
+        self.queued = 0
+        self.in_flight = 0
+        self.max_queued = 0
+        self._waits = deque(maxlen=1000)
+        self.counters = {"submitted": 0, "completed": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+    def _user_semaphore(self, user_email):
+        sem = self._users.get(user_email)
+        if sem is None:
+            sem = asyncio.Semaphore(self.per_user_concurrency)
+            self._users[user_email] = sem
+        return sem
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    async def _wait_cooldown(self):
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def submit(self, send, user_email=None, tokens=0) -> httpx.Response:
+        """Run `send()` (a coroutine factory returning an httpx.Response) under the limits.
+
+        `tokens` is the estimated prompt + completion size charged to the
+        tokens/min bucket (see reserve_tokens); the caller settles it once
+        the reply's real size is known. Returns the last response; the caller decides
+        whether a non-retryable status is an error, and closes it when it
+        was sent with stream=True.
+        """
+        self.counters["submitted"] += 1
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        queued_at = time.monotonic()
+        dequeued = False
+        try:
+            async with self._user_semaphore(user_email or ""), self._global:
+                await self._wait_cooldown()
+                await self._requests.acquire(1)
+                await self._tokens.acquire(tokens)
+                waited = time.monotonic() - queued_at
+                self._waits.append(waited)
+                metrics.STAGE_SECONDS.observe(waited, stage="llm.queue")
+                self.queued -= 1
+                dequeued = True
+                self.in_flight += 1
+                try:
+                    return await self._send_with_retries(send, tokens)
+                finally:
+                    self.in_flight -= 1
+        finally:
+            if not dequeued:
+                # Cancelled while still waiting for a slot
+                self.queued -= 1
+
+    async def _send_with_retries(self, send, tokens):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                resp = await send()
+            except httpx.TransportError:
+                if last_attempt:
+                    self.counters["failed"] += 1
+                    raise
+                self.counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if resp.status_code not in RETRYABLE_STATUS or last_attempt:
+                self.counters["completed" if resp.is_success else "failed"] += 1
+                return resp
+
+            self.counters["retries"] += 1
+            # Release the connection; a streamed body is never read otherwise
+            await resp.aclose()
+            delay = _retry_after(resp)
+            if delay is None:
+                delay = self._backoff(attempt)
+            else:
+                delay += random.uniform(0, BACKOFF_BASE)
+            if resp.status_code == 429:
+                self.counters["rate_limited"] += 1
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+            await asyncio.sleep(delay)
+            await self._wait_cooldown()
+            await self._requests.acquire(1)
+            await self._tokens.acquire(tokens)
+
+    def settle(self, reserved: int, used: int):
+        """Charge the tokens/min bucket a request's real size in place of what submit reserved."""
+        self._tokens.adjust(used - reserved)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        def pct(p):
+            return waits[min(len(waits) - 1, int(len(waits) * p))] if waits else 0.0
+        return {
+            **self.counters,
+            "queue_depth": self.queued,
+            "max_queue_depth": self.max_queued,
+            "in_flight": self.in_flight,
+            "wait_p50_s": pct(0.50),
+            "wait_p95_s": pct(0.95),
+            "wait_max_s": waits[-1] if waits else 0.0,
+        }
@@ -0,0 +1,190 @@
+"""Local-model chat completions on a pool of CPU worker processes.
+
+Each worker loads the model once, when it starts, and then answers
+completions until shutdown. The default runtime is gpt4all with a GGUF
+model from LOCAL_LLM_MODEL_PATH. Downloads are off unless
+LOCAL_LLM_ALLOW_DOWNLOAD=1. LOCAL_LLM_RUNTIME=module:factory swaps in
+another runtime. The factory is called as
+factory(model, model_path, threads, n_ctx) in each worker and returns an
+object with complete_batch(requests) -> [(content, finish_reason), ...].
+Tests.mock_llm_server:LocalRuntime is one.
+
+With LOCAL_LLM_BATCH above 1, requests that queue up while every worker is
+busy go to a worker together, up to that many at a time, for runtimes that
+decode a batch in one pass. Nothing waits for a batch to fill. gpt4all
+decodes one sequence at a time, and there a batch only holds back its
+first results until the last is done, so the default is 1. Its real
+batching is the structured extraction mode, which packs many emails into
+one prompt.
+
+Workers are started with "spawn": the server process has threads by the
+time the pool starts, and forking those is unsafe.
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Utils import metrics
+from Utils.log_utils import setup_logging
+
+logger = logging.getLogger(__name__)
+
+LOCAL_LLM_RUNTIME = os.getenv("LOCAL_LLM_RUNTIME", "gpt4all")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "Meta-Llama-3-8B-Instruct.Q4_0.gguf")
+LOCAL_LLM_MODEL_PATH = os.getenv("LOCAL_LLM_MODEL_PATH") or None
+LOCAL_LLM_ALLOW_DOWNLOAD = os.getenv("LOCAL_LLM_ALLOW_DOWNLOAD", "0") == "1"
+# Per serving process; under serve.py every worker has its own pool
+LOCAL_LLM_WORKERS = int(os.getenv("LOCAL_LLM_WORKERS", "1"))
+# CPU threads per model instance; by default the cores are split between the workers
+LOCAL_LLM_THREADS = int(os.getenv("LOCAL_LLM_THREADS", "0")) or max(1, (os.cpu_count() or 1) // LOCAL_LLM_WORKERS)
+LOCAL_LLM_CONTEXT = int(os.getenv("LOCAL_LLM_CONTEXT", "8192"))
+LOCAL_LLM_BATCH = int(os.getenv("LOCAL_LLM_BATCH", "1"))
+
+# The model of this worker process, loaded by _init_worker
+_runtime = None
+
+
+class GPT4AllRuntime:
+    def __init__(self, model, model_path, threads, n_ctx):
+        from gpt4all import GPT4All
+        self.n_ctx = n_ctx
+        self.model = GPT4All(model, model_path=model_path, allow_download=LOCAL_LLM_ALLOW_DOWNLOAD,
+                             n_threads=threads, n_ctx=n_ctx, device="cpu")
+
+    def complete_batch(self, requests):
+        return [self._complete(*request) for request in requests]
+
+    def _complete(self, system, prompt, max_tokens, temperature):
+        generated = 0
+
+        def on_token(token_id, text):
+            nonlocal generated
+            generated += 1
+            return True
+
+        # A fresh session per request, so nothing carries over between users
+        with self.model.chat_session(system_prompt=system):
+            content = self.model.generate(prompt, max_tokens=max_tokens, temp=temperature, callback=on_token)
+        return content, "length" if generated >= max_tokens else "stop"
+
+
+def _load_runtime(spec, model, model_path, threads, n_ctx):
+    if spec == "gpt4all":
+        return GPT4AllRuntime(model, model_path, threads, n_ctx)
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)(model, model_path, threads, n_ctx)
+
+
+def _init_worker(spec, model, model_path, threads, n_ctx):
+    global _runtime
+    # A spawned process starts without the server's log handlers
+    setup_logging()
+    started = time.perf_counter()
+    _runtime = _load_runtime(spec, model, model_path, threads, n_ctx)
+    logger.info("Loaded local model", extra={"model": model, "seconds": round(time.perf_counter() - started, 2)})
+
+
+def _ready():
+    return os.getpid()
+
+
+def _complete_batch(requests):
+    """Runs in a worker: one (content, finish_reason) or exception per (system, prompt, max_tokens, temperature)."""
+    try:
+        return _runtime.complete_batch(requests)
+    except Exception as e:
+        if len(requests) == 1:
+            return [e]
+    # One bad request shouldn't fail the others; run them one at a time
+    results = []
+    for request in requests:
+        try:
+            results.extend(_runtime.complete_batch([request]))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class LocalModelPool:
+    """Worker processes with a loaded model each, fed from one queue on the event loop."""
+
+    def __init__(self, workers=LOCAL_LLM_WORKERS, batch=LOCAL_LLM_BATCH, runtime=LOCAL_LLM_RUNTIME,
+                 model=LOCAL_LLM_MODEL, model_path=LOCAL_LLM_MODEL_PATH, threads=LOCAL_LLM_THREADS,
+                 n_ctx=LOCAL_LLM_CONTEXT):
+        self.workers = workers
+        self.batch = batch
+        self.model = model
+        self.n_ctx = n_ctx
+        self._args = (runtime, model, model_path, threads, n_ctx)
+        self._executor = None
+        self._queue = None
+        self._tasks = []
+        self.counters = {"submitted": 0, "batches": 0, "failed": 0}
+
+    async def start(self):
+        """Start the workers and wait until each has loaded the model, so no request pays for it."""
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=self._args)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        # Concurrent submissions make the executor start every worker
+        pids = await asyncio.gather(*(loop.run_in_executor(self._executor, _ready) for _ in range(self.workers)))
+        logger.info("Local model pool ready", extra={"workers": len(set(pids)), "model": self.model,
+                                                     "seconds": round(time.perf_counter() - started, 2)})
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._feed()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.get_running_loop().run_in_executor(None, lambda: executor.shutdown(cancel_futures=True))
+
+    async def complete(self, system, prompt, max_tokens, temperature) -> tuple[str, str]:
+        """(content, finish_reason) of one chat completion."""
+        if self._executor is None:
+            raise RuntimeError("The local model pool is not running")
+        future = asyncio.get_running_loop().create_future()
+        self.counters["submitted"] += 1
+        await self._queue.put(((system, prompt, max_tokens, temperature), future, time.perf_counter()))
+        return await future
+
+    async def _feed(self):
+        """One per worker: take what is queued (up to `batch`) and run it on a worker."""
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            while len(items) < self.batch and not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            items = [item for item in items if not item[1].cancelled()]
+            if not items:
+                continue
+            now = time.perf_counter()
+            for _, _, queued_at in items:
+                metrics.STAGE_SECONDS.observe(now - queued_at, stage="llm.local_queue")
+            self.counters["batches"] += 1
+            try:
+                results = await loop.run_in_executor(self._executor, _complete_batch, [item[0] for item in items])
+            except Exception as e:
+                # The pool itself broke (a worker died); fail this batch
+                results = [e] * len(items)
+            for (_, future, _), result in zip(items, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    self.counters["failed"] += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        return {**self.counters, "workers": self.workers, "queue_depth": self._queue.qsize() if self._queue else 0}
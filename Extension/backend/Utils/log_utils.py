@@ -0,0 +1,87 @@
+"""Buffered, structured logging for the backend.
+
+Handlers run on a listener thread behind a queue, so logging from a request
+handler or DAL thread costs an enqueue instead of a blocking write to
+stderr. Modules log through `logging.getLogger(__name__)` and pass fields
+as `extra={...}`. The fields are appended as key=value (LOG_FORMAT=text,
+the default) or written as one JSON object per line (LOG_FORMAT=json).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Libraries that log a line per HTTP request at INFO
+QUIET_LOGGERS = ("httpx", "httpcore", "hpack")
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: logging.handlers.QueueHandler | None = None
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s[%(process)d]: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+            **_fields(record),
+        }, default=str)
+
+
+def setup_logging():
+    """Route the root logger through a queue to a stderr handler on a listener thread.
+
+    Call it in each process that serves requests, after any fork: the
+    listener thread doesn't survive one. Calling it again is a no-op.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    log_queue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out what is still queued and stop the listener thread."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener = _queue_handler = None
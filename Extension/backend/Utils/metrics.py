@@ -0,0 +1,233 @@
+"""In-process metrics: counters, histograms and stage timers, rendered for /metrics.
+
+Everything is per process. Under serve.py every worker keeps its own
+numbers, like /stats, so scrape the workers separately or sum them. Updates
+take a lock because the DAL records them from its worker threads.
+"""
+import contextvars
+import math
+from bisect import bisect_left
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "scheduleai_"
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, math.inf)
+
+_lock = threading.Lock()
+_metrics = {}
+# Functions called at render time for values kept elsewhere (dispatcher, cache, DAL counters)
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = PREFIX + name, help, tuple(labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def lines(self):
+        with _lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_label_text(self.labels, key)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        self.name, self.help, self.labels = PREFIX + name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            state[bisect_left(self.buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def lines(self):
+        with _lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield (f"{self.name}_bucket{_label_text(self.labels + ('le',), key + (_number(bound),))} "
+                       f"{cumulative}")
+            yield f"{self.name}_sum{_label_text(self.labels, key)} {_number(state[-2])}"
+            yield f"{self.name}_count{_label_text(self.labels, key)} {state[-1]}"
+
+
+def _register(metric):
+    with _lock:
+        existing = _metrics.setdefault(metric.name, metric)
+    return existing
+
+
+def counter(name, help, labels=()) -> Counter:
+    return _register(Counter(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=SECONDS_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets))
+
+
+def register_collector(fn):
+    """Add `fn() -> [(name, kind, help, [(labels dict, value), ...]), ...]` to every render."""
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    out = []
+    for metric in list(_metrics.values()):
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.lines())
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            out.append(f"# HELP {PREFIX}{name} {help}")
+            out.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in samples:
+                out.append(f"{PREFIX}{name}{_label_text(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(out) + "\n"
+
+
+# -------------------- STAGES AND PER-REQUEST TOTALS --------------------
+
+STAGE_SECONDS = histogram("stage_seconds", "Time spent in each stage of request handling", ("stage",))
+LLM_TOKENS = counter("llm_tokens_total", "LLM tokens sent (prompt) and received (completion)", ("direction",))
+REQUEST_SECONDS = histogram("http_request_seconds", "Time from request start to the last byte of the response",
+                            ("route", "method", "status"))
+FIRST_BYTE_SECONDS = histogram("http_first_byte_seconds", "Time from request start to the first response body byte",
+                               ("route",))
+REQUEST_LLM_TOKENS = histogram("http_request_llm_tokens", "LLM tokens used by one request", ("route", "direction"),
+                               TOKEN_BUCKETS)
+
+
+def stage(name):
+    """Time a block (or, as a decorator, a function) into stage_seconds{stage=name}."""
+    return STAGE_SECONDS.time(stage=name)
+
+
+class RequestTotals:
+    __slots__ = ("route", "tokens_sent", "tokens_received")
+
+    def __init__(self, route):
+        self.route = route
+        self.tokens_sent = 0
+        self.tokens_received = 0
+
+
+# The totals of the request being handled; tasks it starts share them
+_current = contextvars.ContextVar("request_totals", default=None)
+
+
+def count_tokens(sent=0, received=0):
+    """Record LLM tokens, globally and against the current request if there is one."""
+    if sent:
+        LLM_TOKENS.inc(sent, direction="sent")
+    if received:
+        LLM_TOKENS.inc(received, direction="received")
+    totals = _current.get()
+    if totals is not None:
+        totals.tokens_sent += sent
+        totals.tokens_received += received
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency, time to first byte and LLM tokens per route.
+
+    Timing runs to the last body byte, so streamed NDJSON responses are
+    measured in full. Routes are labelled by their URL rule (/jobs/<job_id>)
+    to keep label values bounded. The optional hooks bracket every request:
+    `on_finish(on_start(), route, seconds)` (the slow-request profiler uses them).
+    """
+
+    def __init__(self, app, url_map, on_start=None, on_finish=None):
+        self.app = app
+        self.url_map = url_map
+        self.on_start = on_start
+        self.on_finish = on_finish
+
+    def _route(self, scope):
+        try:
+            rule, _ = self.url_map.bind("").match(scope["path"], method=scope["method"], return_rule=True)
+            return rule.rule
+        except Exception:
+            return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = self._route(scope)
+        totals = RequestTotals(route)
+        token = _current.set(totals)
+        start = time.perf_counter()
+        status = 500
+        first_byte = None
+        session = self.on_start() if self.on_start else None
+
+        async def send_wrapper(message):
+            nonlocal status, first_byte
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and first_byte is None and message.get("body"):
+                first_byte = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            REQUEST_SECONDS.observe(elapsed, route=route, method=scope["method"], status=status)
+            if first_byte is not None:
+                FIRST_BYTE_SECONDS.observe(first_byte, route=route)
+            if totals.tokens_sent or totals.tokens_received:
+                REQUEST_LLM_TOKENS.observe(totals.tokens_sent, route=route, direction="sent")
+                REQUEST_LLM_TOKENS.observe(totals.tokens_received, route=route, direction="received")
+            if self.on_finish:
+                self.on_finish(session, route, elapsed)
@@ -1,112 +1,561 @@
+import asyncio
 import json
 import httpx
+import logging
 import os
+import time
+from DAL.cache_dal import cache_key
+from DAL.async_dal import cache_get_async, cache_put_async
+from DAL.gmail_dal import MAX_REQUEST_TOKENS, prompt_overhead_tokens
+from Utils.llm_dispatcher import LLMDispatcher, reserve_tokens
+from Utils.local_llm import LOCAL_LLM_CONTEXT, LocalModelPool
+from Utils.single_flight import SingleFlight
+from Utils.json_utils import EventArrayParser, recover_events
+from Utils import metrics
+
+logger = logging.getLogger(__name__)
 
 api_key = os.getenv("OPENAI_API_KEY")
+# Any OpenAI-compatible server; Tests/mock_llm_server.py stands in for it in load tests
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+
+# Connection pool settings for the shared client
+HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+HTTP2_ENABLED = os.getenv("OPENAI_HTTP2", "1") == "1"
+
+_client: httpx.AsyncClient | None = None
+_dispatcher: LLMDispatcher | None = None
+_local_pool: LocalModelPool | None = None
+
+
+def _new_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        base_url=OPENAI_BASE_URL,
+        http2=HTTP2_ENABLED,
+        limits=limits,
+        timeout=HTTP_TIMEOUT,
+        headers={
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        },
+    )
+
+
+async def init_client():
+    """Open the process-wide client and dispatcher. Called from the app's startup hook.
+
+    The local model, when an endpoint uses it, is loaded by the warm-up (Utils/warm_up.py).
+    """
+    global _client, _dispatcher
+    if _client is None or _client.is_closed:
+        _client = _new_client()
+    # asyncio primitives bind to the running loop, so build the dispatcher here
+    _dispatcher = LLMDispatcher()
+
+
+async def close_client():
+    """Close the process-wide client. Called from the app's shutdown hook."""
+    global _client, _dispatcher, _local_pool
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _dispatcher = None
+    if _local_pool is not None:
+        pool, _local_pool = _local_pool, None
+        await pool.close()
+
+
+def get_client() -> httpx.AsyncClient:
+    """Return the shared client, creating it lazily outside the app (scripts, tests)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _new_client()
+    return _client
+
 
-def _build_prompt(chunk:str, user_timezone: str)->str:
-    example_event = {
+def get_dispatcher() -> LLMDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = LLMDispatcher()
+    return _dispatcher
+
+
+_local_pool_lock = asyncio.Lock()
+
+
+async def get_local_pool() -> LocalModelPool:
+    """Return the local model pool, starting it (and loading the model) on first use."""
+    global _local_pool
+    async with _local_pool_lock:
+        if _local_pool is None:
+            pool = LocalModelPool()
+            await pool.start()
+            _local_pool = pool
+    return _local_pool
+
+
+def local_pool_stats() -> dict | None:
+    return _local_pool.stats() if _local_pool is not None else None
+
+
+def _estimate_tokens(payload: dict) -> int:
+    """Rough prompt size (~4 chars/token) when the caller has no tiktoken count."""
+    return sum(len(message.get("content", "")) for message in payload.get("messages", [])) // 4
+
+
+_EXAMPLE_EVENT = {
     "event": "CS Department Info Session",
     "raw_subject": "[Reminder] CS Dept Fall info session today!",
-    "time": {
-        "iso": "2025-04-10T16:30/2025-04-10T17:30",
-        "display": "April 10, 4:30 PM – 5:30 PM"
-    },
+    "time": {"start": "2025-04-10T16:30", "end": "2025-04-10T17:30", "zone": "", "recurrence": ""},
     "context": "Fall course planning event in Sci 204",
     "sender": "Chris Murphy",
-    "urgency": "high",
     "gmailThread": "17a4c5f0b1c…"
 }
-    example_block = json.dumps({"events": [example_event]}, indent=2)
-    return f"""
-Extract only scheduling-related information that a college student might reasonably want to add to their calendar.
+
+# Everything that doesn't vary per chunk lives in the system message. It is built
+# once at import and never changes byte-for-byte, so the provider's prompt cache
+# can reuse it across chunks, requests and users. Times are copied as written;
+# Utils/time_normalizer.py converts them and derives display and urgency.
+GMAIL_SYSTEM_PROMPT = f"""You are a precise assistant that extracts scheduling-related information from emails. \
+Focus on real events, meetings, deadlines, workshops, and reminders a college student might reasonably want on their calendar. \
+Ignore promotions, ads, news articles, and anything unrelated to scheduling. Be strict. Output clean, deduplicated, readable data.
+
+The user message gives the emails to analyze. Each email starts with a gmailThread line.
 
 Format each event as a JSON object with exactly these fields:
 - event: A short, cleaned title for the event (something nice to display to the user)
-- raw_subject: The original subject line from the message (to use it for identifying duplicates later)
-- time: ▸iso: A **single ISO-8601 string** (converted to {user_timezone}) that the UI can pass straight to Google Calendar  
-          • If you know both start and end →  `"YYYY-MM-DDTHH:MM/YYYY-MM-DDTHH:MM"`  
-          • If you know only the start → `"YYYY-MM-DDTHH:MM"`  
-          • If only a day is clear → `"YYYY-MM-DD"`  
-          • Otherwise output `"Not specified"`
-        ▸display: The time converted to {user_timezone} in whatever is easiest for a person to read (e.g.,"Every Tuesday, 1–2 PM", "April 10, 4:30 PM EST"). If iso is "Not specified", set display to "Not specified" as well.
+- raw_subject: The original subject line of the email (used to identify duplicates later)
+- time: The time exactly as the email states it. Do not convert it to any other timezone.
+  - start: "YYYY-MM-DDTHH:MM" when the day and time are known, "YYYY-MM-DD" for only a day, "HH:MM" for only a time of day, otherwise ""
+  - end: The end in the same form, or "" if not stated
+  - zone: The timezone the email states (e.g. "PST", "GMT+2", "Europe/London"), or "" if none
+  - recurrence: How it repeats, if it does (e.g. "Every Tuesday"), otherwise ""
 - context: Brief description or purpose of the event
 - sender: Who sent or organized it
-- urgency: "high", "medium", or "low" (based on time sensitivity and proximity)
-- gmailThread: The thread ID of the email this event came from.
-
-TIME ZONE RULES:
-• If a time zone (e.g., EST, PST, GMT) is mentioned in the text, respect it and convert the time from that timezone to {user_timezone}.
-• If no time zone is mentioned, assume the user's time zone is {user_timezone}
-• The ISO string should be the offsetted time(ie converted to the {user_timezone}) (e.g., -05:00 for EST)
-• The display time should also be the converted time and it should be in the {user_timezone}. Also add the usertimezone at the end e.g EST
-
-FIELD RULES 
-•urgency  
-    -high : starts in ≤48h or hard deadline in ≤48h  
-    -medium : within 7 days  
-    -low : later than 7 days or date unclear  
-• gmailMsgId / gmailThread - take from `data-legacy-message-id` and `data-legacy-thread-id`
-
-Do not explain anything. Do not include markdown. Only output pure JSON.
-
-Output ONLY a valid JSON object like this:
-{example_block}
-
-Text to analyze:
-{chunk}
-"""
-
-async def _ask_openai_gmail(prompt:str,)->list[dict]:
-    """Call the OpenAI chat endpoint and return the `events` list (can be empty)."""
-    async with httpx.AsyncClient(timeout=120) as client:
-        headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                }
-
-        payload = {
-            "model": "gpt-4o",
-            "response_format": { "type": "json_object" },
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a precise assistant that extracts scheduling-related information "
-                        "from user-provided website text. Your output MUST be a valid JSON object only. "
-                        "Focus on real events, meetings, deadlines, workshops, and reminders. "
-                        "Ignore promotions, ads, news articles, and anything unrelated to scheduling. "
-                        "Be strict. Output clean, deduplicated, readable data."
-                    )
+- gmailThread: The gmailThread of the email the event came from
+
+Do not explain anything. Do not include markdown. Output ONLY a valid JSON object like this:
+{json.dumps({"events": [_EXAMPLE_EVENT]}, ensure_ascii=False, separators=(",", ":"))}"""
+
+
+def _build_prompt(chunk:str)->str:
+    """Per-chunk user message; the instructions are in GMAIL_SYSTEM_PROMPT.
+
+    Nothing user-specific goes in, so users in different timezones share cache entries.
+    """
+    return f"Text to analyze:\n{chunk}"
+
+# -------------------- BACKENDS --------------------
+
+# Default backend, and per-endpoint overrides: LLM_BACKEND_PARSE, LLM_BACKEND_FREE_TEXT, LLM_BACKEND_JOBS
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+ENDPOINT_BACKENDS = {endpoint: os.getenv(f"LLM_BACKEND_{endpoint.upper()}", LLM_BACKEND)
+                     for endpoint in ("parse", "free_text", "jobs")}
+
+
+async def _post_openai(payload: dict, user_email: str | None, prompt_tokens: int) -> tuple[str, str]:
+    """POST to the hosted chat endpoint through the shared dispatcher.
+
+    The dispatcher charges the prompt plus an estimated completion against
+    the tokens/min budget, settled to the reported usage once the reply is in.
+    """
+    reserved = reserve_tokens(prompt_tokens, payload.get("max_tokens", 0))
+    with metrics.stage("llm.request"):
+        resp = await get_dispatcher().submit(
+            lambda: get_client().post("/chat/completions", json=payload),
+            user_email=user_email,
+            tokens=reserved,
+        )
+    if resp.is_error:
+        get_dispatcher().settle(reserved, prompt_tokens)
+    resp.raise_for_status()
+    body = resp.json()
+    choice = body["choices"][0]
+    content = choice["message"].get("content") or ""
+    _count_usage(body.get("usage"), prompt_tokens, content, reserved)
+    return content, choice.get("finish_reason", "stop")
+
+
+async def _post_local(payload: dict, user_email: str | None, prompt_tokens: int) -> tuple[str, str]:
+    """Run the chat request on the local model pool.
+
+    Local runtimes can't enforce response_format, so the format goes into
+    the system prompt, and max_tokens is cut to what fits the model's context.
+    """
+    pool = await get_local_pool()
+    system = "\n\n".join(m["content"] for m in payload["messages"] if m["role"] == "system")
+    prompt = "\n\n".join(m["content"] for m in payload["messages"] if m["role"] != "system")
+    response_format = payload.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        system += ("\n\nReply with one JSON object matching this schema and nothing else:\n"
+                   + json.dumps(response_format["json_schema"]["schema"]))
+    elif response_format.get("type") == "json_object":
+        system += "\n\nReply with one JSON object and nothing else."
+    max_tokens = max(256, min(payload.get("max_tokens", 4096), pool.n_ctx - prompt_tokens))
+    with metrics.stage("llm.local"):
+        content, finish_reason = await pool.complete(system, prompt, max_tokens, payload.get("temperature", 0.1))
+    _count_usage(None, prompt_tokens, content)
+    return content, finish_reason
+
+
+# name -> async fn(payload, user_email, prompt_tokens) -> (content, finish_reason)
+BACKENDS = {"openai": _post_openai, "local": _post_local}
+# Backends that can stream events as they are generated (see _stream_openai_gmail)
+STREAMING_BACKENDS = {"openai"}
+
+
+def _cache_payload(payload: dict, backend: str) -> dict:
+    """What the cache key is computed from; other backends get their own entries for the same prompt."""
+    return payload if backend == "openai" else {**payload, "backend": backend}
+
+
+# Identical requests already in flight are joined instead of sent again
+SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") == "1"
+_flights = SingleFlight()
+
+
+def single_flight_stats() -> dict:
+    return _flights.stats()
+
+
+async def _post_chat(payload: dict, user_email: str | None = None, prompt_tokens: int | None = None,
+                     backend: str = "openai") -> tuple[str, str]:
+    """Send a chat request to `backend`. Returns (content, finish_reason).
+
+    Concurrent identical requests share one upstream call, charged to the
+    first caller's user; each caller dedups the events for its own user after.
+    """
+    if prompt_tokens is None:
+        prompt_tokens = _estimate_tokens(payload)
+    if not SINGLE_FLIGHT:
+        return await BACKENDS[backend](payload, user_email, prompt_tokens)
+    return await _flights.call(cache_key(_cache_payload(payload, backend)),
+                               lambda: BACKENDS[backend](payload, user_email, prompt_tokens), kind="chat")
+
+
+def _count_usage(usage: dict | None, prompt_tokens: int, content: str, reserved: int | None = None):
+    """Record the tokens of one completion, estimating whatever the provider didn't report.
+
+    With `reserved`, what the dispatcher charged for it up front, the
+    tokens/min budget is settled to the real size.
+    """
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens", prompt_tokens)
+    completion_tokens = usage.get("completion_tokens", len(content) // 4)
+    metrics.count_tokens(prompt_tokens, completion_tokens)
+    if reserved is not None:
+        get_dispatcher().settle(reserved, prompt_tokens + completion_tokens)
+
+async def _chat_completion(payload: dict, user_email: str | None = None, prompt_tokens: int | None = None,
+                           backend: str = "openai") -> dict:
+    """Send a chat request and return the parsed JSON content, served from the cache when possible."""
+    key = cache_key(_cache_payload(payload, backend))
+    cached = await cache_get_async(key)
+    if cached is not None:
+        return json.loads(cached)
+
+    raw, _ = await _post_chat(payload, user_email, prompt_tokens, backend)
+    cleaned_content = raw.replace('```json', '').replace('```', '').strip()
+    result = json.loads(cleaned_content)
+    # Only cache responses that parsed, so a malformed reply is retried next time
+    await cache_put_async(key, cleaned_content)
+    return result
+
+def _gmail_payload(prompt: str) -> dict:
+    return {
+        "model": "gpt-4o",
+        "response_format": { "type": "json_object" },
+        "messages": [
+            {
+                "role": "system",
+                "content": GMAIL_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "temperature": 0.1,
+        "max_tokens": 4096,
+    }
+
+async def _ask_openai_gmail(prompt:str, user_email: str | None = None, prompt_tokens: int | None = None,
+                            backend: str = "openai")->list[dict]:
+    """Call the chat backend and return the `events` list (can be empty)."""
+    return (await _chat_completion(_gmail_payload(prompt), user_email, prompt_tokens, backend)).get("events", [])
+
+
+# -------------------- STREAMING MODE --------------------
+
+STREAM_EVENTS = os.getenv("GMAIL_STREAM_EVENTS", "1") == "1"
+
+
+async def _iter_sse_content(resp: httpx.Response):
+    """Yield the content deltas of a chat completion SSE stream."""
+    async for line in resp.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            break
+        choices = json.loads(data).get("choices") or []
+        if choices:
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+
+async def _stream_openai_gmail(prompt: str, user_email: str | None = None, prompt_tokens: int | None = None,
+                               backend: str = "openai"):
+    """Like _ask_openai_gmail, but yields each event as soon as its JSON object closes.
+
+    Shares cache entries with the non-streaming call. A stream that breaks off
+    raises after yielding the events that were already complete. Backends
+    that can't stream yield the events once the whole reply is in.
+    """
+    if backend not in STREAMING_BACKENDS:
+        for event in await _ask_openai_gmail(prompt, user_email, prompt_tokens, backend):
+            yield event
+        return
+    payload = _gmail_payload(prompt)
+    key = cache_key(payload)
+    cached = await cache_get_async(key)
+    if cached is not None:
+        for event in json.loads(cached).get("events", []):
+            yield event
+        return
+    if not SINGLE_FLIGHT:
+        async for event in _stream_events(payload, key, user_email, prompt_tokens):
+            yield event
+        return
+    # Its own key space: a stream's flight yields events, a chat flight returns the reply
+    async for event in _flights.stream("stream:" + key, lambda: _stream_events(payload, key, user_email, prompt_tokens)):
+        yield event
+
+
+async def _stream_events(payload: dict, key: str, user_email: str | None, prompt_tokens: int | None):
+    """Send the request with stream=True and yield events as they close; caches the whole reply at the end."""
+    if prompt_tokens is None:
+        prompt_tokens = _estimate_tokens(payload)
+    client = get_client()
+    request = client.build_request("POST", "/chat/completions", json={**payload, "stream": True})
+    started = time.perf_counter()
+    reserved = reserve_tokens(prompt_tokens, payload["max_tokens"])
+    resp = await get_dispatcher().submit(
+        lambda: client.send(request, stream=True),
+        user_email=user_email,
+        tokens=reserved,
+    )
+    parser = EventArrayParser()
+    parts = []
+    try:
+        if resp.is_error:
+            await resp.aread()
+            resp.raise_for_status()
+        if resp.headers.get("content-type", "").startswith("text/event-stream"):
+            async for delta in _iter_sse_content(resp):
+                if not parts:
+                    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm.first_token")
+                parts.append(delta)
+                for event in parser.feed(delta):
+                    if isinstance(event, dict):
+                        yield event
+        else:
+            # Server ignored stream=True and sent a plain completion
+            await resp.aread()
+            content = resp.json()["choices"][0]["message"].get("content") or ""
+            parts.append(content)
+            for event in parser.feed(content):
+                if isinstance(event, dict):
+                    yield event
+    finally:
+        await resp.aclose()
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm.request")
+        _count_usage(None, prompt_tokens, "".join(parts), reserved)
+
+    cleaned_content = "".join(parts).replace('```json', '').replace('```', '').strip()
+    try:
+        json.loads(cleaned_content)
+    except json.JSONDecodeError:
+        if not parser.done:
+            raise ValueError("Extraction stream ended before the events array closed")
+        return
+    await cache_put_async(key, cleaned_content)
+
+
+
+
+# -------------------- STRUCTURED OUTPUT MODE --------------------
+
+EXTRACTION_MODE = os.getenv("GMAIL_EXTRACTION_MODE", "json")
+# Structured responses are validated per event, so chunks can be packed larger
+MAX_STRUCTURED_REQUEST_TOKENS = int(os.getenv("MAX_STRUCTURED_REQUEST_TOKENS", "12000"))
+# How many times a failing batch may be split in half before giving up on it
+MAX_SPLIT_DEPTH = 4
+
+_STRING = {"type": "string"}
+EVENTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "events": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source": {"type": "integer", "description": "Index [n] of the email the event came from"},
+                    "event": _STRING,
+                    "raw_subject": _STRING,
+                    "time": {
+                        "type": "object",
+                        "properties": {"start": _STRING, "end": _STRING, "zone": _STRING, "recurrence": _STRING},
+                        "required": ["start", "end", "zone", "recurrence"],
+                        "additionalProperties": False,
+                    },
+                    "context": _STRING,
+                    "sender": _STRING,
+                    "gmailThread": _STRING,
                 },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 4096,
-        }
-
-        resp = await client.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        resp.raise_for_status()
-        raw = resp.json()["choices"][0]["message"]["content"]
-        cleaned_content = raw.replace('```json', '').replace('```', '').strip()
-        return json.loads(cleaned_content).get("events", [])
-    
-
-
-
-async def _ask_openai(payload)->list[dict]:
-    """Call the OpenAI chat endpoint and return the `events` list (can be empty)."""
-    async with httpx.AsyncClient(timeout=120) as client:
-        headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                }
-
-        resp = await client.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        resp.raise_for_status()
-        raw = resp.json()["choices"][0]["message"]["content"]
-        cleaned_content = raw.replace('```json', '').replace('```', '').strip()
-        return json.loads(cleaned_content)
\ No newline at end of file
+                "required": ["source", "event", "raw_subject", "time", "context", "sender", "gmailThread"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["events"],
+    "additionalProperties": False,
+}
+
+GMAIL_STRUCTURED_SYSTEM_PROMPT = GMAIL_SYSTEM_PROMPT + """
+
+Each email is prefixed with its index in brackets, e.g. [3]. Set source to the index of the email each event came from."""
+
+
+def _build_structured_prompt(blocks: list[str]) -> str:
+    emails = "\n\n".join(f"[{i}]\n{block}" for i, block in enumerate(blocks))
+    return f"Emails to analyze:\n{emails}"
+
+
+def _structured_payload(blocks: list[str]) -> dict:
+    return {
+        "model": "gpt-4o",
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "scheduling_events", "strict": True, "schema": EVENTS_SCHEMA},
+        },
+        "messages": [
+            {"role": "system", "content": GMAIL_STRUCTURED_SYSTEM_PROMPT},
+            {"role": "user", "content": _build_structured_prompt(blocks)},
+        ],
+        "temperature": 0.1,
+        "max_tokens": 4096,
+    }
+
+
+def _tag_sources(events: list[dict], blocks: list[str]) -> list[dict]:
+    """Drop the source index, trusting it over the model's copy of gmailThread."""
+    tagged = []
+    for event in events:
+        source = event.pop("source", None)
+        if isinstance(source, int) and 0 <= source < len(blocks):
+            thread = blocks[source].split("\n", 1)[0].removeprefix("gmailThread: ")
+            if thread:
+                event["gmailThread"] = thread
+        tagged.append(event)
+    return tagged
+
+
+async def _ask_openai_gmail_structured(blocks: list[str], user_email: str | None = None,
+                                       prompt_tokens: int | None = None, backend: str = "openai",
+                                       _depth: int = 0) -> list[dict]:
+    """Extract events from a batch of email blocks with a strict JSON schema.
+
+    Each event carries the [n] index of its source email. A response cut off
+    at max_tokens keeps every event that was complete before the cut, and only
+    the emails from the last one seen onwards are re-sent. A malformed response
+    is split in half and each half retried, so one bad email doesn't cost the
+    whole batch.
+    """
+    if not blocks:
+        return []
+    payload = _structured_payload(blocks)
+    key = cache_key(_cache_payload(payload, backend))
+    cached = await cache_get_async(key)
+    if cached is not None:
+        return _tag_sources(json.loads(cached)["events"], blocks)
+
+    content, finish_reason = await _post_chat(payload, user_email, prompt_tokens if _depth == 0 else None, backend)
+    try:
+        events = json.loads(content)["events"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        events = None
+    if events is not None and finish_reason != "length":
+        await cache_put_async(key, content)
+        return _tag_sources(events, blocks)
+
+    recovered, _ = recover_events(content)
+    recovered = [event for event in recovered if isinstance(event.get("source"), int)]
+    if finish_reason == "length" and recovered:
+        # The last source seen may have been cut mid-way; re-send it and everything after
+        resume = max(event["source"] for event in recovered)
+        if resume > 0:
+            rest = await _ask_openai_gmail_structured(blocks[resume:], user_email, None, backend, _depth)
+            kept = [event for event in recovered if event["source"] < resume]
+            return _tag_sources(kept, blocks) + rest
+
+    if len(blocks) == 1 or _depth >= MAX_SPLIT_DEPTH:
+        if recovered:
+            return _tag_sources(recovered, blocks)
+        raise ValueError(f"Unparseable extraction response for {len(blocks)} email(s)")
+
+    logger.warning("Retrying a batch as two halves", extra={"emails": len(blocks), "finish_reason": finish_reason})
+    mid = len(blocks) // 2
+    halves = await asyncio.gather(
+        _ask_openai_gmail_structured(blocks[:mid], user_email, None, backend, _depth + 1),
+        _ask_openai_gmail_structured(blocks[mid:], user_email, None, backend, _depth + 1),
+        return_exceptions=True,
+    )
+    errors = [half for half in halves if isinstance(half, BaseException)]
+    if len(errors) == len(halves):
+        raise errors[0]
+    for error in errors:
+        logger.warning("Dropped part of a batch after retries", extra={"error": str(error)})
+    return [event for half in halves if not isinstance(half, BaseException) for event in half]
+
+
+def extraction_budget(structured: bool = False, backend: str = "openai") -> tuple[int, int]:
+    """(prompt overhead, tokens left for email text) of one extraction request.
+
+    A local model's context holds the reply too, so its prompts get at most half of it.
+    """
+    if structured:
+        overhead = prompt_overhead_tokens(GMAIL_STRUCTURED_SYSTEM_PROMPT, _build_structured_prompt([]))
+        limit = MAX_STRUCTURED_REQUEST_TOKENS
+    else:
+        overhead = prompt_overhead_tokens(GMAIL_SYSTEM_PROMPT, _build_prompt(""))
+        limit = MAX_REQUEST_TOKENS
+    if backend == "local":
+        limit = min(limit, LOCAL_LLM_CONTEXT // 2)
+    return overhead, limit - overhead
+
+
+async def extract_events(blocks: list[str], user_email: str | None = None, prompt_tokens: int | None = None,
+                         structured: bool = False, backend: str = "openai") -> list[dict]:
+    """Run one packed chunk of email blocks through the chosen extraction mode and backend.
+
+    Events come back with raw times; see Utils/time_normalizer.py.
+    """
+    if structured:
+        return await _ask_openai_gmail_structured(blocks, user_email, prompt_tokens, backend)
+    return await _ask_openai_gmail(_build_prompt("\n\n".join(blocks)), user_email, prompt_tokens, backend)
+
+
+async def _ask_openai(payload, user_email: str | None = None, backend: str = "openai")->list[dict]:
+    """Call the chat backend and return the parsed JSON reply."""
+    return await _chat_completion(payload, user_email, backend=backend)
\ No newline at end of file
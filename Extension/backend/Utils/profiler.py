@@ -0,0 +1,127 @@
+"""Opt-in sampling profiler that keeps stacks only for slow requests.
+
+Set PROFILE_SLOW_MS to a threshold in milliseconds to turn it on. While any
+request is in flight, a background thread samples every thread's stack
+each PROFILE_INTERVAL_MS. A request that takes longer than the threshold
+gets the samples taken during its lifetime written to PROFILE_DIR. The
+files use the folded format ("frame;frame;frame count"), which
+flamegraph.pl, speedscope and inferno read directly.
+
+The sampler sees threads, not asyncio tasks. Concurrent requests share the
+event loop thread, so a slow request's profile also holds what the others
+were doing meanwhile. Threads parked on a queue or lock are left out. The
+event loop sitting in select() is kept, because that is time spent waiting
+on the network (usually the LLM).
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Keep the newest files only, so a burst of slow requests can't fill the disk
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+# Top frames of threads blocked waiting for work (executor pools, the log listener)
+_IDLE_FILES = ("threading.py", "queue.py", "thread.py", "handlers.py")
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._sessions: set[int] = set()
+        self._samples: dict[int, Counter] = {}
+        self._thread = None
+        self._ids = 0
+
+    def start(self) -> int:
+        with self._lock:
+            self._ids += 1
+            session = self._ids
+            self._sessions.add(session)
+            self._samples[session] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session) -> Counter:
+        with self._lock:
+            self._sessions.discard(session)
+            return self._samples.pop(session, Counter())
+
+    def _stacks(self):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        main = threading.main_thread().ident
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            if ident != main and os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            yield ";".join(reversed(stack))
+
+    def _run(self):
+        while True:
+            stacks = list(self._stacks())
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                for session in self._sessions:
+                    self._samples[session].update(stacks)
+            time.sleep(self.interval)
+
+
+_sampler = _Sampler(PROFILE_INTERVAL_MS / 1000)
+
+
+def enabled() -> bool:
+    return PROFILE_SLOW_MS > 0
+
+
+def start():
+    """Begin collecting for one request; returns a session for finish(), or None when profiling is off."""
+    return _sampler.start() if enabled() else None
+
+
+def finish(session, route, seconds):
+    """End a request's session and write its stacks if it was slow. Returns the file written, if any."""
+    if session is None:
+        return None
+    samples = _sampler.stop(session)
+    if seconds * 1000 < PROFILE_SLOW_MS or not samples:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{session}-{slug}-"
+                                     f"{seconds * 1000:.0f}ms.folded")
+    with open(path, "w") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in samples.most_common())
+    _prune()
+    return path
+
+
+def _prune():
+    files = sorted((os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".folded")),
+                   key=os.path.getmtime)
+    for path in files[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,119 @@
+"""Coalesce identical concurrent calls into one.
+
+The extension often sends the same /parse or /parse_free_text body several
+times in a row (DOM mutations, re-renders). Keyed on the request's cache
+key, the first caller starts the work and later callers with the same key
+wait for it instead of starting their own LLM call. Once the work is
+finished, the key is free again; by then the response cache answers.
+
+The work runs in its own task, so a caller that goes away (a closed
+connection) doesn't cancel it for the others. It is cancelled only when
+no caller is left. Results are shared, so call() should return immutable
+values (strings, tuples), and stream() readers get their own copy of each
+item.
+"""
+import asyncio
+import copy
+
+from Utils import metrics
+
+COALESCED = metrics.counter("llm_coalesced_total", "LLM calls that joined an identical one already in flight",
+                            ("kind",))
+
+
+class _Flight:
+    __slots__ = ("task", "readers", "items", "done", "error", "changed")
+
+    def __init__(self):
+        self.task = None
+        self.readers = 0
+        self.items = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+        self.counters = {"started": 0, "coalesced": 0}
+
+    def _join(self, key, kind):
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        self.counters["coalesced"] += 1
+        COALESCED.inc(kind=kind)
+        flight.readers += 1
+        return flight
+
+    def _start(self, key, work):
+        flight = _Flight()
+        flight.readers = 1
+        self._flights[key] = flight
+        self.counters["started"] += 1
+        flight.task = asyncio.create_task(work(flight))
+        flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        return flight
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _leave(self, key, flight):
+        flight.readers -= 1
+        if flight.readers == 0 and not flight.task.done():
+            # Nobody is waiting any more; a later caller starts afresh
+            self._forget(key, flight)
+            flight.task.cancel()
+
+    async def call(self, key, fn, kind="call"):
+        """Return `await fn()`, sharing one run between concurrent callers with the same key."""
+        flight = self._join(key, kind)
+        if flight is None:
+            async def work(_):
+                return await fn()
+            flight = self._start(key, work)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    async def stream(self, key, gen_fn, kind="stream"):
+        """Yield the items of `gen_fn()`, replaying them to callers that join late."""
+        flight = self._join(key, kind)
+        if flight is None:
+            flight = self._start(key, lambda flight: self._produce(flight, gen_fn))
+        try:
+            seen = 0
+            while True:
+                changed = flight.changed
+                while seen < len(flight.items):
+                    yield copy.deepcopy(flight.items[seen])
+                    seen += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            self._leave(key, flight)
+
+    @staticmethod
+    async def _produce(flight, gen_fn):
+        def notify():
+            flight.changed.set()
+            flight.changed = asyncio.Event()
+
+        try:
+            async for item in gen_fn():
+                flight.items.append(item)
+                notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            notify()
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self._flights)}
@@ -0,0 +1,301 @@
+"""Turn the raw times the LLM reads out of a message into the `time` and `urgency` the UI gets.
+
+The model only copies times as written: a local start/end wall time, the zone
+the text states (if any) and a recurrence phrase. Everything else happens here,
+for a whole batch of events at once:
+
+- the stated zone ("PST", "GMT+2", "Europe/London") is resolved, defaulting
+  to the user's timezone, and the times are converted into the user's timezone
+- `iso` and `display` are rendered in the endpoint's format
+- /parse events get `urgency` from one `now` shared by the batch
+
+Anything that doesn't parse becomes "Not specified" instead of an unusable
+ISO string.
+"""
+import re
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from Utils import metrics
+
+NOT_SPECIFIED = "Not specified"
+DEFAULT_TIMEZONE = "America/New_York"
+
+# Abbreviations stand for the region's clock, so "3 PM EST" written in July is 3 PM New York time
+ZONE_ABBREVIATIONS = {
+    "ET": "America/New_York", "EST": "America/New_York", "EDT": "America/New_York",
+    "CT": "America/Chicago", "CST": "America/Chicago", "CDT": "America/Chicago",
+    "MT": "America/Denver", "MST": "America/Denver", "MDT": "America/Denver",
+    "PT": "America/Los_Angeles", "PST": "America/Los_Angeles", "PDT": "America/Los_Angeles",
+    "AKST": "America/Anchorage", "AKDT": "America/Anchorage",
+    "HST": "Pacific/Honolulu",
+    "UTC": "UTC", "GMT": "UTC", "Z": "UTC",
+    "BST": "Europe/London", "WET": "Europe/Lisbon", "WEST": "Europe/Lisbon",
+    "CET": "Europe/Paris", "CEST": "Europe/Paris", "EET": "Europe/Athens", "EEST": "Europe/Athens",
+    "IST": "Asia/Kolkata", "SGT": "Asia/Singapore", "HKT": "Asia/Hong_Kong",
+    "JST": "Asia/Tokyo", "KST": "Asia/Seoul",
+    "AEST": "Australia/Sydney", "AEDT": "Australia/Sydney",
+}
+_OFFSET_RE = re.compile(r"^(?:UTC|GMT)?\s*([+-])(\d{1,2})(?::?(\d{2}))?$", re.IGNORECASE)
+_CLOCK_RE = re.compile(r"^(\d{1,2}):(\d{2})(?::\d{2})?$")
+
+EVENT_TIMES = metrics.counter("event_times_total", "Extracted event times after local normalization, by outcome",
+                              ("result",))
+
+
+@lru_cache(maxsize=64)
+def get_zone(name):
+    """ZoneInfo for an IANA name, cached since every event in a batch asks for the same few."""
+    return ZoneInfo(name)
+
+
+@lru_cache(maxsize=256)
+def resolve_zone(label):
+    """tzinfo for a zone as a message states it, or None if it isn't recognised."""
+    label = (label or "").strip().strip('"')
+    if not label:
+        return None
+    if label.upper() in ZONE_ABBREVIATIONS:
+        return get_zone(ZONE_ABBREVIATIONS[label.upper()])
+    match = _OFFSET_RE.match(label)
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return timezone(-offset if sign == "-" else offset) if offset < timedelta(hours=24) else None
+    try:
+        return get_zone(label)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def user_zone(user_timezone):
+    """The user's tzinfo; clients that send something unusable get the default timezone."""
+    return resolve_zone(user_timezone) or get_zone(DEFAULT_TIMEZONE)
+
+
+def parse_now(user_now, tz):
+    """The client's current time in `tz`, or the server's if it sent none (or garbage)."""
+    if user_now:
+        try:
+            now = datetime.fromisoformat(user_now.replace("Z", "+00:00"))
+            return now.astimezone(tz) if now.tzinfo else now.replace(tzinfo=tz)
+        except ValueError:
+            pass
+    return datetime.now(tz)
+
+
+def format_clock(moment):
+    return f"{moment.hour % 12 or 12}:{moment.minute:02d} {'AM' if moment.hour < 12 else 'PM'}"
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+def _parse_point(value, zone, anchor):
+    """(datetime, has_time) for a start or end as the model wrote it; (None, False) if unusable.
+
+    Accepts a date, a local date-time (an explicit offset wins over `zone`),
+    or a bare clock time, which falls on `anchor`'s day.
+    """
+    value = _text(value)
+    if not value or value.lower() == NOT_SPECIFIED.lower():
+        return None, False
+    clock = _CLOCK_RE.match(value)
+    if clock:
+        hour, minute = int(clock.group(1)), int(clock.group(2))
+        if hour > 23 or minute > 59:
+            return None, False
+        return datetime.combine(anchor, dt_time(hour, minute), tzinfo=zone), True
+    try:
+        if len(value) == 10:
+            return datetime.combine(date.fromisoformat(value), dt_time(), tzinfo=zone), False
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00").replace(" ", "T", 1))
+    except ValueError:
+        return None, False
+    return (moment if moment.tzinfo else moment.replace(tzinfo=zone)), True
+
+
+class _Span:
+    """One event's time, resolved into the user's timezone."""
+
+    __slots__ = ("start", "end", "timed", "dated", "recurrence")
+
+    def __init__(self, start, end, timed, dated, recurrence):
+        self.start, self.end, self.timed, self.dated, self.recurrence = start, end, timed, dated, recurrence
+
+
+def _resolve(when, tz, now):
+    """_Span for the model's `time` object, or None when it names no usable time."""
+    if not isinstance(when, dict):
+        return None
+    if "start" in when:
+        start_text, end_text = when.get("start"), when.get("end")
+    else:
+        # Older replies (and cached ones) put a finished iso string here; re-read it as local times
+        start_text, _, end_text = _text(when.get("iso")).partition("/")
+    zone = resolve_zone(when.get("zone")) or tz
+    anchor = now.astimezone(zone).date()
+    start, timed = _parse_point(start_text, zone, anchor)
+    if start is None:
+        return None
+    dated = not _CLOCK_RE.match(_text(start_text))
+    end, end_timed = _parse_point(end_text, start.tzinfo if timed else zone, start.date())
+    if end is not None and end_timed != timed:
+        end = None
+    if timed:
+        start = start.astimezone(tz)
+        if end is not None:
+            end = end.astimezone(tz)
+            if end <= start:
+                # "11 PM - 1 AM" ends the next day
+                end += timedelta(days=1)
+                if end <= start:
+                    end = None
+    elif end is not None and end.date() < start.date():
+        end = None
+    if end is not None and not timed and end.date() == start.date():
+        end = None
+    return _Span(start, end, timed, dated, _text(when.get("recurrence")))
+
+
+def _urgency(span, now):
+    """high within 48 hours, medium within 7 days, low later, undated, or already over."""
+    if span is None or not span.dated:
+        return "low"
+    start = span.start if span.timed else datetime.combine(span.start.date(), dt_time(), tzinfo=now.tzinfo)
+    finish = span.end or start
+    if not span.timed:
+        finish = datetime.combine(finish.date() + timedelta(days=1), dt_time(), tzinfo=now.tzinfo)
+    if finish < now:
+        return "low"
+    ahead = start - now
+    if ahead <= timedelta(hours=48):
+        return "high"
+    return "medium" if ahead <= timedelta(days=7) else "low"
+
+
+def interval_urgency(start_ts, end_ts, now_ts):
+    """_urgency for an event_interval, at epoch seconds `now_ts`."""
+    if end_ts < now_ts:
+        return "low"
+    ahead = start_ts - now_ts
+    if ahead <= 48 * 3600:
+        return "high"
+    return "medium" if ahead <= 7 * 86400 else "low"
+
+
+def _day_text(moment, now, month_format):
+    text = f"{moment:{month_format}} {moment.day}"
+    return text if moment.year == now.year else f"{text}, {moment.year}"
+
+
+def _display(span, now, month_format):
+    start, end = span.start, span.end
+    if not span.timed:
+        text = _day_text(start, now, month_format)
+        if end is not None:
+            text += f" – {_day_text(end, now, month_format)}"
+    else:
+        text = format_clock(start)
+        if span.dated:
+            text = f"{_day_text(start, now, month_format)}, {text}"
+        if end is not None:
+            if end.date() == start.date():
+                text += f" – {format_clock(end)}"
+            else:
+                text += f" – {_day_text(end, now, month_format)}, {format_clock(end)}"
+        text += f" {start.tzname()}"
+    return f"{span.recurrence}, {text}" if span.recurrence else text
+
+
+def _count(spans):
+    undated = sum(1 for span in spans if span is None)
+    if undated:
+        EVENT_TIMES.inc(undated, result="not_specified")
+    if len(spans) > undated:
+        EVENT_TIMES.inc(len(spans) - undated, result="resolved")
+
+
+def normalize_email_events(events, user_timezone, now=None):
+    """Give /parse events their final `time` ({iso, display}) and `urgency`.
+
+    `iso` is a local time in the user's timezone without an offset
+    ("YYYY-MM-DDTHH:MM", optionally "/end"; "YYYY-MM-DD" for a day), as the
+    sidebar builds Google Calendar links from it. Returns new dicts.
+    """
+    tz = user_zone(user_timezone)
+    now = now.astimezone(tz) if now is not None else datetime.now(tz)
+    spans = [_resolve(event.get("time"), tz, now) for event in events]
+    _count(spans)
+    normalized = []
+    for event, span in zip(events, spans):
+        if span is None:
+            when = {"iso": NOT_SPECIFIED, "display": NOT_SPECIFIED}
+        else:
+            point = "%Y-%m-%dT%H:%M" if span.timed else "%Y-%m-%d"
+            iso = span.start.strftime(point) + (f"/{span.end.strftime(point)}" if span.end is not None else "")
+            # A recurring time without a date can still be shown, but not put on a calendar as is
+            when = {"iso": iso if span.dated else NOT_SPECIFIED, "display": _display(span, now, "%B")}
+        normalized.append({**event, "time": when, "urgency": _urgency(span, now)})
+    return normalized
+
+
+def normalize_free_text_events(events, user_timezone, now=None):
+    """Give /parse_free_text events their final `time`, in the same format as the local fast path.
+
+    `iso` carries the user's UTC offset ("2025-04-10T14:00:00-04:00/...").
+    Returns new dicts.
+    """
+    tz = user_zone(user_timezone)
+    now = now.astimezone(tz) if now is not None else datetime.now(tz)
+    spans = [_resolve(event.get("time"), tz, now) for event in events]
+    _count(spans)
+    normalized = []
+    for event, span in zip(events, spans):
+        if span is None or not span.dated:
+            when = {"iso": NOT_SPECIFIED, "display": _display(span, now, "%b") if span else NOT_SPECIFIED}
+        elif span.timed:
+            iso = span.start.isoformat(timespec="seconds")
+            if span.end is not None:
+                iso += f"/{span.end.isoformat(timespec='seconds')}"
+            when = {"iso": iso, "display": _display(span, now, "%b")}
+        else:
+            iso = span.start.date().isoformat() + (f"/{span.end.date().isoformat()}" if span.end is not None else "")
+            when = {"iso": iso, "display": _display(span, now, "%b")}
+        normalized.append({**event, "time": when})
+    return normalized
+
+
+def event_interval(event, user_timezone, default_minutes=60):
+    """(start_ts, end_ts, all_day) in epoch seconds of a normalized event, or None if it has no date.
+
+    A timed event without an end lasts `default_minutes`; a day or range of
+    days covers whole days in the user's timezone.
+    """
+    when = event.get("time")
+    start_text, _, end_text = _text(when.get("iso") if isinstance(when, dict) else None).partition("/")
+    if _CLOCK_RE.match(start_text) or _CLOCK_RE.match(end_text):
+        return None
+    tz = user_zone(user_timezone)
+    start, timed = _parse_point(start_text, tz, None)
+    if start is None:
+        return None
+    end, end_timed = _parse_point(end_text, tz, None)
+    if end is not None and (end_timed != timed or end <= start):
+        end = None
+    if not timed:
+        last_day = (end or start).date()
+        end = datetime.combine(last_day + timedelta(days=1), dt_time(), tzinfo=tz)
+    elif end is None:
+        end = start + timedelta(minutes=default_minutes)
+    return int(start.timestamp()), int(end.timestamp()), not timed
+
+
+def parse_instant(value, tz):
+    """Aware datetime for an ISO date or date-time from a client, read in `tz` unless it has an offset; None if invalid."""
+    value = _text(value)
+    if _CLOCK_RE.match(value):
+        return None
+    return _parse_point(value, tz, None)[0]
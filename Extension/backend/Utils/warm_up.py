@@ -0,0 +1,112 @@
+# warm_up.py (readiness after a cold start)
+#
+# Importing the app no longer does any expensive work: the tokenizer and the
+# SQLite schema are built on first use. The app's startup hook calls start(),
+# which builds them in the background, together with the prompt token counts
+# and the local model when an endpoint uses it, while the server already
+# accepts connections. GET /ready answers 503 until every step has finished.
+# A request that arrives earlier builds what it needs itself; the locks in
+# gmail_dal make sure nothing is built twice.
+#
+# serve.py runs the steps that don't need an event loop before it forks, so
+# its workers start out with them done.
+#
+#   python -m Utils.warm_up
+# runs those steps once and prints their times. Run it where the network is
+# available (an image build, say) to fill TOKENIZER_CACHE_DIR for offline hosts.
+import asyncio
+import logging
+import time
+
+from DAL import gmail_dal
+from Utils.openai_utils import ENDPOINT_BACKENDS, extraction_budget, get_local_pool
+
+logger = logging.getLogger(__name__)
+
+_IMPORTED_AT = time.monotonic()
+
+# Seconds each finished step took
+_steps: dict[str, float] = {}
+_error: str | None = None
+_ready_after: float | None = None
+_task: asyncio.Task | None = None
+
+
+def _tokenizer():
+    gmail_dal.get_encoding()
+    # Instruction overhead of both extraction modes, cached for every later request
+    extraction_budget(False, "openai")
+    extraction_budget(True, "openai")
+
+
+# Steps that run in a thread: (name, function)
+_SYNC_STEPS = (("tokenizer", _tokenizer), ("schema", gmail_dal.init_db))
+
+
+def _record(name, began):
+    _steps[name] = round(time.monotonic() - began, 4)
+
+
+def run_sync():
+    """Run the steps that don't need an event loop, here and now (serve.py calls this before forking)."""
+    for name, fn in _SYNC_STEPS:
+        if name not in _steps:
+            began = time.monotonic()
+            fn()
+            _record(name, began)
+
+
+async def _run():
+    global _error, _ready_after
+    loop = asyncio.get_running_loop()
+    steps = [(name, lambda fn=fn: loop.run_in_executor(None, fn)) for name, fn in _SYNC_STEPS]
+    if "local" in ENDPOINT_BACKENDS.values():
+        steps.append(("local_model", get_local_pool))
+    for name, step in steps:
+        if name in _steps:
+            continue
+        began = time.monotonic()
+        try:
+            await step()
+        except Exception as e:
+            _error = f"{name}: {e}"
+            logger.exception("Warm-up step failed", extra={"step": name})
+            return
+        _record(name, began)
+    _ready_after = round(time.monotonic() - _IMPORTED_AT, 4)
+    logger.info("Warm-up done", extra={"steps": dict(_steps), "ready_after_s": _ready_after})
+
+
+async def start():
+    """Start warming up in the background. Called from the app's startup hook."""
+    global _task, _error
+    _error = None
+    _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+def ready() -> bool:
+    return _ready_after is not None
+
+
+def status() -> dict:
+    """Served by GET /ready."""
+    return {
+        "ready": ready(),
+        "steps": dict(_steps),
+        "error": _error,
+        # From importing this module (about when the app was imported) to the last step finishing
+        "ready_after_s": _ready_after,
+    }
+
+
+if __name__ == "__main__":
+    run_sync()
+    print({"steps": _steps, "tokenizer_cache_dir": gmail_dal.TOKENIZER_CACHE_DIR})
@@ -0,0 +1,99 @@
+from quart import Blueprint, request, jsonify
+from datetime import datetime
+import logging
+from DAL.async_dal import free_slots_async, overlapping_events_async
+from Utils.time_normalizer import event_interval, parse_instant, user_zone
+from Utils import metrics
+
+availability_blueprint = Blueprint('availability', __name__)
+logger = logging.getLogger(__name__)
+
+# Longest window one request may ask about
+AVAILABILITY_MAX_DAYS = 92
+DEFAULT_SLOT_MINUTES = 30
+
+
+def _iso(ts, tz):
+    return datetime.fromtimestamp(ts, tz).isoformat(timespec='seconds')
+
+
+def _event(row, tz):
+    start_ts, end_ts, all_day, _, title, gmail_thread = row
+    return {
+        'title': title,
+        'start': _iso(start_ts, tz),
+        'end': _iso(end_ts, tz),
+        'all_day': bool(all_day),
+        'gmailThread': gmail_thread,
+    }
+
+
+def _window(data, tz):
+    """(start_ts, end_ts) from the request's start/end, or an error message."""
+    start = parse_instant(data.get('start'), tz)
+    end = parse_instant(data.get('end'), tz)
+    if start is None or end is None:
+        return None, 'start and end must be ISO dates or date-times'
+    if end <= start:
+        return None, 'end must be after start'
+    if (end - start).days > AVAILABILITY_MAX_DAYS:
+        return None, f'The window can span at most {AVAILABILITY_MAX_DAYS} days'
+    return (int(start.timestamp()), int(end.timestamp())), None
+
+
+@availability_blueprint.route('/availability', methods=['POST'])
+async def get_availability():
+    """Free slots of at least `min_minutes` between start and end, and the events that fill the rest."""
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    user_email = data.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'user_email parameter is required'}), 400
+    tz = user_zone(data.get('user_timezone', 'America/New_York'))
+    window, error = _window(data, tz)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        min_minutes = max(int(data.get('min_minutes', DEFAULT_SLOT_MINUTES)), 1)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'min_minutes must be a whole number of minutes'}), 400
+
+    with metrics.stage("availability.free_slots"):
+        busy, free = await free_slots_async(user_email, *window, min_minutes * 60,
+                                            bool(data.get('include_all_day', False)))
+    return jsonify({
+        'free': [{'start': _iso(start, tz), 'end': _iso(end, tz)} for start, end in free],
+        'busy': [_event(row, tz) for row in busy],
+    })
+
+
+@availability_blueprint.route('/conflicts', methods=['POST'])
+async def get_conflicts():
+    """Stored events overlapping a proposed time.
+
+    The time is either start/end or an event's `time` object as /parse and
+    /parse_free_text return it.
+    """
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    user_email = data.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'user_email parameter is required'}), 400
+    user_timezone = data.get('user_timezone', 'America/New_York')
+    tz = user_zone(user_timezone)
+    if data.get('time'):
+        interval = event_interval({'time': data['time']}, user_timezone)
+        if interval is None:
+            return jsonify({'error': 'time has no date to check'}), 400
+        window = interval[:2]
+    else:
+        window, error = _window(data, tz)
+        if error:
+            return jsonify({'error': error}), 400
+
+    with metrics.stage("availability.conflicts"):
+        rows = await overlapping_events_async(user_email, *window)
+    conflicts = [_event(row, tz) for row in rows]
+    return jsonify({'conflicts': conflicts, 'has_conflict': bool(conflicts)})
@@ -1,52 +1,50 @@
 from quart import Blueprint, request, jsonify
-from DAL.gmail_dal import get_suggested_contacts
+import logging
+from DAL.async_dal import search_contacts_async
+from Utils import metrics
 
 contacts_blueprint = Blueprint('contacts', __name__)
+logger = logging.getLogger(__name__)
+
+CONTACTS_PAGE_SIZE = 20
+CONTACTS_MAX_PAGE_SIZE = 100
 
 @contacts_blueprint.route('/contacts', methods=['POST'])
 async def get_contacts():
     try:
-        data = await request.get_json()
+        data = await request.get_json(silent=True) or {}
         user_email = data.get('user_email')
-        query = data.get('query', '').lower()
+        query = data.get('query', '')
         
         if not user_email:
             return jsonify({'error': 'user_email parameter is required'}), 400
+        try:
+            limit = int(data.get('limit', CONTACTS_PAGE_SIZE))
+            offset = int(data.get('offset', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'limit and offset must be whole numbers'}), 400
+        if limit < 1 or offset < 0:
+            return jsonify({'error': 'limit must be at least 1 and offset at least 0'}), 400
+        limit = min(limit, CONTACTS_MAX_PAGE_SIZE)
         
-        # Get contacts from database
-        contacts = get_suggested_contacts(user_email)
-        
-        print(contacts)
-        
-        # Ensure contacts is a list of tuples (email, name)
-        if not isinstance(contacts, list):
-            raise ValueError("Unexpected contacts format from database")
-            
-        # Filter contacts based on query
-        filtered_contacts = []
-        for email in contacts:
-            try:
-                email_lower = email.lower()
-                
-                if not query or query in email_lower:
-                    filtered_contacts.append({
-                        'email': email,
-                    })
-            except AttributeError as e:
-                # Skip malformed contact entries
-                print(f"Skipping invalid contact entry: {email} Error: {str(e)}")
-                continue
+        # Prefix match and ranking happen in the DAL; ask for one extra row to know if there's a next page
+        with metrics.stage("contacts.search"):
+            contacts = await search_contacts_async(user_email, query, limit + 1, offset)
+        has_more = len(contacts) > limit
+        contacts = contacts[:limit]
         
         return jsonify({
             'status': 'success',
-            'contacts': filtered_contacts,
-            'count': len(filtered_contacts)
+            'contacts': [{'email': email} for email in contacts],
+            'count': len(contacts),
+            'offset': offset,
+            'next_offset': offset + limit if has_more else None
         })
         
     except Exception as e:
-        print(f"Error in /contacts endpoint: {str(e)}")
+        logger.exception("Error in /contacts endpoint")
         return jsonify({
             'status': 'error',
             'error': 'Failed to fetch contacts',
             'details': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
@@ -0,0 +1,95 @@
+from quart import Blueprint, request, jsonify, Response
+from datetime import date, timedelta
+import logging
+from DAL.async_dal import digest_version_async, get_digest_async, render_digest_async, set_digest_status_async
+from DAL.digest_dal import CONFIRMED, DISMISSED, day_date, day_number, local_day
+from Utils import metrics
+
+digest_blueprint = Blueprint('digest', __name__)
+logger = logging.getLogger(__name__)
+
+# Most days one request may ask for
+DIGEST_MAX_DAYS = 31
+DIGEST_REQUESTS = metrics.counter("digest_requests_total", "/digest requests, by whether the client's copy was current",
+                                  ("result",))
+
+
+def _etag(version, first_day, days):
+    return f"{version}-{first_day}-{days}"
+
+
+@digest_blueprint.route('/digest', methods=['GET'])
+async def get_digest():
+    """The user's digest items for `days` days from `start` (default today in `user_timezone`), grouped by day.
+
+    Sends an ETag; a request whose If-None-Match still matches gets a 304
+    after one lookup of the user's digest version.
+    """
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'user_email parameter is required'}), 400
+    user_timezone = request.args.get('user_timezone', 'America/New_York')
+    try:
+        days = int(request.args.get('days', 1))
+    except ValueError:
+        days = 0
+    if not 1 <= days <= DIGEST_MAX_DAYS:
+        return jsonify({'error': f'days must be a whole number from 1 to {DIGEST_MAX_DAYS}'}), 400
+    try:
+        first = date.fromisoformat(request.args['start']) if request.args.get('start') else local_day(user_timezone)
+    except ValueError:
+        return jsonify({'error': 'start must be an ISO date'}), 400
+    first_day, last_day = day_number(first), day_number(first + timedelta(days=days - 1))
+
+    if request.if_none_match:
+        version = await digest_version_async(user_email)
+        if request.if_none_match.contains(_etag(version, first_day, days)):
+            DIGEST_REQUESTS.inc(result="not_modified")
+            response = Response("", status=304)
+            response.set_etag(_etag(version, first_day, days))
+            return response
+
+    with metrics.stage("digest.read"):
+        version, rendered, stale = await get_digest_async(user_email, first_day, last_day)
+    if stale:
+        # Days changed since they were last rendered are rendered here, so /parse never has to
+        with metrics.stage("digest.render"):
+            await render_digest_async(user_email, first_day, last_day)
+            version, rendered, _ = await get_digest_async(user_email, first_day, last_day)
+    DIGEST_REQUESTS.inc(result="full")
+    # The days' items are stored as JSON already; splice them in without decoding
+    body = '{"version":%d,"days":[%s]}' % (version, ",".join(
+        f'{{"date":"{day_date(day).isoformat()}","items":{rendered.get(day, "[]")}}}'
+        for day in (day_number(first + timedelta(days=i)) for i in range(days))))
+    response = Response(body, mimetype="application/json")
+    response.set_etag(_etag(version, first_day, days))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def _set_status(status):
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    user_email = data.get('user_email')
+    if not user_email:
+        return jsonify({'error': 'user_email parameter is required'}), 400
+    try:
+        item_id = int(data.get('id'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'id must be a digest item id'}), 400
+    item = await set_digest_status_async(user_email, item_id, status)
+    if item is None:
+        return jsonify({'error': 'Digest item not found'}), 404
+    return jsonify(item)
+
+
+@digest_blueprint.route('/digest/confirm', methods=['POST'])
+async def confirm_item():
+    return await _set_status(CONFIRMED)
+
+
+@digest_blueprint.route('/digest/dismiss', methods=['POST'])
+async def dismiss_item():
+    """Dismissed items drop out of their day's digest."""
+    return await _set_status(DISMISSED)
@@ -1,10 +1,15 @@
 from quart import Blueprint, request, jsonify
 import json
 import asyncio
-from Utils.openai_utils import _ask_openai
-from DAL.gmail_dal import save_contact
+import logging
+from Utils.openai_utils import ENDPOINT_BACKENDS, _ask_openai
+from DAL.async_dal import save_contacts_async
+from Utils.time_normalizer import normalize_free_text_events, parse_now, user_zone
+from nlp import FAST_PATH_ENABLED, parse_simple_free_text
+from Utils import metrics
 
 free_text_blueprint = Blueprint('free_text', __name__)
+logger = logging.getLogger(__name__)
 
 @free_text_blueprint.route('/parse_free_text', methods=['POST'])
 async def parse_free_text():
@@ -17,7 +22,25 @@ async def parse_free_text():
 
         if not text.strip():
             return jsonify({'error': 'Empty input'}), 400
+
+        # Simple quick-add text is resolved locally; anything ambiguous falls through to the LLM
+        if FAST_PATH_ENABLED:
+            with metrics.stage("free_text.fast_path"):
+                fast_response = parse_simple_free_text(text, user_now, user_timezone, user_email)
+            if fast_response is not None:
+                try:
+                    with metrics.stage("free_text.save_contacts"):
+                        await save_contacts_async(user_email, fast_response['events'][0]['participants'])
+                except Exception:
+                    logger.exception("Error saving contacts")
+                return jsonify(fast_response)
         
+        now = parse_now(user_now, user_zone(user_timezone))
+        # Without user_now the prompt (so the cache key) carries the local date, so "tomorrow"
+        # isn't answered from another day's cache entry
+        prompt_now = user_now or now.strftime("%A %Y-%m-%d")
+
+        # The model copies times as written; the zone conversion and display text are done locally
         prompt = f"""
 Extract scheduling information from the text and output it in JSON format. 
 Follow these strict rules:
@@ -27,13 +50,13 @@ Follow these strict rules:
    - If only a start time is mentioned, assume a default duration:
      ▸ 30 minutes for casual events (coffee, catch-up)
      ▸ 1 hour for formal events (meetings, interviews, classes).
-2. Respect the user's current time: {user_now} 
+2. Respect the user's current time: {prompt_now} 
    - Correctly interpret words like "today", "tomorrow", "next Friday", etc.
-3. If the user specify's a timezone different from their current timezone: {user_timezone}, correctly convert (e.g if user says 4pm PST but they are in NewYork, then correctly convert to their time)
+3. Do NOT convert times between timezones. Write them as the user wrote them, and put any timezone the user names (e.g. "PST") in zone; leave zone "" if they name none.
 4. Extract any participant emails mentioned in the text (e.g., emails with '@').
-5. Output times in this format:
-   - **iso**: Single ISO-8601 string (either start only or start/end separated by "/")
-   - **display**: Easy-to-read version for humans
+5. Output times as:
+   - **start** / **end**: "YYYY-MM-DDTHH:MM"
+   - **zone**: The timezone named in the text, or ""
 6. Final output must be a pure valid JSON object like this:
 
 {{
@@ -41,8 +64,9 @@ Follow these strict rules:
     {{
       "title": "Meeting title",
       "time": {{
-          "iso": "2025-04-10T14:00:00-04:00/2025-04-10T15:00:00-04:00",
-          "display": "Apr 10, 2:00 PM – 3:00 PM EDT"
+          "start": "2025-04-10T14:00",
+          "end": "2025-04-10T15:00",
+          "zone": ""
       }},
       "participants": ["person1@example.com", "person2@example.com"],
       "description": "Brief description or purpose"
@@ -68,10 +92,10 @@ Text to analyze:
                         "role": "system",
                         "content": (
                                                 "You are a precise scheduling assistant that extracts:"
-                                                "- Event titles\n- Times (with timezone conversion)\n- Participants\n"
+                                                "- Event titles\n- Times (as written, with any stated timezone)\n- Participants\n"
                                                 "STRICT RULES:\n"
                                                 "1. ALWAYS output valid JSON\n"
-                                                "2. Convert ALL times to specified timezone\n"
+                                                "2. Never convert times between timezones\n"
                                                 "3. Skip the user's own email in participants\n"
                                                 "4. Be concise but descriptive"
                                             )
@@ -86,10 +110,9 @@ Text to analyze:
             }
 
         try:
-            print(f"Calling OpenAI API with text: {text[:50]}...")
-            response = await _ask_openai(payload)
-            print(f"OpenAI response received: {response}")
-            print(type(response))
+            with metrics.stage("free_text.llm"):
+                response = await _ask_openai(payload, user_email, ENDPOINT_BACKENDS["free_text"])
+            logger.debug("OpenAI response received", extra={"response": response})
             
             if not response:
                 return jsonify({'error': 'Empty response from OpenAI'}), 500
@@ -97,30 +120,24 @@ Text to analyze:
             if 'events' not in response:
                 return jsonify({'error': 'Response missing events field', 'response': response}), 500
 
+            with metrics.stage("free_text.normalize_times"):
+                response = {**response, 'events': normalize_free_text_events(response['events'], user_timezone, now)}
+
             # Save new contacts to DB
             try:
-                for event in response['events']:
-                    for email in event.get('participants', []):
-                        try:
-                            save_contact(user_email, email)
-                            print(f"Saved contact: {email}")
-                        except Exception as contact_err:
-                            print(f"Error saving contact {email}: {str(contact_err)}")
-                            # Continue execution even if saving contacts fails
-            except Exception as save_err:
-                print(f"Error in contact saving loop: {str(save_err)}")
+                participants = [email for event in response['events'] for email in event.get('participants', [])]
+                with metrics.stage("free_text.save_contacts"):
+                    await save_contacts_async(user_email, participants)
+            except Exception:
+                logger.exception("Error saving contacts")
                 # Continue execution even if saving contacts fails
                 
             return jsonify(response)
 
         except Exception as api_err:
-            import traceback
-            print(f"OpenAI API error: {str(api_err)}")
-            traceback.print_exc()
+            logger.exception("OpenAI API error")
             return jsonify({'error': f'OpenAI API error: {str(api_err)}'}), 500
 
     except Exception as e:
-        import traceback
-        print(f"General error in parse_free_text: {str(e)}")
-        traceback.print_exc()
+        logger.exception("General error in parse_free_text")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
\ No newline at end of file
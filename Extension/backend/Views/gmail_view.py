@@ -1,10 +1,16 @@
 from quart import Blueprint, request, jsonify, Response
 import asyncio
 import json
-from DAL.gmail_dal import build_email_blocks, chunk_blocks, remove_duplicates
-from Utils.openai_utils import _ask_openai_gmail, _build_prompt
+import logging
+from DAL.gmail_dal import build_email_blocks, chunk_threads, pack_blocks
+from DAL.async_dal import remove_duplicates_async, mark_emails_processed_async
+from Utils.openai_utils import BACKENDS, ENDPOINT_BACKENDS, EXTRACTION_MODE, STREAMING_BACKENDS, STREAM_EVENTS, _build_prompt, _stream_openai_gmail, extract_events, extraction_budget
+from Utils.json_utils import ndjson_line
+from Utils.time_normalizer import normalize_email_events, parse_now, user_zone
+from Utils import metrics
 
 gmail_blueprint = Blueprint('gmail', __name__)
+logger = logging.getLogger(__name__)
 
 @gmail_blueprint.route('/parse', methods=['POST'])
 async def parse_text():
@@ -12,53 +18,138 @@ async def parse_text():
     raw_text = data.get('text', '')
     user_timezone = data.get("user_timezone", "America/New_York")
     user_email = 'mkumbon1@swarthmore.edu'
-    print('user timezone: ', user_timezone)
 
     if not raw_text:
         return jsonify({'error': 'No text provided'}), 400
+    # "local" runs extraction on the local model pool instead of the hosted API
+    backend = data.get("llm_backend", ENDPOINT_BACKENDS["parse"])
+    if backend not in BACKENDS:
+        return jsonify({'error': f'Unknown llm_backend: {backend}'}), 400
 
-    raw_dict = json.loads(raw_text)
+    with metrics.stage("parse.decode"):
+        raw_dict = json.loads(raw_text)
+    emails = raw_dict.get("emails", [])
     loop = asyncio.get_event_loop()
-    email_blocks = await loop.run_in_executor(None, lambda: build_email_blocks(raw_dict.get("emails", [])))
-    chunks = await loop.run_in_executor(None, lambda: chunk_blocks(email_blocks))
+    with metrics.stage("parse.build_blocks"):
+        email_blocks, block_stats = await loop.run_in_executor(None, lambda: build_email_blocks(emails, user_email))
+    # "structured" uses a strict JSON schema with per-email retries, which allows larger chunks
+    structured = data.get("extraction_mode", EXTRACTION_MODE) == "structured"
+    # Budget chunks against the whole request, not just the email text
+    overhead, budget = extraction_budget(structured, backend)
+    with metrics.stage("parse.pack"):
+        packed = await loop.run_in_executor(None, lambda: pack_blocks(email_blocks, max_tokens=budget))
+    chunks = ["\n\n".join(pieces) for pieces, _ in packed]
+    logger.info("Packed emails for extraction", extra={
+        "emails": len(emails), "chunks": len(chunks), "user_timezone": user_timezone, **block_stats})
 
+    emails_by_thread = {}
+    for email in emails:
+        emails_by_thread.setdefault(email.get("gmailThread", ""), []).append(email)
+
+    # "delta" streams only new_events with sequence numbers plus a final summary;
+    # the default "full" mode also resends the cumulative all_events list for old clients
+    delta = data.get("stream_mode") == "delta"
+    # Stream the completion itself so each event is sent as soon as the model finishes it
+    # (the structured mode needs the whole response to decide on retries)
+    stream_events = bool(data.get("stream_events", STREAM_EVENTS)) and not structured and backend in STREAMING_BACKENDS
     all_events = []
+    # Urgency is measured from one instant for the whole request
+    now = parse_now(data.get("user_now"), user_zone(user_timezone))
 
     async def generate_events():
-        tasks = [asyncio.create_task(_ask_openai_gmail(_build_prompt(chunk, user_timezone))) for chunk in chunks]
-        pending = set(tasks)
-        task_to_index = {task: i for i, task in enumerate(tasks)}
+        # Chunk workers report (idx, events) for every batch of events they have,
+        # then (idx, None) when finished or (idx, exception) on failure
+        queue = asyncio.Queue()
+
+        async def run_chunk(idx):
+            pieces, tokens = packed[idx]
+            try:
+                with metrics.stage("parse.llm"):
+                    if stream_events:
+                        async for event in _stream_openai_gmail(_build_prompt(chunks[idx]), user_email, tokens + overhead, backend):
+                            await queue.put((idx, [event]))
+                    else:
+                        await queue.put((idx, await extract_events(pieces, user_email, tokens + overhead, structured, backend)))
+                await queue.put((idx, None))
+            except Exception as e:
+                await queue.put((idx, e))
+
+        tasks = [asyncio.create_task(run_chunk(idx)) for idx in range(len(packed))]
+        remaining = len(tasks)
+        seq = 0
+        total_events = 0
+        failed_chunks = set()
+        # An email split over several chunks is processed only once all of them succeed;
+        # a failed chunk stays in its threads' sets, so their emails are never marked
+        chunk_thread_ids = [set(chunk_threads(chunk)) for chunk in chunks]
+        chunks_left = {}
+        for idx, threads in enumerate(chunk_thread_ids):
+            for thread in threads:
+                chunks_left.setdefault(thread, set()).add(idx)
 
-        while pending:
-            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        def line(message):
+            nonlocal seq
+            seq += 1
+            if delta:
+                message["seq"] = seq
+            else:
+                message["all_events"] = all_events
+            return ndjson_line(message)
 
-            for completed_task in done:
-                idx = task_to_index[completed_task]
+        try:
+            while remaining:
+                idx, result = await queue.get()
+                if result is None or isinstance(result, Exception):
+                    remaining -= 1
                 try:
-                    result = completed_task.result()
-                    new_events = remove_duplicates('mkumbon1@swarthmore.edu', result)
+                    if isinstance(result, Exception):
+                        raise result
+                    if result is None:
+                        if idx in failed_chunks:
+                            continue
+                        finished = []
+                        for thread in chunk_thread_ids[idx]:
+                            chunks_left[thread].discard(idx)
+                            if not chunks_left[thread]:
+                                finished.append(thread)
+                        processed = [email for thread in finished for email in emails_by_thread.get(thread, [])]
+                        if processed:
+                            with metrics.stage("parse.mark_processed"):
+                                await mark_emails_processed_async(user_email, processed)
+                        continue
+                    with metrics.stage("parse.normalize_times"):
+                        result = normalize_email_events(result, user_timezone, now)
+                    with metrics.stage("parse.dedup"):
+                        new_events = await remove_duplicates_async(user_email, result, user_timezone)
                     if new_events:
-                        all_events.extend(new_events)
-                        yield json.dumps({
+                        total_events += len(new_events)
+                        if not delta:
+                            all_events.extend(new_events)
+                        yield line({
                             "chunk_index": idx,
                             "total_chunks": len(chunks),
                             "new_events": new_events,
-                            "all_events": all_events
-                        }) + "\n"
+                        })
                 except Exception as e:
-                    yield json.dumps({
+                    failed_chunks.add(idx)
+                    yield line({
                         "chunk_index": idx,
                         "total_chunks": len(chunks),
                         "error": str(e),
                         "new_events": [],
-                        "all_events": all_events
-                    }) + "\n"
+                    })
+        finally:
+            # If the client went away, nobody will read what the remaining workers produce
+            for task in tasks:
+                task.cancel()
 
-        yield json.dumps({
+        yield line({
             "complete": True,
             "total_chunks": len(chunks),
+            "total_events": total_events,
+            "failed_chunks": len(failed_chunks),
+            **block_stats,
             "new_events": [],
-            "all_events": all_events
-        }) + "\n"
+        })
 
     return Response(generate_events(), mimetype="application/x-ndjson")
@@ -0,0 +1,99 @@
+from quart import Blueprint, request, jsonify, Response
+import asyncio
+import json
+from DAL.async_dal import create_job_async, get_job_async, job_results_async
+from DAL.jobs_dal import FINISHED_STATUSES
+from Utils.job_worker import JOB_POLL_INTERVAL, enqueue, progress_event
+from Utils.openai_utils import EXTRACTION_MODE
+from Utils.json_utils import ndjson_line
+
+jobs_blueprint = Blueprint('jobs', __name__)
+
+JOB_RESULTS_PAGE = 100
+
+
+def _progress(job):
+    finished = job["done_chunks"] + job["failed_chunks"]
+    return finished / job["total_chunks"] if job["total_chunks"] else float(job["status"] in FINISHED_STATUSES)
+
+
+@jobs_blueprint.route('/jobs', methods=['POST'])
+async def submit_job():
+    data = await request.get_json()
+    user_email = data.get('user_email')
+    user_timezone = data.get("user_timezone", "America/New_York")
+    extraction_mode = data.get("extraction_mode", EXTRACTION_MODE)
+
+    if not user_email:
+        return jsonify({'error': 'user_email parameter is required'}), 400
+
+    # Same payload as /parse ("text" holding {"emails": [...]}) or the list directly
+    emails = data.get("emails")
+    if emails is None and data.get('text'):
+        emails = json.loads(data['text']).get("emails", [])
+    if not emails:
+        return jsonify({'error': 'No emails provided'}), 400
+
+    job_id = await create_job_async(user_email.lower(), user_timezone, emails, extraction_mode)
+    enqueue(job_id)
+    return jsonify({'job_id': job_id, 'status': 'queued', 'total_emails': len(emails)}), 202
+
+
+@jobs_blueprint.route('/jobs/<job_id>', methods=['GET'])
+async def get_job_status(job_id):
+    """Job state plus the chunk results finished after the `after` sequence number."""
+    job = await get_job_async(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    after = request.args.get('after', 0, type=int)
+    results = await job_results_async(job_id, after, JOB_RESULTS_PAGE)
+    return jsonify({
+        **job,
+        'progress': _progress(job),
+        'results': results,
+        'next_after': results[-1]["seq"] if results else after,
+    })
+
+
+@jobs_blueprint.route('/jobs/<job_id>/stream', methods=['GET'])
+async def stream_job(job_id):
+    """NDJSON of chunk results as they finish, in the /parse delta format, then a summary line.
+
+    Reconnect with ?after=<last seq received> to continue where a dropped stream stopped.
+    """
+    job = await get_job_async(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    after = request.args.get('after', 0, type=int)
+
+    async def generate_events():
+        nonlocal after
+        while True:
+            updated = progress_event(job_id)
+            job = await get_job_async(job_id)
+            results = await job_results_async(job_id, after, JOB_RESULTS_PAGE)
+            for result in results:
+                after = result["seq"]
+                yield ndjson_line({**result, "total_chunks": job["total_chunks"]})
+            if len(results) == JOB_RESULTS_PAGE:
+                continue
+            if job["status"] in FINISHED_STATUSES:
+                yield ndjson_line({
+                    "complete": True,
+                    "job_id": job_id,
+                    "status": job["status"],
+                    "total_chunks": job["total_chunks"],
+                    "total_events": job["total_events"],
+                    "failed_chunks": job["failed_chunks"],
+                    "skipped_emails": job["skipped_emails"],
+                    "filtered_emails": job["filtered_emails"],
+                    "error": job["error"],
+                    "new_events": [],
+                })
+                return
+            try:
+                await asyncio.wait_for(updated.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    return Response(generate_events(), mimetype="application/x-ndjson")
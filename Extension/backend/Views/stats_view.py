@@ -0,0 +1,74 @@
+from quart import Blueprint, jsonify, Response
+import os
+from DAL.async_dal import db_stats, cache_stats_async
+from Utils.openai_utils import get_dispatcher, local_pool_stats, single_flight_stats
+from Utils import metrics, warm_up
+from nlp import fast_path_stats
+
+stats_blueprint = Blueprint('stats', __name__)
+
+# The LLM cache's stats as of the latest /metrics request, for _collect_stats:
+# counting its entries is a query, so the handler runs it off the event loop first
+_cache_stats = None
+
+
+@stats_blueprint.route('/stats', methods=['GET'])
+async def get_stats():
+    """Counters of the worker process that answers; under serve.py each worker keeps its own."""
+    return jsonify({
+        'pid': os.getpid(),
+        'db_ops': db_stats(),
+        'llm_dispatcher': get_dispatcher().stats(),
+        'local_llm': local_pool_stats(),
+        'single_flight': single_flight_stats(),
+        'llm_cache': await cache_stats_async(),
+        'fast_path': fast_path_stats(),
+    })
+
+
+@stats_blueprint.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Prometheus text format of this worker's metrics."""
+    global _cache_stats
+    _cache_stats = await cache_stats_async()
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@metrics.register_collector
+def _collect_stats():
+    """Expose the counters other modules already keep, read at scrape time."""
+    dispatcher = get_dispatcher().stats()
+    cache = _cache_stats
+    fast_path = fast_path_stats()
+    db = db_stats()
+    local = local_pool_stats()
+    return [
+        ("llm_dispatcher_requests_total", "counter", "LLM requests through the dispatcher, by outcome",
+         [({"outcome": name}, dispatcher[name]) for name in ("submitted", "completed", "retries", "rate_limited", "failed")]),
+        ("llm_dispatcher_queue_depth", "gauge", "LLM requests waiting for a slot", [({}, dispatcher["queue_depth"])]),
+        ("llm_dispatcher_in_flight", "gauge", "LLM requests being sent", [({}, dispatcher["in_flight"])]),
+        ("llm_cache_lookups_total", "counter", "LLM response cache lookups, by result",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])] if cache else []),
+        ("llm_cache_hit_ratio", "gauge", "Share of LLM cache lookups that hit",
+         [({}, cache["hit_ratio"])] if cache else []),
+        ("llm_cache_entries", "gauge", "Entries in the LLM response cache", [({}, cache["entries"])] if cache else []),
+        ("free_text_fast_path_total", "counter", "Free-text requests checked by the local parser, by result",
+         [({"result": "hit"}, fast_path["hits"]), ({"result": "miss"}, fast_path["misses"])]),
+        ("dal_calls_total", "counter", "Calls through async_dal, by DAL function",
+         [({"op": name}, counts["calls"]) for name, counts in db.items()]),
+        ("dal_call_seconds_total", "counter", "Time in async_dal calls including queueing, by DAL function",
+         [({"op": name}, counts["seconds"]) for name, counts in db.items()]),
+        ("local_llm_requests_total", "counter", "Completions run on the local model pool, by outcome",
+         [({"outcome": name}, local[name]) for name in ("submitted", "failed")] if local else []),
+        ("local_llm_batches_total", "counter", "Batches handed to local model workers",
+         [({}, local["batches"])] if local else []),
+        ("local_llm_queue_depth", "gauge", "Completions waiting for a local model worker",
+         [({}, local["queue_depth"])] if local else []),
+    ]
+
+
+@stats_blueprint.route('/ready', methods=['GET'])
+async def get_ready():
+    """200 once this worker's warm-up has finished, 503 before; the body has each step's time."""
+    status = warm_up.status()
+    return jsonify(status), 200 if status['ready'] else 503
@@ -3,6 +3,17 @@ from quart_cors import cors
 from Views.gmail_view import gmail_blueprint
 from Views.free_text_view import free_text_blueprint
 from Views.contacts_view import contacts_blueprint
+from Views.jobs_view import jobs_blueprint
+from Views.stats_view import stats_blueprint
+from Views.availability_view import availability_blueprint
+from Views.digest_view import digest_blueprint
+from Utils.openai_utils import init_client, close_client
+from Utils.job_worker import start_workers, stop_workers
+from Utils.digest_worker import start_sweeper, stop_sweeper
+from Utils.log_utils import setup_logging, stop_logging
+from Utils.metrics import MetricsMiddleware
+from Utils import profiler, warm_up
+from DAL import async_dal
 
 app = Quart(__name__)
 app = cors(app, allow_origin="*")
@@ -10,6 +21,33 @@ app = cors(app, allow_origin="*")
 app.register_blueprint(gmail_blueprint, url_prefix="")
 app.register_blueprint(free_text_blueprint, url_prefix="")
 app.register_blueprint(contacts_blueprint, url_prefix="")
+app.register_blueprint(jobs_blueprint, url_prefix="")
+app.register_blueprint(stats_blueprint, url_prefix="")
+app.register_blueprint(availability_blueprint, url_prefix="")
+app.register_blueprint(digest_blueprint, url_prefix="")
+
+# Times every request to its last streamed byte; PROFILE_SLOW_MS adds stack dumps of slow ones
+app.asgi_app = MetricsMiddleware(app.asgi_app, app.url_map, on_start=profiler.start, on_finish=profiler.finish)
+
+
+@app.before_serving
+async def startup():
+    # Per process: serve.py forks its workers after importing the app
+    setup_logging()
+    await init_client()
+    await warm_up.start()
+    await start_workers()
+    await start_sweeper()
+
+
+@app.after_serving
+async def shutdown():
+    await stop_sweeper()
+    await stop_workers()
+    await warm_up.stop()
+    await close_client()
+    async_dal.flush()
+    stop_logging()
 
 if __name__ == '__main__':
     import uvicorn
@@ -0,0 +1,298 @@
+# nlp.py (local NLP helpers that run before anything is sent to the LLM)
+import os
+import re
+import time
+from collections import deque
+from datetime import date, datetime, time as dt_time, timedelta
+from zoneinfo import ZoneInfoNotFoundError
+
+from Utils.time_normalizer import format_clock, get_zone, parse_now
+
+
+PREFILTER_ENABLED = os.getenv("PREFILTER", "1") == "1"
+# Emails scoring below this are dropped before chunking; lower keeps more mail
+PREFILTER_THRESHOLD = float(os.getenv("PREFILTER_THRESHOLD", "1.0"))
+# spaCy NER is only consulted for borderline emails, and only when enabled
+PREFILTER_SPACY = os.getenv("PREFILTER_SPACY", "0") == "1"
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+
+_MONTH = (r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)")
+# Bare "sun", "sat", "wed", "mon" are ordinary words, so only full names and unambiguous abbreviations
+_WEEKDAY = r"(?:(?:mon|tues|wednes|thurs|fri|satur|sun)day|tues|thurs|fri)"
+
+_DATE_RE = re.compile(
+    rf"\b{_MONTH}\.?\s+\d{{1,2}}(?:st|nd|rd|th)?\b"           # April 10, Apr. 3rd
+    rf"|\b\d{{1,2}}(?:st|nd|rd|th)?\s+(?:of\s+)?{_MONTH}\b"   # 10 April, 3rd of May
+    r"|\b\d{4}-\d{2}-\d{2}\b"                                   # 2025-04-10
+    r"|\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b"                        # 4/10, 4/10/25
+    rf"|\b{_WEEKDAY}\b"
+    r"|\b(?:today|tonight|tomorrow|this (?:week|weekend|morning|afternoon|evening)|next (?:week|month))\b"
+    r"|\bin (?:a|one|two|three|a few|\d+) (?:days?|weeks?)\b",
+    re.IGNORECASE,
+)
+_TIME_RE = re.compile(
+    r"\b\d{1,2}(?::\d{2})?\s*(?:a\.?m\.?|p\.?m\.?)(?!\w)"       # 3pm, 3:30 p.m.
+    r"|\b(?:[01]?\d|2[0-3]):[0-5]\d\b"                          # 15:00
+    r"|\b(?:noon|midnight)\b",
+    re.IGNORECASE,
+)
+_SCHEDULING_RE = re.compile(
+    r"\b(?:meeting|meet|deadline|due|rsvp|register|registration|workshop|seminar|session|interview"
+    r"|appointment|webinar|class|lecture|exam|midterm|final|office hours|reminder|invite|invitation"
+    r"|schedule[ds]?|reschedule[ds]?|event|conference|call|zoom|calendar|talk|info session|orientation"
+    r"|book(?:ing)?|slot|availability|available|catch up|find a time|what works|kickoff)\b",
+    re.IGNORECASE,
+)
+_PROMO_RE = re.compile(
+    r"\b(?:unsubscribe|sale|discount|deal|coupon|promo(?:tion)?|newsletter|% off|free shipping"
+    r"|order (?:has )?shipped|receipt|view in browser|limited time|shop now)\b|\d+% off",
+    re.IGNORECASE,
+)
+
+_nlp = None
+_nlp_loaded = False
+
+
+def _spacy():
+    """Load the spaCy pipeline once; None if spaCy or the model isn't installed."""
+    global _nlp, _nlp_loaded
+    if not _nlp_loaded:
+        _nlp_loaded = True
+        try:
+            import spacy
+            _nlp = spacy.load(SPACY_MODEL, disable=["parser", "lemmatizer", "tagger", "attribute_ruler"])
+        except (ImportError, OSError):
+            _nlp = None
+    return _nlp
+
+
+def email_text(email):
+    return f"{email.get('subject', '')}\n{email.get('snippet', '')}"
+
+
+def scheduling_score(text):
+    """Rule-based score for how likely `text` contains something to put on a calendar.
+
+    Dates and times dominate, scheduling keywords add a little, and promotional
+    phrasing subtracts. Each signal is capped so one long newsletter can't win
+    on volume alone.
+    """
+    dates = min(len(_DATE_RE.findall(text)), 2)
+    times = min(len(_TIME_RE.findall(text)), 2)
+    keywords = min(len(_SCHEDULING_RE.findall(text)), 3)
+    promos = min(len(_PROMO_RE.findall(text)), 3)
+    return 1.5 * dates + 1.5 * times + 0.5 * keywords - 0.75 * promos
+
+
+def filter_scheduling_emails(emails, threshold=PREFILTER_THRESHOLD):
+    """Keep emails with a temporal/scheduling signal. Returns (kept, dropped_count)."""
+    texts = [email_text(email) for email in emails]
+    scores = [scheduling_score(text) for text in texts]
+
+    nlp = _spacy() if PREFILTER_SPACY else None
+    if nlp is not None:
+        # Let NER rescue borderline emails whose dates the regexes missed ("the first Monday of May")
+        borderline = [i for i, score in enumerate(scores) if threshold - 1.5 <= score < threshold]
+        for i, doc in zip(borderline, nlp.pipe((texts[i] for i in borderline), batch_size=64)):
+            if any(ent.label_ in ("DATE", "TIME") for ent in doc.ents):
+                scores[i] += 1.5
+
+    kept = [email for email, score in zip(emails, scores) if score >= threshold]
+    return kept, len(emails) - len(kept)
+
+
+# -------------------- FREE-TEXT FAST PATH --------------------
+
+FAST_PATH_ENABLED = os.getenv("FREE_TEXT_FAST_PATH", "1") == "1"
+
+_CASUAL_RE = re.compile(r"\b(?:coffee|tea|lunch|breakfast|brunch|drinks?|catch[- ]?up|chat|hang ?out|walk|quick call)\b", re.IGNORECASE)
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_ONE_ON_ONE_RE = re.compile(r"\b1(?::|-on-)1\b", re.IGNORECASE)
+# Anything the rules can't resolve safely goes to the LLM
+_AMBIGUOUS_RE = re.compile(
+    r"\b(?:every|each|weekly|daily|monthly|biweekly|recurring|next\s+(?:mon|tues|wednes|thurs|fri|satur|sun)day"
+    r"|time ?zone|or|between|until|till|before|after|around|ish|morning|afternoon|evening|tonight)\b",
+    re.IGNORECASE,
+)
+# Explicit zones need conversion, which the LLM path handles
+_TZ_RE = re.compile(r"\b(?:[A-Z]{1,4}[SD]?T|UTC|GMT)\b|\b(?i:[ecmp][sd]t|utc|gmt|bst|cet|cest)\b")
+_TIME_TOKEN = r"(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?"
+_TIME_RANGE_RE = re.compile(rf"\b(from\s+)?{_TIME_TOKEN}\s*(?:-|–|to)\s*{_TIME_TOKEN}(?!\w)", re.IGNORECASE)
+# The leading "at"/"@" (or "from" above) is captured: it is what makes a bare number a time
+_SINGLE_TIME_RE = re.compile(rf"(\bat\s+|@\s*)?\b{_TIME_TOKEN}(?!\w)|\b(?:at\s+)?(noon|midnight)\b", re.IGNORECASE)
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_DAY_RE = re.compile(
+    r"\b(?:on\s+)?(?:(today|tomorrow)"
+    r"|(?:this\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+    rf"|({_MONTH})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?"
+    r"|(\d{1,2})/(\d{1,2})"
+    r"|(\d{4})-(\d{2})-(\d{2}))\b",
+    re.IGNORECASE,
+)
+_FILLER_RE = re.compile(r"^(?:(?:please|schedule|set up|setup|book|add|create|plan|a|an)\s+)+|\s+(?:on|at|for|from|with|and)$", re.IGNORECASE)
+
+_fast_path_latencies = deque(maxlen=2000)
+fast_path_counters = {"hits": 0, "misses": 0}
+
+
+def _to_24h(hour, minute, meridiem, marked=False):
+    """(hour, minute) of a time token, or None unless it is explicitly a time.
+
+    A bare number is a time only with am/pm, minutes ("8:00") or a leading
+    "at"/"@"/"from" (`marked`); "8 people" or "for 10" is not.
+    """
+    if not (meridiem or minute or marked):
+        return None
+    hour, minute = int(hour), int(minute or 0)
+    if hour > 23 or minute > 59:
+        return None
+    if meridiem:
+        if hour == 0 or hour > 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower().startswith("p") else 0)
+    elif hour <= 7:
+        # "at 3" without am/pm almost always means the afternoon, but let the LLM decide
+        return None
+    return hour, minute
+
+
+def _resolve_day(match, now):
+    relative, weekday, month, month_day, num_month, num_day, year, iso_month, iso_day = match.groups()
+    today = now.date()
+    if relative:
+        return today + timedelta(days=1 if relative.lower() == "tomorrow" else 0)
+    if weekday:
+        return today + timedelta(days=(_WEEKDAYS.index(weekday.lower()) - today.weekday()) % 7)
+    try:
+        if month:
+            day = date(today.year, _MONTHS.index(month[:3].lower()) + 1, int(month_day))
+        elif num_month:
+            day = date(today.year, int(num_month), int(num_day))
+        else:
+            return date(int(year), int(iso_month), int(iso_day))
+    except ValueError:
+        return None
+    # A month/day that already passed this year means next year
+    return day if day >= today else day.replace(year=today.year + 1)
+
+
+def _title(text, spans):
+    # Cut out the date/time phrases, then swap emails for their local part ("bob@x.com" -> "bob")
+    pieces, last = [], 0
+    for start, end in sorted(spans):
+        pieces.append(text[last:start])
+        last = end
+    pieces.append(text[last:])
+    title = _EMAIL_RE.sub(lambda m: m.group(0).split("@")[0], " ".join(pieces))
+    title = re.sub(r"\s+", " ", title).strip(" ,.;:-")
+    previous = None
+    while previous != title:
+        previous, title = title, _FILLER_RE.sub("", title).strip(" ,.;:-")
+    return (title[:1].upper() + title[1:]) if title else "Meeting"
+
+
+def parse_simple_free_text(text, user_now=None, user_timezone="America/New_York", user_email=None):
+    """Resolve simple quick-add text ("coffee with bob@x.com tomorrow 3pm") without the LLM.
+
+    Handles one explicit day (today, tomorrow, a weekday, a month/day or
+    numeric date) and one time or time range in the user's timezone, applying
+    the endpoint's default durations: 30 minutes for casual events, an hour
+    otherwise. Returns the /parse_free_text response shape, or None when the
+    text is anything less than unambiguous so the caller falls back to the LLM.
+    """
+    started = time.perf_counter()
+    result = None
+    try:
+        result = _parse_simple_free_text(text, user_now, user_timezone, user_email)
+        return result
+    finally:
+        _fast_path_latencies.append(time.perf_counter() - started)
+        fast_path_counters["hits" if result is not None else "misses"] += 1
+
+
+def _parse_simple_free_text(text, user_now, user_timezone, user_email):
+    if len(text) > 200 or "?" in text:
+        return None
+    emails = _EMAIL_RE.findall(text)
+    # Blank out emails and "1:1"s (same length, so match offsets still line up with `text`)
+    scrubbed = _ONE_ON_ONE_RE.sub(lambda m: " " * len(m.group(0)), _EMAIL_RE.sub(lambda m: " " * len(m.group(0)), text))
+    if _AMBIGUOUS_RE.search(scrubbed) or _TZ_RE.search(scrubbed):
+        return None
+    try:
+        tz = get_zone(user_timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+    now = parse_now(user_now, tz)
+
+    days = list(_DAY_RE.finditer(scrubbed))
+
+    def outside(match, spans):
+        return not any(span.start() <= match.start() < span.end() for span in spans)
+
+    # Digits inside a date ("2025-05-01", "4/20") are not times
+    ranges = [m for m in _TIME_RANGE_RE.finditer(scrubbed) if outside(m, days)]
+    singles = [m for m in _SINGLE_TIME_RE.finditer(scrubbed) if outside(m, days) and outside(m, ranges)]
+    if len(days) != 1 or len(ranges) + len(singles) != 1:
+        return None
+
+    day = _resolve_day(days[0], now)
+    if day is None:
+        return None
+
+    if ranges:
+        marker, h1, m1, mer1, h2, m2, mer2 = ranges[0].groups()
+        # "3-4pm": the start borrows the end's am/pm; "10-10:30" is a time, "8-10" alone is not
+        marked = bool(marker or m1 or m2)
+        start_hm = _to_24h(h1, m1, mer1 or mer2, marked)
+        end_hm = _to_24h(h2, m2, mer2 or mer1, marked)
+        time_match = ranges[0]
+    else:
+        marker, hour, minute, meridiem, word = singles[0].groups()
+        start_hm = ({"noon": (12, 0), "midnight": (0, 0)}[word.lower()] if word
+                    else _to_24h(hour, minute, meridiem, bool(marker)))
+        end_hm = None
+        time_match = singles[0]
+    if start_hm is None or (ranges and end_hm is None):
+        return None
+
+    start = datetime.combine(day, dt_time(*start_hm), tzinfo=tz)
+    if days[0].group(2) and start < now:
+        # A bare weekday whose time already passed today means next week
+        start += timedelta(days=7)
+    if end_hm is not None:
+        end = datetime.combine(start.date(), dt_time(*end_hm), tzinfo=tz)
+        if end <= start:
+            return None
+    else:
+        end = start + timedelta(minutes=30 if _CASUAL_RE.search(scrubbed) else 60)
+
+    title = _title(text, [days[0].span(), time_match.span()])
+    own = (user_email or "").lower()
+    participants = list(dict.fromkeys(e for e in emails if e.lower() != own))
+    return {
+        "events": [{
+            "title": title,
+            "time": {
+                "iso": f"{start.isoformat(timespec='seconds')}/{end.isoformat(timespec='seconds')}",
+                "display": f"{start:%b} {start.day}, {format_clock(start)} – {format_clock(end)} {start.tzname()}",
+            },
+            "participants": participants,
+            "description": text.strip(),
+        }]
+    }
+
+
+def fast_path_stats():
+    latencies = sorted(_fast_path_latencies)
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    total = fast_path_counters["hits"] + fast_path_counters["misses"]
+    return {
+        **fast_path_counters,
+        "hit_rate": fast_path_counters["hits"] / total if total else 0.0,
+        "latency_p50_ms": pct(0.50),
+        "latency_p95_ms": pct(0.95),
+        "latency_p99_ms": pct(0.99),
+    }
@@ -0,0 +1,106 @@
+"""Multi-process server for the backend.
+
+    python serve.py [--workers N] [--host 0.0.0.0] [--port 5001]
+
+The app is imported and warmed up once here, so the tiktoken encoding, prompts
+and regexes are loaded before forking and shared copy-on-write by every worker. The
+workers accept connections on one inherited listening socket. With more than
+one worker, a single writer process applies all SQLite writes (see
+DAL/db_writer.py), and only the first worker runs /jobs. Workers that die are
+restarted. `python app.py` still runs a single worker for development.
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _listen(host, port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock, index, workers, log_level):
+    import uvicorn
+    from Utils import job_worker, llm_dispatcher
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    job_worker.JOB_RUNNER = job_worker.JOB_RUNNER and index == 0
+    # The provider's requests/min and tokens/min limits are per account, not per process
+    llm_dispatcher.LIMIT_SHARE = 1 / workers
+    config = uvicorn.Config(app, log_level=log_level, timeout_graceful_shutdown=30)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    from app import app
+    from DAL import db_writer, gmail_dal
+    from Utils import warm_up
+
+    # Build the BPE tables and the schema now rather than once per worker
+    warm_up.run_sync()
+    # Importing the DAL opened SQLite connections; a connection must never cross a fork
+    gmail_dal.close_connection()
+
+    sock = _listen(args.host, args.port)
+    writer = db_writer.start_writer_process() if args.workers > 1 else None
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock, index, args.workers, args.log_level)
+            finally:
+                os._exit(0)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(args.workers):
+        spawn(index)
+    print(f"Serving on {args.host}:{args.port} with {args.workers} worker(s)"
+          f"{' and a DB writer process' if writer else ''}", flush=True)
+
+    # Poll our own workers only; the writer process is multiprocessing's child to reap
+    while children:
+        for pid, index in list(children.items()):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if not done:
+                continue
+            del children[pid]
+            if not stopping:
+                print(f"Worker {index} (pid {pid}) exited with status {status}, restarting", file=sys.stderr)
+                spawn(index)
+        time.sleep(0.2)
+
+    sock.close()
+    if writer is not None:
+        writer.shutdown()
+
+
+if __name__ == "__main__":
+    main()
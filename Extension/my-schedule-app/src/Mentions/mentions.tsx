@@ -27,13 +27,14 @@ const MentionsInput: React.FC<Props> = ({
   const [apiError, setApiError] = useState<string | null>(null);
   const inputRef = useRef<HTMLTextAreaElement>(null);
   const suggestionRefs = useRef<(HTMLDivElement | null)[]>([]);
+  const latestQuery = useRef('');
 
   useEffect(() => {
     const loadContacts = async () => {
       if (!userEmail) return;
       setIsLoading(true);
       try {
-        const res = await axios.post(apiUrl, { user_email: userEmail, query: '' });
+        const res = await axios.post(apiUrl, { user_email: userEmail, query: '', limit: 5 });
         if (res.data?.contacts) {
           setAllContacts(res.data.contacts);
         }
@@ -57,11 +58,13 @@ const MentionsInput: React.FC<Props> = ({
     if (lastAt >= 0) {
       const afterAt = textBeforeCursor.slice(lastAt + 1);
       if (afterAt.length === 0 || /\s/.test(afterAt)) {
+        latestQuery.current = '';
         setShowSuggestions(false);
       } else {
         showContactSuggestions(afterAt);
       }
     } else {
+      latestQuery.current = '';
       setShowSuggestions(false);
     }
   };
@@ -83,7 +86,8 @@ const MentionsInput: React.FC<Props> = ({
     }
   };
 
-  const showContactSuggestions = (query: string) => {
+  const showContactSuggestions = async (query: string) => {
+    latestQuery.current = query;
     if (!query) {
       setSuggestions(allContacts.slice(0, 5));
       setActiveSuggestionIndex(0);
@@ -91,9 +95,16 @@ const MentionsInput: React.FC<Props> = ({
       return;
     }
 
-    const matches = allContacts
-      .filter(c => c.email.toLowerCase().includes(query.toLowerCase()))
-      .slice(0, 10);
+    // The server does the prefix search and ranking, so only one page comes back
+    let matches: Mention[] = [];
+    try {
+      const res = await axios.post(apiUrl, { user_email: userEmail, query, limit: 10 });
+      matches = res.data?.contacts ?? [];
+    } catch (error) {
+      matches = allContacts.filter(c => c.email.toLowerCase().startsWith(query.toLowerCase()));
+    }
+    // A later keystroke already sent its own request
+    if (latestQuery.current !== query) return;
 
     const manualEntry = { email: query };
     setSuggestions(matches.length ? matches : [manualEntry]);
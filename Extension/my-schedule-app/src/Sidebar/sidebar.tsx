@@ -57,7 +57,7 @@ const Sidebar: React.FC = () => {
           const fetchResponse = await fetch('http://localhost:5001/parse', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text: JSON.stringify(response.text), user_timezone: JSON.stringify(userTimeZone) })
+            body: JSON.stringify({ text: JSON.stringify(response.text), user_timezone: JSON.stringify(userTimeZone), stream_mode: 'delta' })
           });
           
           if (!fetchResponse.ok) {